@@ -0,0 +1,229 @@
+"""
+Data-scale benchmark
+
+Run with `python -m benchmarks.data_scale [--scales 1000,10000,...]` against a local Postgres. Grows a population of
+synthetic characters (see `benchmarks.synthetic_characters`) in a separate `--database`, so the app's own data is left
+alone, and at each scale times `get_character`, hit point updates, listing a page of characters and a few searches
+through `CharacterRepo`. The EXPLAIN (ANALYZE, BUFFERS) plan of every statement each operation runs is captured at every
+scale, so plan changes (e.g. an index scan turning into a sequential scan) can be lined up against the latency they
+cause.
+
+The population only ever grows, so a later run with bigger scales reuses the rows already loaded. Pass `--reset` to
+start over. `--output PATH` writes the timings and plans as JSON.
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+import msgspec
+import psycopg
+from psycopg import AsyncConnection
+
+from benchmarks.http_load import percentile
+from benchmarks.synthetic_characters import load_characters
+from src.character.character_repo import CharacterRepo
+from src.character.models import CharacterHitpoints, CharacterSearch, DamageType
+from src.common import app_config
+from src.common.db import DatabaseConnInfo, get_conn_info
+from src.common.migrations import migrate
+from src.common.utils import dict_row_camel
+
+DEFAULT_SCALES = "1000,10000,100000,1000000,10000000"
+
+_SCAN = re.compile(r"((?:Seq|Index|Index Only|Bitmap Heap) Scan)(?: using \S+)? on (\S+)")
+
+
+class StatementPlan(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    statement: str
+    plan: str
+
+
+class OperationResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    samples: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    plans: list[StatementPlan]
+
+
+class ScaleResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    characters: int
+    rows_loaded: int
+    load_seconds: float
+    operations: dict[str, OperationResult]
+
+
+class ExplainingCursor:
+    """
+    Wraps a cursor to capture the EXPLAIN (ANALYZE, BUFFERS) plan of every statement before running it
+
+    EXPLAIN ANALYZE runs the statement, so it's explained in a savepoint that's rolled back. Writes (and their triggers
+    and notifications) only happen once, and the statement then runs without locks left over from its explain.
+    """
+
+    def __init__(self, cursor: psycopg.AsyncCursor[Any]) -> None:
+        self.cursor = cursor
+        self.plans: list[StatementPlan] = []
+
+    async def execute(self, query: Any, params: Any = None) -> psycopg.AsyncCursor[Any]:
+        conn = self.cursor.connection
+        async with conn.transaction(force_rollback=True), conn.cursor() as explain:
+            rows = await (await explain.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)).fetchall()
+        self.plans.append(StatementPlan(statement=" ".join(str(query).split()), plan="\n".join(row[0] for row in rows)))
+        return await self.cursor.execute(query, params)
+
+    async def executemany(self, query: Any, params_seq: Any) -> None:
+        await self.cursor.executemany(query, params_seq)
+
+
+Operation = Callable[[CharacterRepo, AsyncConnection, random.Random, int], Awaitable[None]]
+
+
+async def get_character(repo: CharacterRepo, conn: AsyncConnection, rng: random.Random, characters: int) -> None:
+    await repo.get_character(rng.randint(1, characters))
+
+
+async def update_hitpoints(repo: CharacterRepo, conn: AsyncConnection, rng: random.Random, characters: int) -> None:
+    hit_point_max = rng.randint(10, 200)
+    hitpoints = CharacterHitpoints(hit_point_max=hit_point_max, current_hit_points=rng.randint(0, hit_point_max))
+    await repo.update_hitpoints(rng.randint(1, characters), hitpoints)
+    await conn.commit()
+
+
+async def list_characters(repo: CharacterRepo, conn: AsyncConnection, rng: random.Random, characters: int) -> None:
+    await repo.list_characters(after_id=rng.randint(0, characters), limit=100)
+
+
+def search_characters(search: CharacterSearch) -> Operation:
+    async def search_page(repo: CharacterRepo, conn: AsyncConnection, rng: random.Random, characters: int) -> None:
+        await repo.search_character_ids(search, after_id=rng.randint(0, characters), limit=100)
+
+    return search_page
+
+
+OPERATIONS: dict[str, Operation] = {
+    "getCharacter": get_character,
+    "updateHitpoints": update_hitpoints,
+    "listCharacters": list_characters,
+    "searchImmuneToFire": search_characters(CharacterSearch(immune_to=[DamageType.FIRE])),
+    "searchItemAffects": search_characters(CharacterSearch(item_affects=["constitution"])),
+    "searchFighters5": search_characters(CharacterSearch(class_name="fighter", min_class_level=5)),
+    "searchCombined": search_characters(
+        CharacterSearch(resistant_to=[DamageType.COLD], item_affects=["strength"], min_level=3)
+    ),
+}
+
+
+async def measure(conn: AsyncConnection, characters: int, samples: int, seed: int) -> dict[str, OperationResult]:
+    results: dict[str, OperationResult] = {}
+    async with conn.cursor(row_factory=dict_row_camel) as cur:
+        for name, operation in OPERATIONS.items():
+            rng = random.Random(seed)
+
+            explaining = ExplainingCursor(cur)
+            await operation(CharacterRepo(explaining), conn, rng, characters)
+            await conn.rollback()
+
+            repo = CharacterRepo(cur)
+            latencies: list[float] = []
+            for _ in range(samples):
+                start = time.perf_counter()
+                await operation(repo, conn, rng, characters)
+                latencies.append(time.perf_counter() - start)
+            await conn.rollback()
+
+            latencies.sort()
+            results[name] = OperationResult(
+                samples=samples,
+                p50_ms=percentile(latencies, 0.5) * 1000,
+                p95_ms=percentile(latencies, 0.95) * 1000,
+                p99_ms=percentile(latencies, 0.99) * 1000,
+                plans=explaining.plans,
+            )
+    return results
+
+
+async def prepare_database(conn_info: DatabaseConnInfo, reset: bool) -> None:
+    async with await AsyncConnection.connect(get_conn_info().to_conn_str(), autocommit=True) as conn:
+        res = await conn.execute("SELECT 1 FROM pg_database WHERE datname = %s", (conn_info.database,))
+        if not await res.fetchone():
+            await conn.execute(f'CREATE DATABASE "{conn_info.database}"')
+
+    if reset:
+        async with await AsyncConnection.connect(conn_info.to_conn_str(), autocommit=True) as conn:
+            await conn.execute((app_config.MIGRATION_PATH / "teardown.sql").read_bytes())
+    await migrate(conn_info.to_conn_str(), app_config.MIGRATION_PATH)
+
+
+async def run(scales: list[int], samples: int, seed: int, database: str, reset: bool) -> list[ScaleResult]:
+    conn_info = msgspec.structs.replace(get_conn_info(), database=database)
+    await prepare_database(conn_info, reset)
+
+    results: list[ScaleResult] = []
+    async with await AsyncConnection.connect(conn_info.to_conn_str()) as conn:
+        res = await (await conn.execute("SELECT count(*) FROM operational.character")).fetchone()
+        loaded = res[0] if res else 0
+        for scale in scales:
+            start = time.perf_counter()
+            rows_loaded = 0
+            if scale > loaded:
+                print(f"Loading characters {loaded} to {scale}...", file=sys.stderr)
+                rows_loaded = await load_characters(conn, seed, loaded, scale)
+                await conn.execute("ANALYZE")
+                await conn.commit()
+                loaded = scale
+            load_seconds = time.perf_counter() - start
+
+            results.append(
+                ScaleResult(
+                    characters=scale,
+                    rows_loaded=rows_loaded,
+                    load_seconds=load_seconds,
+                    operations=await measure(conn, scale, samples, seed),
+                )
+            )
+    return results
+
+
+def plan_summary(plans: list[StatementPlan]) -> str:
+    """
+    The table scans across an operation's plans, e.g. `Index Scan character, Seq Scan character_stat`
+    """
+    scans = dict.fromkeys(f"{match[1]} {match[2]}" for plan in plans for match in _SCAN.finditer(plan.plan))
+    return ", ".join(scans)
+
+
+def main(args: argparse.Namespace) -> int:
+    scales = sorted(int(scale) for scale in args.scales.split(","))
+    results = asyncio.run(run(scales, args.samples, args.seed, args.database, args.reset))
+
+    print(f"{'characters':>10} {'operation':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  scans")
+    for result in results:
+        for name, op in result.operations.items():
+            print(
+                f"{result.characters:>10} {name:<16} {op.p50_ms:>8.2f} {op.p95_ms:>8.2f} {op.p99_ms:>8.2f}  "
+                f"{plan_summary(op.plans)}"
+            )
+
+    output: Optional[str] = args.output
+    if output:
+        Path(output).write_bytes(msgspec.json.format(msgspec.json.encode(results)))
+        print(f"Saved results and plans to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data-scale benchmark")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Comma separated character counts to measure at")
+    parser.add_argument("--samples", type=int, default=200, help="Timed calls per operation and scale")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic population")
+    parser.add_argument("--database", default="dnd_health_tracker_scale", help="Database to load characters into")
+    parser.add_argument("--reset", action="store_true", help="Drop previously loaded characters first")
+    parser.add_argument("--output", help="Write the timings and plans to this JSON file")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,236 @@
+"""
+End-to-end HTTP load benchmark
+
+Run with `python -m benchmarks.http_load` against a local database. Starts the app with uvicorn, seeds extra characters,
+then drives a mix of GET, damage, heal and temporary hit point requests from `--concurrency` concurrent clients for
+`--duration` seconds. Character ids are drawn from a Zipf distribution with exponent `--skew`, so `0` spreads traffic
+evenly and larger values concentrate it on a few hot characters (and their advisory locks).
+
+Reports requests per second and p50/p95/p99 latency per route. `--save-baseline PATH` stores the results as JSON and
+`--compare PATH` exits non-zero if any route's throughput dropped, or p99 latency grew, by more than `--tolerance`
+against a stored baseline. Baselines are machine specific, so record them on the machine that compares against them.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import msgspec
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.sharded_character_repo import ShardedCharacterRepo
+from src.common import app_config
+from src.common.db import get_shard_conn_infos, load_test_character
+from src.common.sharding import ShardRouter, load_shard_map
+
+ROUTES = {
+    "get": ("GET", "character/{id}", None),
+    "damage": ("PUT", "character/{id}/hit-points/damage", {"amount": 1, "damageType": "cold"}),
+    "heal": ("PUT", "character/{id}/hit-points/heal", {"amount": 1}),
+    "temporary": ("PUT", "character/{id}/hit-points/temporary", {"amount": 5}),
+}
+DEFAULT_MIX = "get=70,damage=10,heal=10,temporary=10"
+
+
+class RouteResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    requests: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+class LoadResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    concurrency: int
+    duration_seconds: float
+    characters: int
+    skew: float
+    mix: dict[str, int]
+    routes: dict[str, RouteResult]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {route: int(weight) for route, weight in (part.split("=") for part in mix.split(","))}
+    if unknown := set(weights) - set(ROUTES):
+        raise ValueError(f"Unknown routes in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def compare(result: LoadResult, baseline: LoadResult, tolerance: float) -> list[str]:
+    """
+    Describe every route whose throughput or p99 latency regressed by more than `tolerance` against `baseline`
+    """
+    regressions: list[str] = []
+    for route, base in baseline.routes.items():
+        current = result.routes.get(route)
+        if current is None:
+            continue
+        if current.rps < base.rps * (1 - tolerance):
+            regressions.append(f"{route}: {current.rps:.1f} rps is below baseline {base.rps:.1f} rps")
+        if current.p99_ms > base.p99_ms * (1 + tolerance):
+            regressions.append(f"{route}: p99 {current.p99_ms:.2f}ms is above baseline {base.p99_ms:.2f}ms")
+    return regressions
+
+
+async def seed_characters(count: int) -> None:
+    """
+    Insert copies of the test character until `count` characters exist
+    """
+    character = load_test_character()
+
+    async with AsyncExitStack() as stack:
+        pools = [
+            await stack.enter_async_context(AsyncConnectionPool(conn_info.to_conn_str()))
+            for conn_info in get_shard_conn_infos()
+        ]
+        async with pools[0].connection() as conn:
+            shard_map = await load_shard_map(conn, len(pools))
+        repo = ShardedCharacterRepo(ShardRouter(pools, shard_map))
+        existing = len(await repo.list_characters(limit=count))
+        for _ in range(count - existing):
+            await repo.insert_character(character)
+
+
+async def wait_until_healthy(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("App didn't become healthy")
+        await asyncio.sleep(0.1)
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    concurrency: int,
+    duration: float,
+    characters: int,
+    skew: float,
+    mix: dict[str, int],
+) -> dict[str, RouteResult]:
+    character_ids = range(1, characters + 1)
+    character_weights = list(itertools.accumulate(1 / (rank**skew) for rank in character_ids))
+    route_names = list(mix)
+    route_weights = list(itertools.accumulate(mix[route] for route in route_names))
+    latencies: dict[str, list[float]] = {route: [] for route in route_names}
+    errors: dict[str, int] = {route: 0 for route in route_names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            route = rng.choices(route_names, cum_weights=route_weights)[0]
+            character_id = rng.choices(character_ids, cum_weights=character_weights)[0]
+            method, path, body = ROUTES[route]
+            start = time.perf_counter()
+            response = await client.request(method, path.format(id=character_id), json=body)
+            latencies[route].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[route] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    results: dict[str, RouteResult] = {}
+    for route, route_latencies in latencies.items():
+        route_latencies.sort()
+        results[route] = RouteResult(
+            requests=len(route_latencies),
+            errors=errors[route],
+            rps=len(route_latencies) / elapsed,
+            p50_ms=percentile(route_latencies, 0.5) * 1000,
+            p95_ms=percentile(route_latencies, 0.95) * 1000,
+            p99_ms=percentile(route_latencies, 0.99) * 1000,
+        )
+    return results
+
+
+async def run(concurrency: int, duration: float, characters: int, skew: float, mix: dict[str, int], port: int):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ | {"APP_ENV": app_config.Environment.LOCAL_DEV.value},
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        base_url = f"http://127.0.0.1:{port}{app_config.API_BASE_URL}/"
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            await wait_until_healthy(client)
+            await seed_characters(characters)
+            # Warm up connections and caches before measuring
+            await drive(client, concurrency, min(duration, 2), characters, skew, mix)
+            routes = await drive(client, concurrency, duration, characters, skew, mix)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return LoadResult(
+        concurrency=concurrency,
+        duration_seconds=duration,
+        characters=characters,
+        skew=skew,
+        mix=mix,
+        routes=routes,
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    result = asyncio.run(
+        run(args.concurrency, args.duration, args.characters, args.skew, parse_mix(args.mix), args.port)
+    )
+
+    print(f"{'route':<10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in result.routes.items():
+        latencies = f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.p99_ms:>8.2f}"
+        print(f"{route:<10} {r.requests:>9} {r.errors:>7} {r.rps:>9.1f} {latencies}")
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_bytes(msgspec.json.format(msgspec.json.encode(result)))
+        print(f"Saved baseline to {args.save_baseline}")
+
+    baseline_path: Optional[str] = args.compare
+    if baseline_path:
+        baseline = msgspec.json.decode(Path(baseline_path).read_bytes(), type=LoadResult)
+        if regressions := compare(result, baseline, args.tolerance):
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {baseline_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end HTTP load benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to measure for")
+    parser.add_argument("--characters", type=int, default=100, help="Characters to spread traffic over")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent for character ids (0 is uniform)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. get=70,damage=10,heal=10,temporary=10")
+    parser.add_argument("--port", type=int, default=3100, help="Port to run the app on")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression, as a fraction")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""
+Benchmark the per-request cost of logging
+
+Run with `python -m benchmarks.logging_overhead [--records N]` against a local database. Measures how long a log call
+blocks the calling thread when the record is formatted and written in place, as a plain `StreamHandler` would, versus
+only being queued for the app's listener thread, and how many records a write request logs at INFO and at DEBUG.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import time
+
+from litestar.testing import TestClient
+
+from src.common.log_config import StructuredFormatter, _DeferredQueueHandler
+from src.main import app
+
+
+class RecordCounter(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def records_per_request(client: TestClient, level: int, requests: int = 100) -> float:
+    """
+    Count the records logged per damage request with every app logger set to `level`
+    """
+    loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict if name.startswith("src.")]
+    levels = [logger.level for logger in loggers]
+    counter = RecordCounter()
+    logging.root.addHandler(counter)
+    try:
+        for logger in loggers:
+            logger.setLevel(level)
+        for _ in range(requests):
+            client.put("character/1/hit-points/damage", json={"amount": 1, "damageType": "cold"})
+    finally:
+        logging.root.removeHandler(counter)
+        for logger, original_level in zip(loggers, levels):
+            logger.setLevel(original_level)
+    return counter.count / requests
+
+
+def seconds_per_record(handler: logging.Handler, records: int) -> float:
+    logger = logging.Logger("benchmark")
+    logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("Inserting character item for character id %s", i)
+    return (time.perf_counter() - start) / records
+
+
+def main(records: int):
+    with open(os.devnull, "w") as devnull:
+        in_place = logging.StreamHandler(devnull)
+        in_place.setFormatter(StructuredFormatter())
+        in_place_seconds = seconds_per_record(in_place, records)
+
+    # Nothing drains the queue while measuring, so this is only the calling thread's share of the work
+    queued_seconds = seconds_per_record(_DeferredQueueHandler(queue.SimpleQueue()), records)
+
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        per_request = {level: records_per_request(client, level) for level in (logging.INFO, logging.DEBUG)}
+
+    print(f"In place: {in_place_seconds * 1e6:.1f}us/record on the calling thread")
+    print(f"Queued:   {queued_seconds * 1e6:.1f}us/record on the calling thread")
+    for level, count in per_request.items():
+        print(
+            f"{logging.getLevelName(level)}: {count:.1f} records per damage request, "
+            f"{count * in_place_seconds * 1e6:.1f}us in place vs {count * queued_seconds * 1e6:.1f}us queued"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the per-request cost of logging")
+    parser.add_argument("--records", type=int, default=20000, help="Records to log per pipeline")
+    main(records=parser.parse_args().records)
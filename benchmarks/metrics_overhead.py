@@ -0,0 +1,63 @@
+"""
+Benchmark the overhead of recording metrics
+
+Run with `python -m benchmarks.metrics_overhead [--requests N] [--rounds N] [--max-overhead PERCENT]` against a local
+database. Rounds alternate between metrics on and off, in-process through Litestar's `TestClient`, so the
+comparison isn't skewed by drift over the run. Exits non-zero if metrics add more than `--max-overhead` percent to the
+mean request time.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from litestar.testing import TestClient
+
+from src.common import app_config
+from src.main import app
+
+REQUESTS = [
+    ("GET", "character/1", None),
+    ("PUT", "character/1/hit-points/heal", {"amount": 1}),
+    ("PUT", "character/1/hit-points/damage", {"amount": 1, "damageType": "cold"}),
+]
+
+
+def run_round(client: TestClient, requests: int) -> float:
+    """
+    Send `requests` requests, cycling through `REQUESTS`, and return the mean seconds per request
+    """
+    start = time.perf_counter()
+    for i in range(requests):
+        method, path, body = REQUESTS[i % len(REQUESTS)]
+        client.request(method, path, json=body).raise_for_status()
+    return (time.perf_counter() - start) / requests
+
+
+def main(requests: int, rounds: int, max_overhead: float) -> int:
+    timings: dict[bool, list[float]] = {True: [], False: []}
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        # Warm up connections, prepared statements and metric label children
+        run_round(client, requests)
+        for i in range(rounds):
+            # Alternate which goes first, so neither always runs on a warmer process
+            for enabled in (True, False) if i % 2 else (False, True):
+                app_config.METRICS_ENABLED = enabled
+                timings[enabled].append(run_round(client, requests))
+
+    enabled, disabled = statistics.median(timings[True]), statistics.median(timings[False])
+    overhead = (enabled - disabled) / disabled * 100
+    print(f"Metrics off: {disabled * 1000:.3f}ms/request")
+    print(f"Metrics on:  {enabled * 1000:.3f}ms/request")
+    print(f"Overhead:    {overhead:+.2f}% (max {max_overhead}%)")
+    return 0 if overhead <= max_overhead else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of recording metrics")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per round")
+    parser.add_argument("--rounds", type=int, default=10, help="Rounds with metrics on and off")
+    parser.add_argument("--max-overhead", type=float, default=3.0, help="Maximum overhead, in percent")
+    args = parser.parse_args()
+    sys.exit(main(requests=args.requests, rounds=args.rounds, max_overhead=args.max_overhead))
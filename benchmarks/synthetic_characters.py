@@ -0,0 +1,254 @@
+"""
+Deterministic synthetic characters for benchmarking at scale
+
+`generate_character(seed, index)` always builds the same character for the same seed and index, so any slice of a
+synthetic population can be regenerated without generating everything before it. Characters get realistic shapes:
+levels skewed towards early play, occasional multiclassing, rolled stats, a few stat-boosting items and defenses.
+
+`load_characters` bulk loads them with binary `COPY` rather than going through `CharacterRepo.insert_character`, which
+takes a round trip per row.
+"""
+
+import random
+from typing import Iterator
+
+from psycopg import AsyncConnection
+
+from src.character.character_documents import rebuild_documents
+from src.character.models import (
+    Character,
+    CharacterClass,
+    CharacterHitpoints,
+    CharacterStats,
+    DamageType,
+    Defense,
+    DefenseType,
+    Item,
+    ItemModifier,
+)
+
+CLASS_HIT_DICE = {
+    "barbarian": 12,
+    "fighter": 10,
+    "paladin": 10,
+    "ranger": 10,
+    "bard": 8,
+    "cleric": 8,
+    "druid": 8,
+    "monk": 8,
+    "rogue": 8,
+    "warlock": 8,
+    "sorcerer": 6,
+    "wizard": 6,
+}
+STATS = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+ITEM_NAMES = {
+    "strength": ("Belt of Giant Strength", "Gauntlets of Ogre Power"),
+    "dexterity": ("Gloves of Thievery", "Boots of Elvenkind"),
+    "constitution": ("Ioun Stone of Fortitude", "Amulet of Health"),
+    "intelligence": ("Headband of Intellect", "Ioun Stone of Intellect"),
+    "wisdom": ("Periapt of Wisdom", "Ioun Stone of Insight"),
+    "charisma": ("Cloak of Charisma", "Ioun Stone of Leadership"),
+}
+NAME_PREFIXES = ("Bri", "Tor", "Ela", "Mor", "Kas", "Vin", "Zan", "Lor", "Thi", "Gar", "Yse", "Dru")
+NAME_SUFFIXES = ("v", "dric", "wen", "gan", "sia", "rith", "ador", "mir", "ka", "ston", "lyn", "bek")
+
+# How many of each row a character has, on average, is roughly: 1.2 classes, 6 stats, 1.5 items and 0.6 defenses
+_CLASS_COUNT_WEIGHTS = (85, 12, 3)
+_MEAN_LEVEL = 5.0
+
+
+def _roll_stat(rng: random.Random) -> int:
+    # 4d6, dropping the lowest
+    return sum(sorted(rng.randint(1, 6) for _ in range(4))[1:])
+
+
+def _split_levels(rng: random.Random, level: int, class_count: int) -> list[int]:
+    cuts = sorted(rng.sample(range(1, level), class_count - 1))
+    return [b - a for a, b in zip([0, *cuts], [*cuts, level])]
+
+
+def generate_character(seed: int, index: int) -> Character:
+    """
+    Build the synthetic character at `index` of the population for `seed`
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+
+    level = min(20, 1 + int(rng.expovariate(1 / _MEAN_LEVEL)))
+    class_count = min(level, rng.choices((1, 2, 3), _CLASS_COUNT_WEIGHTS)[0])
+    class_names = rng.sample(list(CLASS_HIT_DICE), class_count)
+    classes = [
+        CharacterClass(name=name, hit_dice_value=CLASS_HIT_DICE[name], class_level=class_level)
+        for name, class_level in zip(class_names, _split_levels(rng, level, class_count))
+    ]
+
+    stats = CharacterStats(**{stat: _roll_stat(rng) for stat in STATS})
+    constitution_modifier = (stats.constitution - 10) // 2
+    # Max hit dice at first level, then the fixed average for every level after
+    hit_point_max = classes[0].hit_dice_value + constitution_modifier
+    for character_class in classes:
+        levels = character_class.class_level - (1 if character_class is classes[0] else 0)
+        hit_point_max += levels * (character_class.hit_dice_value // 2 + 1 + constitution_modifier)
+    hit_point_max = max(level, hit_point_max)
+
+    items = []
+    for _ in range(min(8, int(rng.expovariate(1 / 1.5)))):
+        stat = rng.choice(STATS)
+        items.append(
+            Item(
+                name=rng.choice(ITEM_NAMES[stat]),
+                modifier=ItemModifier(affected_object="stats", affected_value=stat, value=rng.choice((1, 1, 2))),
+            )
+        )
+
+    defenses = [
+        Defense(
+            damage_type=damage_type,
+            defense_type=DefenseType.IMMUNITY if rng.random() < 0.2 else DefenseType.RESISTANCE,
+        )
+        for damage_type in rng.sample(list(DamageType), min(3, int(rng.expovariate(1 / 0.6))))
+    ]
+
+    return Character(
+        name=rng.choice(NAME_PREFIXES) + rng.choice(NAME_SUFFIXES),
+        level=level,
+        hit_points=CharacterHitpoints(
+            hit_point_max=hit_point_max,
+            current_hit_points=hit_point_max if rng.random() < 0.7 else rng.randint(0, hit_point_max),
+            temporary_hit_points=rng.randint(1, 10) if rng.random() < 0.1 else None,
+        ),
+        classes=classes,
+        stats=stats,
+        items=items,
+        defenses=defenses,
+    )
+
+
+def generate_characters(seed: int, start: int, stop: int) -> Iterator[Character]:
+    for index in range(start, stop):
+        yield generate_character(seed, index)
+
+
+# Columns and binary COPY types for each table, in load order
+_COLUMNS = {
+    "character": (
+        "id, name, level, resistance_mask, immunity_mask",
+        ("int4", "text", "int4", "int2", "int2"),
+    ),
+    "character_hitpoints": (
+        "id, character_id, hit_point_max, current_hit_points, temporary_hit_points",
+        ("int4", "int4", "int4", "int4", "int4"),
+    ),
+    "character_class": (
+        "id, character_id, class_name, hit_dice_value, class_level",
+        ("int4", "int4", "text", "int4", "int4"),
+    ),
+    "character_stat": ("id, character_id, stat, value", ("int4", "int4", "text", "int4")),
+    "character_item": ("id, character_id, name", ("int4", "int4", "text")),
+    "character_item_modifier": (
+        "id, character_id, character_item_id, affected_object, affected_value, value",
+        ("int4", "int4", "int4", "text", "text", "int4"),
+    ),
+    "character_defense": ("id, character_id, damage_type, defense_type", ("int4", "int4", "text", "text")),
+}
+
+
+async def load_characters(conn: AsyncConnection, seed: int, start: int, stop: int, batch_size: int = 10_000) -> int:
+    """
+    Bulk load characters `start` to `stop` of the population for `seed`, giving them the ids after the largest existing
+    ones, and return how many rows were written across all tables
+
+    Foreign key checks and triggers are skipped while loading (which needs a superuser), since every row references a
+    row written by the same load. The loaded characters' documents are rebuilt afterwards.
+    """
+    next_ids: dict[str, int] = {}
+    for table in _COLUMNS:
+        res = await (await conn.execute(f"SELECT coalesce(max(id), 0) + 1 FROM operational.{table}")).fetchone()
+        next_ids[table] = res[0] if res else 1
+
+    first_character_id = next_ids["character"]
+    await conn.execute("SET session_replication_role = replica")
+    rows_written = 0
+    for batch_start in range(start, stop, batch_size):
+        batch_stop = min(stop, batch_start + batch_size)
+        rows: dict[str, list[tuple[object, ...]]] = {table: [] for table in _COLUMNS}
+        for character in generate_characters(seed, batch_start, batch_stop):
+            character_id = _next_id(next_ids, "character")
+            masks = character.defense_masks
+            rows["character"].append((character_id, character.name, character.level, masks.resistance, masks.immunity))
+            hit_points = character.hit_points
+            rows["character_hitpoints"].append(
+                (
+                    _next_id(next_ids, "character_hitpoints"),
+                    character_id,
+                    hit_points.hit_point_max,
+                    hit_points.current_hit_points,
+                    hit_points.temporary_hit_points,
+                )
+            )
+            for c in character.classes:
+                rows["character_class"].append(
+                    (_next_id(next_ids, "character_class"), character_id, c.name, c.hit_dice_value, c.class_level)
+                )
+            for stat in STATS:
+                rows["character_stat"].append(
+                    (_next_id(next_ids, "character_stat"), character_id, stat, getattr(character.stats, stat))
+                )
+            for item in character.items:
+                item_id = _next_id(next_ids, "character_item")
+                rows["character_item"].append((item_id, character_id, item.name))
+                modifier = item.modifier
+                rows["character_item_modifier"].append(
+                    (
+                        _next_id(next_ids, "character_item_modifier"),
+                        character_id,
+                        item_id,
+                        modifier.affected_object,
+                        modifier.affected_value,
+                        modifier.value,
+                    )
+                )
+            for defense in character.defenses:
+                rows["character_defense"].append(
+                    (
+                        _next_id(next_ids, "character_defense"),
+                        character_id,
+                        defense.damage_type.value,
+                        defense.defense_type.value,
+                    )
+                )
+
+        for table, table_rows in rows.items():
+            rows_written += await _copy(conn, table, table_rows)
+        await conn.commit()
+
+    await conn.execute("SET session_replication_role = DEFAULT")
+    # The load bypassed the triggers that maintain the character documents
+    await rebuild_documents(conn, list(range(first_character_id, next_ids["character"])))
+    # Move the sequences past the explicit ids, so later inserts don't collide with them
+    for table in _COLUMNS:
+        await conn.execute(
+            f"""
+            SELECT setval(pg_get_serial_sequence('operational.{table}', 'id'), max(id))
+            FROM operational.{table}
+            HAVING max(id) IS NOT NULL
+            """
+        )
+    await conn.commit()
+    return rows_written
+
+
+def _next_id(next_ids: dict[str, int], table: str) -> int:
+    next_id = next_ids[table]
+    next_ids[table] = next_id + 1
+    return next_id
+
+
+async def _copy(conn: AsyncConnection, table: str, rows: list[tuple[object, ...]]) -> int:
+    columns, types = _COLUMNS[table]
+    async with conn.cursor() as cur:
+        async with cur.copy(f"COPY operational.{table} ({columns}) FROM STDIN (FORMAT BINARY)") as copy:
+            copy.set_types(list(types))
+            for row in rows:
+                await copy.write_row(row)
+    return len(rows)
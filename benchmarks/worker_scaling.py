@@ -0,0 +1,100 @@
+"""
+Benchmark how throughput scales with worker processes
+
+Run with `python -m benchmarks.worker_scaling [--workers 1,2,4]` against a local database. For each worker count, starts
+the app with `python -m src.serve --workers N` and drives the `benchmarks.http_load` route mix at it from `--clients`
+load generator processes, then reports total requests per second and the speedup over the smallest worker count.
+
+Load generators need CPU too, so the speedup is only meaningful on a machine with cores to spare beyond the largest
+worker count. The app runs with `APP_ENV=int`, so it keeps its data between runs instead of inserting and tearing down
+test data in every worker.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from benchmarks.http_load import DEFAULT_MIX, drive, parse_mix, seed_characters, wait_until_healthy
+from src.common import app_config
+from src.serve import available_cpus
+
+
+def _base_url(port: int) -> str:
+    return f"http://127.0.0.1:{port}{app_config.API_BASE_URL}/"
+
+
+async def _client(port: int, concurrency: int, duration: float, characters: int, mix: dict[str, int]) -> float:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=_base_url(port), limits=limits, timeout=30) as client:
+        # Warm up connections before measuring
+        await drive(client, concurrency, min(duration, 2), characters, 1.0, mix)
+        routes = await drive(client, concurrency, duration, characters, 1.0, mix)
+    return sum(route.rps for route in routes.values())
+
+
+def run_client(port: int, concurrency: int, duration: float, characters: int, mix: dict[str, int]) -> float:
+    return asyncio.run(_client(port, concurrency, duration, characters, mix))
+
+
+async def _wait_and_seed(port: int, characters: int) -> None:
+    async with httpx.AsyncClient(base_url=_base_url(port)) as client:
+        await wait_until_healthy(client)
+    await seed_characters(characters)
+
+
+def measure(
+    workers: int, clients: int, concurrency: int, duration: float, characters: int, mix: dict[str, int], port: int
+):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "src.serve", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=os.environ | {"APP_ENV": app_config.Environment.INT.value},
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(_wait_and_seed(port, characters))
+        with ProcessPoolExecutor(clients) as pool:
+            futures = [pool.submit(run_client, port, concurrency, duration, characters, mix) for _ in range(clients)]
+            return sum(future.result() for future in futures)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args: argparse.Namespace) -> int:
+    mix = parse_mix(args.mix)
+    worker_counts = sorted(int(workers) for workers in args.workers.split(","))
+    results = {
+        workers: measure(workers, args.clients, args.concurrency, args.duration, args.characters, mix, args.port)
+        for workers in worker_counts
+    }
+
+    baseline_workers = worker_counts[0]
+    baseline = results[baseline_workers]
+    print(f"{'workers':>7} {'rps':>9} {'speedup':>8} {'efficiency':>11}")
+    for workers, rps in results.items():
+        speedup = rps / baseline
+        efficiency = speedup / (workers / baseline_workers)
+        print(f"{workers:>7} {rps:>9.1f} {speedup:>7.2f}x {efficiency:>10.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    cpus = available_cpus()
+    parser = argparse.ArgumentParser(description="Benchmark how throughput scales with worker processes")
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(n) for n in sorted({1, max(1, cpus // 2), cpus})),
+        help="Comma separated worker counts to measure (default: 1, half and all of the CPUs)",
+    )
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests per load generator")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to measure each worker count for")
+    parser.add_argument("--characters", type=int, default=100, help="Characters to spread traffic over")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. get=70,damage=10,heal=10,temporary=10")
+    parser.add_argument("--port", type=int, default=3100, help="Port to run the app on")
+    sys.exit(main(parser.parse_args()))
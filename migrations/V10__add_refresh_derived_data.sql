@@ -0,0 +1,17 @@
+-- Bring the data triggers derive from other tables up to date on this shard, after loading rows with triggers off (e.g.
+-- restoring a snapshot of some characters, which keeps every party rollup but only some of their members). Migrations
+-- adding more trigger-maintained data should refresh it here too.
+CREATE OR REPLACE FUNCTION operational.refresh_derived_data() RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- In party id order, the order the triggers lock rollups in
+    PERFORM operational.refresh_party_rollup(party_id)
+    FROM (
+        SELECT party_id FROM operational.character WHERE party_id IS NOT NULL
+        UNION
+        SELECT party_id FROM operational.party_rollup
+    ) parties
+    ORDER BY party_id;
+END
+$$;
@@ -0,0 +1,178 @@
+-- Rebuild each changed character's document once per transaction, when it commits, instead of once per row written by
+-- the V4 triggers. Inserting a character writes a dozen child rows, one statement each, and deleting or moving one
+-- deletes them table by table, so refreshing as they were written rebuilt the document many times over, partly written
+-- or partly deleted. Now statement level triggers queue the characters a statement changed, and a deferred trigger
+-- refreshes each queued character's document at commit from its final rows. Updating hit points still patches the
+-- document straight away.
+CREATE TABLE IF NOT EXISTS operational.character_document_pending (
+    character_id INT PRIMARY KEY
+);
+
+-- Refresh the queued character's document at commit, and take it off the queue
+CREATE OR REPLACE FUNCTION operational.character_document_on_pending() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM operational.refresh_character_document(NEW.character_id);
+    DELETE FROM operational.character_document_pending WHERE character_id = NEW.character_id;
+    RETURN NULL;
+END
+$$;
+
+-- Only characters that aren't queued yet insert a row, so each is refreshed once however many statements change it
+CREATE CONSTRAINT TRIGGER character_document_pending_refresh
+AFTER INSERT ON operational.character_document_pending
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_pending();
+
+-- Queue the characters of the rows a statement on a child table changed
+CREATE OR REPLACE FUNCTION operational.character_document_queue_children() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    EXECUTE format(
+        $query$
+        INSERT INTO operational.character_document_pending (character_id)
+        SELECT DISTINCT character_id FROM (%s) changed
+        WHERE character_id IS NOT NULL
+        ORDER BY character_id
+        ON CONFLICT (character_id) DO NOTHING
+        $query$,
+        CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT character_id FROM new_rows'
+            WHEN 'DELETE' THEN 'SELECT character_id FROM old_rows'
+            ELSE 'SELECT character_id FROM new_rows UNION ALL SELECT character_id FROM old_rows'
+        END
+    );
+    RETURN NULL;
+END
+$$;
+
+-- Queue characters that were inserted or renamed or levelled. Other changes (e.g. their party) aren't in the document.
+CREATE OR REPLACE FUNCTION operational.character_document_queue_characters() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO operational.character_document_pending (character_id)
+        SELECT id FROM new_rows ORDER BY id
+        ON CONFLICT (character_id) DO NOTHING;
+    ELSE
+        INSERT INTO operational.character_document_pending (character_id)
+        SELECT n.id
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE (n.name, n.level) IS DISTINCT FROM (o.name, o.level)
+        ORDER BY n.id
+        ON CONFLICT (character_id) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS character_document_character ON operational.character;
+DROP TRIGGER IF EXISTS character_document_hit_points ON operational.character_hitpoints;
+DROP TRIGGER IF EXISTS character_document_class ON operational.character_class;
+DROP TRIGGER IF EXISTS character_document_stat ON operational.character_stat;
+DROP TRIGGER IF EXISTS character_document_item ON operational.character_item;
+DROP TRIGGER IF EXISTS character_document_item_modifier ON operational.character_item_modifier;
+DROP TRIGGER IF EXISTS character_document_defense ON operational.character_defense;
+
+-- Transition tables rule out `UPDATE OF` column lists and triggers for more than one operation, hence one trigger per
+-- operation
+CREATE OR REPLACE TRIGGER character_document_character_insert
+AFTER INSERT ON operational.character
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_characters();
+
+CREATE OR REPLACE TRIGGER character_document_character_update
+AFTER UPDATE ON operational.character
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_characters();
+
+-- Hit points keep their row level trigger for updates, which patches the document in place
+CREATE OR REPLACE TRIGGER character_document_hit_points_insert
+AFTER INSERT ON operational.character_hitpoints
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_hit_points_delete
+AFTER DELETE ON operational.character_hitpoints
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_class_insert
+AFTER INSERT ON operational.character_class
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_class_update
+AFTER UPDATE ON operational.character_class
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_class_delete
+AFTER DELETE ON operational.character_class
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_stat_insert
+AFTER INSERT ON operational.character_stat
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_stat_update
+AFTER UPDATE ON operational.character_stat
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_stat_delete
+AFTER DELETE ON operational.character_stat
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_item_insert
+AFTER INSERT ON operational.character_item
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_item_update
+AFTER UPDATE ON operational.character_item
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_item_delete
+AFTER DELETE ON operational.character_item
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+-- Modifiers carry their item's character id since V6
+CREATE OR REPLACE TRIGGER character_document_item_modifier_insert
+AFTER INSERT ON operational.character_item_modifier
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_item_modifier_update
+AFTER UPDATE ON operational.character_item_modifier
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_item_modifier_delete
+AFTER DELETE ON operational.character_item_modifier
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_defense_insert
+AFTER INSERT ON operational.character_defense
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_defense_update
+AFTER UPDATE ON operational.character_defense
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
+
+CREATE OR REPLACE TRIGGER character_document_defense_delete
+AFTER DELETE ON operational.character_defense
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.character_document_queue_children();
@@ -48,4 +48,10 @@ CREATE TABLE IF NOT EXISTS operational.character_defense (
     character_id INT REFERENCES operational.character(id),
     damage_type TEXT NOT NULL,
     defense_type TEXT NOT NULL
-);
\ No newline at end of file
+);
+
+-- Bucket to shard assignments. Only meaningful on the directory shard (shard 0).
+CREATE TABLE IF NOT EXISTS operational.shard_map (
+    bucket INT PRIMARY KEY,
+    shard INT NOT NULL
+);
@@ -0,0 +1,32 @@
+-- Bit of each damage type in the defense masks, matching the order of `DamageType`. Only ever append to the array.
+CREATE OR REPLACE FUNCTION operational.damage_type_bit(damage_type TEXT) RETURNS SMALLINT
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+    SELECT (1 << (array_position(
+        ARRAY[
+            'bludgeoning', 'piercing', 'slashing', 'fire', 'cold', 'acid', 'thunder',
+            'lightning', 'poison', 'radiant', 'necrotic', 'psychic', 'force'
+        ],
+        lower(damage_type)
+    ) - 1))::SMALLINT
+$$;
+
+-- A character's defenses as bitmasks, so checking a defense is a bit test, e.g.
+-- `immunity_mask & operational.damage_type_bit('fire') <> 0`. `character_defense` stays the record of each defense.
+ALTER TABLE operational.character
+    ADD COLUMN IF NOT EXISTS resistance_mask SMALLINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS immunity_mask SMALLINT NOT NULL DEFAULT 0;
+
+UPDATE operational.character c
+SET resistance_mask = masks.resistance_mask,
+    immunity_mask = masks.immunity_mask
+FROM (
+    SELECT character_id,
+        coalesce(bit_or(operational.damage_type_bit(damage_type)) FILTER (WHERE defense_type = 'resistance'), 0)
+            AS resistance_mask,
+        coalesce(bit_or(operational.damage_type_bit(damage_type)) FILTER (WHERE defense_type = 'immunity'), 0)
+            AS immunity_mask
+    FROM operational.character_defense
+    GROUP BY character_id
+) masks
+WHERE c.id = masks.character_id;
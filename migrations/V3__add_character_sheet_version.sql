@@ -0,0 +1,64 @@
+-- Version of everything a character's effective stats are derived from (level, classes, stats and items), so derived
+-- values can be cached until it changes. Hit point updates don't touch it.
+ALTER TABLE operational.character ADD COLUMN IF NOT EXISTS sheet_version INT NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION operational.bump_sheet_version() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE operational.character SET sheet_version = sheet_version + 1 WHERE id = OLD.character_id;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.character_id IS DISTINCT FROM OLD.character_id) THEN
+        UPDATE operational.character SET sheet_version = sheet_version + 1 WHERE id = NEW.character_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION operational.bump_item_sheet_version() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE operational.character c
+    SET sheet_version = c.sheet_version + 1
+    FROM operational.character_item ci
+    WHERE c.id = ci.character_id
+        AND ci.id IN (
+            CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE OLD.character_item_id END,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.character_item_id END
+        );
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION operational.bump_level_sheet_version() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.level IS DISTINCT FROM OLD.level THEN
+        NEW.sheet_version := OLD.sheet_version + 1;
+    END IF;
+    RETURN NEW;
+END
+$$;
+
+CREATE OR REPLACE TRIGGER character_class_sheet_version
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_class
+FOR EACH ROW EXECUTE FUNCTION operational.bump_sheet_version();
+
+CREATE OR REPLACE TRIGGER character_stat_sheet_version
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_stat
+FOR EACH ROW EXECUTE FUNCTION operational.bump_sheet_version();
+
+CREATE OR REPLACE TRIGGER character_item_sheet_version
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_item
+FOR EACH ROW EXECUTE FUNCTION operational.bump_sheet_version();
+
+CREATE OR REPLACE TRIGGER character_item_modifier_sheet_version
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_item_modifier
+FOR EACH ROW EXECUTE FUNCTION operational.bump_item_sheet_version();
+
+CREATE OR REPLACE TRIGGER character_level_sheet_version
+BEFORE UPDATE OF level ON operational.character
+FOR EACH ROW EXECUTE FUNCTION operational.bump_level_sheet_version();
@@ -0,0 +1,185 @@
+-- Read model holding each character as the JSON document `GET /character/{id}` returns, kept up to date by the triggers
+-- below so that a read is a single primary key lookup. The normalized tables stay the source of truth, and
+-- `python -m src.character.character_documents` checks for and repairs drift.
+CREATE TABLE IF NOT EXISTS operational.character_document (
+    character_id INT PRIMARY KEY REFERENCES operational.character(id) ON DELETE CASCADE,
+    document JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- The document for a character, or NULL while it's missing its hit points or stats
+CREATE OR REPLACE FUNCTION operational.build_character_document(target_id INT) RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'name', c.name,
+        'level', c.level,
+        'hitPoints', jsonb_build_object(
+            'hitPointMax', ch.hit_point_max,
+            'currentHitPoints', ch.current_hit_points,
+            'temporaryHitPoints', ch.temporary_hit_points
+        ),
+        'classes', coalesce(
+            (
+                SELECT jsonb_agg(
+                    jsonb_build_object('name', class_name, 'hitDiceValue', hit_dice_value, 'classLevel', class_level)
+                    ORDER BY id
+                )
+                FROM operational.character_class
+                WHERE character_id = c.id
+            ),
+            '[]'
+        ),
+        'stats', (SELECT jsonb_object_agg(stat, value) FROM operational.character_stat WHERE character_id = c.id),
+        'items', coalesce(
+            (
+                SELECT jsonb_agg(
+                    jsonb_build_object(
+                        'name', ci.name,
+                        'modifier', jsonb_build_object(
+                            'affectedObject', cim.affected_object,
+                            'affectedValue', cim.affected_value,
+                            'value', cim.value
+                        )
+                    )
+                    ORDER BY cim.id
+                )
+                FROM operational.character_item ci
+                JOIN operational.character_item_modifier cim ON ci.id = cim.character_item_id
+                WHERE ci.character_id = c.id
+            ),
+            '[]'
+        ),
+        'defenses', coalesce(
+            (
+                SELECT jsonb_agg(jsonb_build_object('type', damage_type, 'defense', defense_type) ORDER BY id)
+                FROM operational.character_defense
+                WHERE character_id = c.id
+            ),
+            '[]'
+        )
+    )
+    FROM operational.character c
+    JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+    WHERE c.id = target_id
+        AND EXISTS (SELECT 1 FROM operational.character_stat WHERE character_id = c.id)
+$$;
+
+CREATE OR REPLACE FUNCTION operational.refresh_character_document(target_id INT) RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_document JSONB := operational.build_character_document(target_id);
+BEGIN
+    IF new_document IS NULL THEN
+        DELETE FROM operational.character_document WHERE character_id = target_id;
+    ELSE
+        INSERT INTO operational.character_document (character_id, document)
+        VALUES (target_id, new_document)
+        ON CONFLICT (character_id) DO UPDATE SET document = EXCLUDED.document, updated_at = now();
+    END IF;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION operational.character_document_on_character() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM operational.refresh_character_document(NEW.id);
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION operational.character_document_on_child() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM operational.refresh_character_document(OLD.character_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.character_id IS DISTINCT FROM OLD.character_id) THEN
+        PERFORM operational.refresh_character_document(NEW.character_id);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION operational.character_document_on_item_modifier() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM operational.refresh_character_document(ci.character_id)
+    FROM operational.character_item ci
+    WHERE ci.id IN (
+        CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE OLD.character_item_id END,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.character_item_id END
+    );
+    RETURN NULL;
+END
+$$;
+
+-- Hit points are the only part of a character that changes often, so updating them patches the document in place
+CREATE OR REPLACE FUNCTION operational.character_document_on_hit_points_update() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.character_id IS DISTINCT FROM OLD.character_id THEN
+        PERFORM operational.refresh_character_document(OLD.character_id);
+        PERFORM operational.refresh_character_document(NEW.character_id);
+        RETURN NULL;
+    END IF;
+
+    UPDATE operational.character_document
+    SET document = jsonb_set(
+            document,
+            '{hitPoints}',
+            jsonb_build_object(
+                'hitPointMax', NEW.hit_point_max,
+                'currentHitPoints', NEW.current_hit_points,
+                'temporaryHitPoints', NEW.temporary_hit_points
+            )
+        ),
+        updated_at = now()
+    WHERE character_id = NEW.character_id;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE TRIGGER character_document_character
+AFTER INSERT OR UPDATE OF name, level ON operational.character
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_character();
+
+CREATE OR REPLACE TRIGGER character_document_hit_points
+AFTER INSERT OR DELETE ON operational.character_hitpoints
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_child();
+
+CREATE OR REPLACE TRIGGER character_document_hit_points_update
+AFTER UPDATE ON operational.character_hitpoints
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_hit_points_update();
+
+CREATE OR REPLACE TRIGGER character_document_class
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_class
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_child();
+
+CREATE OR REPLACE TRIGGER character_document_stat
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_stat
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_child();
+
+CREATE OR REPLACE TRIGGER character_document_item
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_item
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_child();
+
+CREATE OR REPLACE TRIGGER character_document_item_modifier
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_item_modifier
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_item_modifier();
+
+CREATE OR REPLACE TRIGGER character_document_defense
+AFTER INSERT OR UPDATE OR DELETE ON operational.character_defense
+FOR EACH ROW EXECUTE FUNCTION operational.character_document_on_child();
+
+-- Documents for the characters that already exist
+INSERT INTO operational.character_document (character_id, document)
+SELECT character_id, document
+FROM (SELECT id AS character_id, operational.build_character_document(id) AS document FROM operational.character) d
+WHERE document IS NOT NULL
+ON CONFLICT (character_id) DO NOTHING;
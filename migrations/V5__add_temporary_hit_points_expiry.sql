@@ -0,0 +1,8 @@
+-- When a character's temporary hit points run out, if they were assigned with a duration. Expired temporary hit
+-- points are cleared by the app's in-process scheduler, which reloads pending expiries from here on startup.
+ALTER TABLE operational.character_hitpoints
+    ADD COLUMN IF NOT EXISTS temporary_hit_points_expire_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS character_hitpoints_temporary_hit_points_expire_at_idx
+    ON operational.character_hitpoints (temporary_hit_points_expire_at)
+    WHERE temporary_hit_points_expire_at IS NOT NULL;
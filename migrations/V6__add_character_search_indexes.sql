@@ -0,0 +1,25 @@
+-- Item modifiers carry their character's id, so searching by what items affect doesn't need to go through
+-- `character_item` and can walk the matching characters in id order
+ALTER TABLE operational.character_item_modifier
+    ADD COLUMN IF NOT EXISTS character_id INT REFERENCES operational.character(id);
+
+UPDATE operational.character_item_modifier cim
+SET character_id = ci.character_id
+FROM operational.character_item ci
+WHERE ci.id = cim.character_item_id AND cim.character_id IS NULL;
+
+-- One index per search filter, each with `character_id` last so the characters matching a filter are read in id order
+-- from where the previous page stopped. `CharacterRepo.search_character_ids` merges them with the character's primary
+-- key, so a page costs roughly its size in index entries however many characters there are.
+CREATE INDEX IF NOT EXISTS character_defense_search_idx
+    ON operational.character_defense (damage_type, defense_type, character_id);
+
+CREATE INDEX IF NOT EXISTS character_item_modifier_search_idx
+    ON operational.character_item_modifier (affected_value, character_id);
+
+CREATE INDEX IF NOT EXISTS character_class_search_idx
+    ON operational.character_class (lower(class_name), character_id) INCLUDE (class_level);
+
+-- Pages of character summaries join each character to its hit points
+CREATE INDEX IF NOT EXISTS character_hitpoints_character_id_idx
+    ON operational.character_hitpoints (character_id);
@@ -0,0 +1,22 @@
+-- Background jobs, queued by the API and run by job workers with `SELECT ... FOR UPDATE SKIP LOCKED`. Jobs are only
+-- stored on shard 0. `attempts` counts the times a job was claimed, so a worker whose job was reclaimed after its
+-- heartbeat went stale can tell its writes apart from the new run's.
+CREATE TABLE IF NOT EXISTS operational.job (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress_done BIGINT NOT NULL DEFAULT 0,
+    progress_total BIGINT,
+    result JSONB,
+    error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT false,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- Workers only ever look for queued and running jobs, which stay few however many have finished
+CREATE INDEX IF NOT EXISTS job_unfinished_idx ON operational.job (id) WHERE status IN ('queued', 'running');
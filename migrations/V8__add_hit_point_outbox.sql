@@ -0,0 +1,35 @@
+-- Transactional outbox of hit point changes. Every committed change to a character's hit points, however it was made,
+-- leaves a row here in the same transaction. The hit point log relay (`src.character.hit_point_log`) moves the rows to
+-- the append-only hit point log, deleting them as it goes.
+CREATE TABLE IF NOT EXISTS operational.hit_point_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    character_id INT NOT NULL,
+    hit_point_max INT NOT NULL,
+    current_hit_points INT NOT NULL,
+    temporary_hit_points INT,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION operational.hit_point_outbox_on_change() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO operational.hit_point_outbox (character_id, hit_point_max, current_hit_points, temporary_hit_points)
+    VALUES (NEW.character_id, NEW.hit_point_max, NEW.current_hit_points, NEW.temporary_hit_points);
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE TRIGGER hit_point_outbox_insert
+AFTER INSERT ON operational.character_hitpoints
+FOR EACH ROW EXECUTE FUNCTION operational.hit_point_outbox_on_change();
+
+-- Updates that leave the hit points as they were (e.g. only moving a temporary hit point expiry) aren't changes
+CREATE OR REPLACE TRIGGER hit_point_outbox_update
+AFTER UPDATE ON operational.character_hitpoints
+FOR EACH ROW
+WHEN (
+    (NEW.hit_point_max, NEW.current_hit_points, NEW.temporary_hit_points)
+    IS DISTINCT FROM (OLD.hit_point_max, OLD.current_hit_points, OLD.temporary_hit_points)
+)
+EXECUTE FUNCTION operational.hit_point_outbox_on_change();
@@ -0,0 +1,208 @@
+-- Parties group characters, e.g. the players of one campaign. Parties are only meaningful on the directory shard
+-- (shard 0), while each character records its party on the shard it lives on.
+CREATE TABLE IF NOT EXISTS operational.party (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL
+);
+
+ALTER TABLE operational.character ADD COLUMN IF NOT EXISTS party_id INT;
+
+CREATE INDEX IF NOT EXISTS character_party_id_idx
+    ON operational.character (party_id)
+    WHERE party_id IS NOT NULL;
+
+-- Each shard's share of the hit point totals of every party with members on it, kept up to date by the triggers below
+-- in the same transaction as the hit point changes, so a party's totals are one primary key lookup per shard however
+-- big it is. The members' rows stay the source of truth, and `python -m src.character.party_rollups` checks for and
+-- repairs drift.
+CREATE TABLE IF NOT EXISTS operational.party_rollup (
+    party_id INT PRIMARY KEY,
+    member_count INT NOT NULL DEFAULT 0,
+    hit_point_max BIGINT NOT NULL DEFAULT 0,
+    current_hit_points BIGINT NOT NULL DEFAULT 0,
+    temporary_hit_points BIGINT NOT NULL DEFAULT 0,
+    -- Members at 0 hit points
+    downed_count INT NOT NULL DEFAULT 0,
+    -- Sum of each member's current hit points as a percentage of their maximum. Numeric, so adding and taking away
+    -- members' percentages never drifts from summing them afresh.
+    hit_point_percentage_sum NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION operational.hit_point_percentage(current_hit_points INT, hit_point_max INT) RETURNS NUMERIC
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT coalesce(round(100.0 * current_hit_points / nullif(hit_point_max, 0), 4), 0)
+$$;
+
+-- Add members' hit points to a party's rollup, or take them away with negative counts
+CREATE OR REPLACE FUNCTION operational.add_to_party_rollup(
+    target_party_id INT,
+    members INT,
+    max_total BIGINT,
+    current_total BIGINT,
+    temporary_total BIGINT,
+    downed INT,
+    percentage_sum NUMERIC
+) RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO operational.party_rollup AS r (
+        party_id,
+        member_count,
+        hit_point_max,
+        current_hit_points,
+        temporary_hit_points,
+        downed_count,
+        hit_point_percentage_sum
+    )
+    VALUES (target_party_id, members, max_total, current_total, temporary_total, downed, percentage_sum)
+    ON CONFLICT (party_id) DO UPDATE
+    SET member_count = r.member_count + EXCLUDED.member_count,
+        hit_point_max = r.hit_point_max + EXCLUDED.hit_point_max,
+        current_hit_points = r.current_hit_points + EXCLUDED.current_hit_points,
+        temporary_hit_points = r.temporary_hit_points + EXCLUDED.temporary_hit_points,
+        downed_count = r.downed_count + EXCLUDED.downed_count,
+        hit_point_percentage_sum = r.hit_point_percentage_sum + EXCLUDED.hit_point_percentage_sum,
+        updated_at = now()
+$$;
+
+-- Statement level, so a batch (a long rest, expiring temporary hit points, deleting characters) updates each party's
+-- rollup once, with the parties locked in id order. Rows going away count against their party and rows arriving
+-- towards it, which covers every operation: an update that leaves a member's hit points alone cancels out.
+CREATE OR REPLACE FUNCTION operational.party_rollup_on_hit_points() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    EXECUTE format(
+        $query$
+        SELECT operational.add_to_party_rollup(
+            party_id, members, max_total, current_total, temporary_total, downed, percentage_sum
+        )
+        FROM (
+            SELECT c.party_id,
+                sum(d.sign)::int AS members,
+                sum(d.sign * d.hit_point_max) AS max_total,
+                sum(d.sign * d.current_hit_points) AS current_total,
+                sum(d.sign * coalesce(d.temporary_hit_points, 0)) AS temporary_total,
+                sum(d.sign * (d.current_hit_points <= 0)::int)::int AS downed,
+                sum(d.sign * operational.hit_point_percentage(d.current_hit_points, d.hit_point_max)) AS percentage_sum
+            FROM (%s) d
+            JOIN operational.character c ON c.id = d.character_id
+            WHERE c.party_id IS NOT NULL
+            GROUP BY c.party_id
+        ) deltas
+        WHERE (members, max_total, current_total, temporary_total, downed, percentage_sum) <> (0, 0, 0, 0, 0, 0)
+        ORDER BY party_id
+        $query$,
+        CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT 1 AS sign, * FROM new_rows'
+            WHEN 'DELETE' THEN 'SELECT -1 AS sign, * FROM old_rows'
+            ELSE 'SELECT 1 AS sign, * FROM new_rows UNION ALL SELECT -1, * FROM old_rows'
+        END
+    );
+    RETURN NULL;
+END
+$$;
+
+-- Moves the hit points of characters changing party from their old party's rollup to their new one's
+CREATE OR REPLACE FUNCTION operational.party_rollup_on_character() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM operational.add_to_party_rollup(
+        party_id, members, max_total, current_total, temporary_total, downed, percentage_sum
+    )
+    FROM (
+        SELECT m.party_id,
+            sum(m.sign)::int AS members,
+            sum(m.sign * ch.hit_point_max) AS max_total,
+            sum(m.sign * ch.current_hit_points) AS current_total,
+            sum(m.sign * coalesce(ch.temporary_hit_points, 0)) AS temporary_total,
+            sum(m.sign * (ch.current_hit_points <= 0)::int)::int AS downed,
+            sum(m.sign * operational.hit_point_percentage(ch.current_hit_points, ch.hit_point_max)) AS percentage_sum
+        FROM (
+            SELECT o.id, o.party_id, -1 AS sign
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            WHERE o.party_id IS DISTINCT FROM n.party_id AND o.party_id IS NOT NULL
+            UNION ALL
+            SELECT n.id, n.party_id, 1
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            WHERE o.party_id IS DISTINCT FROM n.party_id AND n.party_id IS NOT NULL
+        ) m
+        JOIN operational.character_hitpoints ch ON ch.character_id = m.id
+        GROUP BY m.party_id
+    ) deltas
+    ORDER BY party_id;
+    RETURN NULL;
+END
+$$;
+
+-- Transition tables rule out `UPDATE OF` column lists and triggers for more than one operation, hence one trigger per
+-- operation
+CREATE OR REPLACE TRIGGER party_rollup_hit_points_insert
+AFTER INSERT ON operational.character_hitpoints
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.party_rollup_on_hit_points();
+
+CREATE OR REPLACE TRIGGER party_rollup_hit_points_update
+AFTER UPDATE ON operational.character_hitpoints
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.party_rollup_on_hit_points();
+
+CREATE OR REPLACE TRIGGER party_rollup_hit_points_delete
+AFTER DELETE ON operational.character_hitpoints
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.party_rollup_on_hit_points();
+
+CREATE OR REPLACE TRIGGER party_rollup_character
+AFTER UPDATE ON operational.character
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION operational.party_rollup_on_character();
+
+-- What a party's rollup on this shard should be, from its members' hit points
+CREATE OR REPLACE FUNCTION operational.build_party_rollup(target_party_id INT)
+RETURNS TABLE (
+    member_count INT,
+    hit_point_max BIGINT,
+    current_hit_points BIGINT,
+    temporary_hit_points BIGINT,
+    downed_count INT,
+    hit_point_percentage_sum NUMERIC
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT count(*)::int,
+        coalesce(sum(ch.hit_point_max), 0),
+        coalesce(sum(ch.current_hit_points), 0),
+        coalesce(sum(coalesce(ch.temporary_hit_points, 0)), 0),
+        count(*) FILTER (WHERE ch.current_hit_points <= 0)::int,
+        coalesce(sum(operational.hit_point_percentage(ch.current_hit_points, ch.hit_point_max)), 0)
+    FROM operational.character c
+    JOIN operational.character_hitpoints ch ON ch.character_id = c.id
+    WHERE c.party_id = target_party_id
+$$;
+
+-- Rebuild a party's rollup from its members. The rollup row stays locked while it's rebuilt, so a concurrent change to
+-- a member's hit points either commits before the rebuild reads them or applies its change on top of the rebuilt row.
+CREATE OR REPLACE FUNCTION operational.refresh_party_rollup(target_party_id INT) RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO operational.party_rollup (party_id) VALUES (target_party_id) ON CONFLICT (party_id) DO NOTHING;
+    PERFORM 1 FROM operational.party_rollup WHERE party_id = target_party_id FOR UPDATE;
+
+    UPDATE operational.party_rollup r
+    SET member_count = b.member_count,
+        hit_point_max = b.hit_point_max,
+        current_hit_points = b.current_hit_points,
+        temporary_hit_points = b.temporary_hit_points,
+        downed_count = b.downed_count,
+        hit_point_percentage_sum = b.hit_point_percentage_sum,
+        updated_at = now()
+    FROM operational.build_party_rollup(target_party_id) b
+    WHERE r.party_id = target_party_id;
+END
+$$;
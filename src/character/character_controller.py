@@ -1,39 +1,228 @@
-from litestar import Controller, get, put
+import asyncio
+from datetime import timedelta
+from typing import Optional
 
+from litestar import Controller, Response, WebSocket, get, post, put, websocket
+from litestar.datastructures import State
+from litestar.exceptions import ClientException, WebSocketDisconnect
+from litestar.params import Parameter
+from litestar.response import ServerSentEvent
+from litestar.status_codes import HTTP_202_ACCEPTED, WS_1013_TRY_AGAIN_LATER
+
+from src.character.character_events import CharacterEventBroker, Subscription
+from src.character.character_jobs import IMPORT_CHARACTERS, LONG_REST
 from src.character.character_repo import CharacterRepo
 from src.character.character_service import CharacterService
-from src.character.models import AssignTemporaryHitPointsRequest, Character, DealDamageRequest, HealRequest
+from src.character.effective_stats import EffectiveStats, EffectiveStatsCache, get_effective_stats
+from src.character.models import (
+    AssignTemporaryHitPointsRequest,
+    Character,
+    CharacterSearch,
+    CharacterSearchPage,
+    CharacterSummary,
+    DamageType,
+    DealDamageRequest,
+    HealRequest,
+    ImportCharactersRequest,
+    LongRestRequest,
+)
+from src.character.sharded_character_repo import ShardedCharacterRepo
+from src.common.admission import AdmissionControlMiddleware
+from src.common.db import DbConn, commit_with_lsn
+from src.common.jobs import Job, JobQueue
 
 
 class CharacterController(Controller):
     path = "/character/{id:int}"
+    middleware = [AdmissionControlMiddleware]
 
     @get()
-    async def get_character(self, id: int, character_repo: CharacterRepo) -> Character:
+    async def get_character(self, id: int, read_character_repo: CharacterRepo, read_db_conn: DbConn) -> Character:
         """
         Retrieve character data
         """
-        return await character_repo.get_character(id)
+        character = await read_character_repo.get_character(id)
+        await read_db_conn.commit()
+        return character
+
+    @get("/effective-stats")
+    async def get_effective_stats(
+        self,
+        id: int,
+        read_character_repo: CharacterRepo,
+        read_db_conn: DbConn,
+        effective_stats_cache: EffectiveStatsCache,
+    ) -> EffectiveStats:
+        """
+        Retrieve the character's stats with its items applied, along with their ability modifiers, proficiency bonus
+        and the hit point maximum they give
+        """
+        effective_stats = await get_effective_stats(read_character_repo, effective_stats_cache, id)
+        await read_db_conn.commit()
+        return effective_stats
 
     @put("/hit-points/damage")
-    async def deal_damage(self, id: int, data: DealDamageRequest, character_service: CharacterService) -> Character:
+    async def deal_damage(
+        self, id: int, data: DealDamageRequest, character_service: CharacterService, db_conn: DbConn, state: State
+    ) -> Response[Character]:
         """
         Deal damage of a specific type to a character
         """
-        return await character_service.deal_damage(character_id=id, damage=data.amount, damage_type=data.damage_type)
+        character = await character_service.deal_damage(
+            character_id=id, damage=data.amount, damage_type=data.damage_type
+        )
+        return Response(character, headers=await commit_with_lsn(db_conn, state))
 
     @put("/hit-points/heal")
-    async def heal(self, id: int, data: HealRequest, character_service: CharacterService) -> Character:
+    async def heal(
+        self, id: int, data: HealRequest, character_service: CharacterService, db_conn: DbConn, state: State
+    ) -> Response[Character]:
         """
         Heal a character
         """
-        return await character_service.heal(character_id=id, heal_amount=data.amount)
+        character = await character_service.heal(character_id=id, heal_amount=data.amount)
+        return Response(character, headers=await commit_with_lsn(db_conn, state))
 
     @put("/hit-points/temporary")
     async def assign_temporary_hit_points(
-        self, id: int, data: AssignTemporaryHitPointsRequest, character_service: CharacterService
-    ) -> Character:
+        self,
+        id: int,
+        data: AssignTemporaryHitPointsRequest,
+        character_service: CharacterService,
+        db_conn: DbConn,
+        state: State,
+    ) -> Response[Character]:
         """
         Assign temporary hit points to a character
         """
-        return await character_service.assign_temporary_hit_points(character_id=id, amount=data.amount)
+        character = await character_service.assign_temporary_hit_points(
+            character_id=id,
+            amount=data.amount,
+            duration=timedelta(seconds=data.duration_seconds) if data.duration_seconds else None,
+        )
+        return Response(character, headers=await commit_with_lsn(db_conn, state))
+
+
+class CharacterListController(Controller):
+    path = "/character"
+    middleware = [AdmissionControlMiddleware]
+
+    @get()
+    async def list_characters(
+        self,
+        sharded_character_repo: ShardedCharacterRepo,
+        after_id: int = Parameter(query="afterId", default=0, ge=0),
+        limit: int = Parameter(default=100, ge=1, le=1000),
+    ) -> list[CharacterSummary]:
+        """
+        List characters across every shard ordered by id. Pass the last id of a page as `afterId` to get the next page.
+        """
+        return await sharded_character_repo.list_characters(after_id=after_id, limit=limit)
+
+    @get("/search")
+    async def search_characters(
+        self,
+        sharded_character_repo: ShardedCharacterRepo,
+        immune_to: Optional[list[DamageType]] = Parameter(query="immuneTo", default=None),
+        resistant_to: Optional[list[DamageType]] = Parameter(query="resistantTo", default=None),
+        item_affects: Optional[list[str]] = Parameter(query="itemAffects", default=None),
+        class_name: Optional[str] = Parameter(query="className", default=None),
+        min_class_level: Optional[int] = Parameter(query="minClassLevel", default=None, ge=1),
+        min_level: Optional[int] = Parameter(query="minLevel", default=None, ge=1),
+        include_summaries: bool = Parameter(query="includeSummaries", default=False),
+        after_id: int = Parameter(query="afterId", default=0, ge=0),
+        limit: int = Parameter(default=100, ge=1, le=1000),
+    ) -> CharacterSearchPage:
+        """
+        Search characters across every shard by defense, item and class, ordered by id. Characters have to match every
+        filter given. Pass `nextAfterId` as `afterId` to get the next page.
+        """
+        if min_class_level is not None and class_name is None:
+            raise ClientException("minClassLevel needs a className")
+
+        search = CharacterSearch(
+            immune_to=immune_to or [],
+            resistant_to=resistant_to or [],
+            item_affects=item_affects or [],
+            class_name=class_name,
+            min_class_level=min_class_level,
+            min_level=min_level,
+        )
+        return await sharded_character_repo.search_characters(
+            search, after_id=after_id, limit=limit, summaries=include_summaries
+        )
+
+    @post("/import", status_code=HTTP_202_ACCEPTED)
+    async def import_characters(self, data: ImportCharactersRequest, job_queue: JobQueue) -> Job:
+        """
+        Queue a job importing characters. Follow it at `GET /jobs/{id}`, whose result has the new characters' ids.
+        """
+        return await job_queue.enqueue(IMPORT_CHARACTERS, data)
+
+    @post("/long-rest", status_code=HTTP_202_ACCEPTED)
+    async def long_rest(self, data: LongRestRequest, job_queue: JobQueue) -> Job:
+        """
+        Queue a job restoring the hit points of every character in a party. Follow it at `GET /jobs/{id}`.
+        """
+        return await job_queue.enqueue(LONG_REST, data)
+
+
+class CharacterEventsController(Controller):
+    path = "/character/events"
+
+    @get()
+    async def stream_hit_points(
+        self,
+        character_event_broker: CharacterEventBroker,
+        character_ids: list[int] = Parameter(query="characterId", min_items=1),
+    ) -> ServerSentEvent:
+        """
+        Stream hit point changes for one or more characters as Server-Sent Events
+        """
+        subscription = character_event_broker.subscribe(character_ids)
+
+        async def events():
+            try:
+                async for event in subscription:
+                    yield event.decode()
+            finally:
+                character_event_broker.unsubscribe(subscription)
+
+        return ServerSentEvent(events(), event_type="hitPoints")
+
+    @websocket("/ws")
+    async def hit_points_socket(
+        self,
+        socket: WebSocket,
+        character_event_broker: CharacterEventBroker,
+        character_ids: list[int] = Parameter(query="characterId", min_items=1),
+    ) -> None:
+        """
+        Stream hit point changes for one or more characters over a WebSocket
+        """
+        subscription = character_event_broker.subscribe(character_ids)
+        await socket.accept()
+        forward = asyncio.create_task(self._forward_events(socket, subscription))
+        disconnect = asyncio.create_task(self._wait_for_disconnect(socket))
+        try:
+            await asyncio.wait((forward, disconnect), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            forward.cancel()
+            disconnect.cancel()
+            character_event_broker.unsubscribe(subscription)
+
+        if forward.done() and not forward.cancelled() and subscription.dropped:
+            await socket.close(code=WS_1013_TRY_AGAIN_LATER, reason="Subscriber too slow")
+
+    @staticmethod
+    async def _forward_events(socket: WebSocket, subscription: Subscription) -> None:
+        async for event in subscription:
+            await socket.send_text(event.decode())
+
+    @staticmethod
+    async def _wait_for_disconnect(socket: WebSocket) -> None:
+        try:
+            while True:
+                await socket.receive_data(mode="text")
+        except WebSocketDisconnect:
+            pass
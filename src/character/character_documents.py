@@ -0,0 +1,124 @@
+"""
+Consistency checks and repairs for the `character_document` read model
+
+Triggers keep each character's document up to date with the normalized tables (see migration V4), but anything that
+writes with triggers disabled, such as a bulk load with `session_replication_role = replica`, or edits a document by
+hand leaves it out of date. Run `python -m src.character.character_documents` to check every shard for documents that
+are missing or differ from what the normalized tables give, and pass `--repair` to rebuild them (or `--rebuild` to
+rebuild every document). Reads fall back to the normalized tables for characters without a document, so a missing
+document is slow rather than wrong, but a stale one is served as is.
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Optional
+
+import msgspec
+from psycopg import AsyncConnection
+
+from src.common import app_config
+from src.common.db import get_shard_conn_infos
+from src.common.log_config import get_logger
+
+LOG = get_logger(__name__)
+
+
+class DocumentDrift(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    # Characters that should have a document but don't
+    missing: list[int]
+    # Characters whose document differs from the normalized tables, or that shouldn't have one
+    stale: list[int]
+
+
+async def check_documents(
+    conn: AsyncConnection, batch_size: int = app_config.CHARACTER_DOCUMENTS_BATCH_SIZE
+) -> DocumentDrift:
+    """
+    Compare every character's document with the one its normalized rows build, a batch of characters at a time
+    """
+    missing: list[int] = []
+    stale: list[int] = []
+    after_id = 0
+    while True:
+        res = await (
+            await conn.execute(
+                """
+                SELECT c.id, d.character_id IS NULL AS missing, d.document IS DISTINCT FROM b.document AS drifted
+                FROM (SELECT id FROM operational.character WHERE id > %(after_id)s ORDER BY id LIMIT %(limit)s) c
+                CROSS JOIN LATERAL (SELECT operational.build_character_document(c.id) AS document) b
+                LEFT JOIN operational.character_document d ON d.character_id = c.id
+                ORDER BY c.id
+                """,
+                {"after_id": after_id, "limit": batch_size},
+            )
+        ).fetchall()
+        await conn.commit()
+        if not res:
+            return DocumentDrift(missing=missing, stale=stale)
+
+        for character_id, is_missing, drifted in res:
+            if drifted:
+                (missing if is_missing else stale).append(character_id)
+        after_id = res[-1][0]
+
+
+async def rebuild_documents(
+    conn: AsyncConnection,
+    character_ids: Optional[list[int]] = None,
+    batch_size: int = app_config.CHARACTER_DOCUMENTS_BATCH_SIZE,
+) -> int:
+    """
+    Rebuild the documents of `character_ids` from the normalized tables, or of every character when not given, a batch
+    at a time. Returns how many characters were rebuilt.
+    """
+    rebuilt = 0
+    after_id = 0
+    while True:
+        if character_ids is None:
+            res = await (
+                await conn.execute(
+                    "SELECT id FROM operational.character WHERE id > %(after_id)s ORDER BY id LIMIT %(limit)s",
+                    {"after_id": after_id, "limit": batch_size},
+                )
+            ).fetchall()
+            batch = [row[0] for row in res]
+        else:
+            batch = character_ids[rebuilt : rebuilt + batch_size]
+        if not batch:
+            return rebuilt
+
+        await conn.execute(
+            "SELECT operational.refresh_character_document(id) FROM unnest(%(ids)s::int[]) AS id", {"ids": batch}
+        )
+        await conn.commit()
+        rebuilt += len(batch)
+        after_id = batch[-1]
+
+
+async def main(args: argparse.Namespace) -> int:
+    drifted = 0
+    for shard, conn_info in enumerate(get_shard_conn_infos()):
+        async with await AsyncConnection.connect(conn_info.to_conn_str()) as conn:
+            if args.rebuild:
+                LOG.info("Rebuilt %s documents on shard %s", await rebuild_documents(conn), shard)
+                continue
+
+            drift = await check_documents(conn)
+            LOG.info("Shard %s: %s missing and %s stale documents", shard, len(drift.missing), len(drift.stale))
+            if drift.missing or drift.stale:
+                LOG.info("Missing: %s", drift.missing[:100])
+                LOG.info("Stale: %s", drift.stale[:100])
+            if args.repair:
+                await rebuild_documents(conn, sorted(drift.missing + drift.stale))
+            else:
+                drifted += len(drift.missing) + len(drift.stale)
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and repair the character document read model")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--repair", action="store_true", help="Rebuild the documents found missing or stale")
+    mode.add_argument("--rebuild", action="store_true", help="Rebuild every document without checking")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,201 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, Optional, cast
+
+import msgspec
+import psycopg
+from litestar import Litestar
+from litestar.datastructures import State
+
+from src.character.character_repo import HITPOINTS_CHANNEL
+from src.character.models import CharacterHitpointsEvent
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.db import get_shard_conn_infos
+from src.common.log_config import get_logger
+
+LOG = get_logger(__name__)
+
+_event_decoder = msgspec.json.Decoder(CharacterHitpointsEvent)
+
+
+class Subscription:
+    """
+    A single subscriber's view of the hit point event stream
+
+    Events are buffered in a bounded queue. If the subscriber can't keep up and the queue fills, the subscription is
+    dropped by the broker rather than letting it hold up delivery to everyone else.
+    """
+
+    def __init__(self, character_ids: frozenset[int], max_queue_size: int) -> None:
+        self.character_ids = character_ids
+        self.dropped = False
+        self._queue: asyncio.Queue[Optional[bytes]] = asyncio.Queue(maxsize=max_queue_size)
+
+    def push(self, event: bytes) -> bool:
+        """
+        Queue `event` for delivery, returning `False` if the subscriber's queue is full
+        """
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self, dropped: bool = False) -> None:
+        """
+        Stop the subscription. Pending events are discarded if the subscriber was dropped or has no room left for the
+        close sentinel.
+        """
+        self.dropped = dropped
+        if dropped or self._queue.full():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while (event := await self._queue.get()) is not None:
+            yield event
+
+
+class CharacterEventBroker:
+    """
+    Fans out hit point events received on a single Postgres LISTEN connection to in-process subscribers
+    """
+
+    def __init__(self, max_queue_size: int = app_config.EVENT_SUBSCRIBER_QUEUE_SIZE) -> None:
+        self.max_queue_size = max_queue_size
+        self._subscribers: dict[int, set[Subscription]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def subscribe(self, character_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(frozenset(character_ids), self.max_queue_size)
+        for character_id in subscription.character_ids:
+            self._subscribers.setdefault(character_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for character_id in subscription.character_ids:
+            subs = self._subscribers.get(character_id)
+            if subs is None:
+                continue
+            subs.discard(subscription)
+            if not subs:
+                del self._subscribers[character_id]
+
+    def publish(self, payload: str) -> None:
+        """
+        Deliver a raw notification payload to every subscriber of the character it belongs to
+        """
+        event = payload.encode("utf-8")
+        character_id = _event_decoder.decode(event).character_id
+        for subscription in list(self._subscribers.get(character_id, ())):
+            if not subscription.push(event):
+                LOG.warning("Dropping slow hit point event subscriber for character id %s", character_id)
+                self.unsubscribe(subscription)
+                subscription.close(dropped=True)
+
+    def close(self) -> None:
+        for subscription in {sub for subs in self._subscribers.values() for sub in subs}:
+            subscription.close()
+        self._subscribers.clear()
+
+    def _on_notify(self, notify: psycopg.Notify) -> None:
+        try:
+            self.publish(notify.payload)
+        except msgspec.ValidationError as e:
+            LOG.error(e, exc_info=e)
+
+    async def listen(self, conn: psycopg.AsyncConnection, stop: asyncio.Event) -> None:
+        """
+        Publish every notification received on `conn` until `stop` is set
+
+        `AsyncConnection.notifies()` can't be interrupted while the connection is idle, so instead wait for the socket
+        to become readable and run a trivial query to hand any pending notifications to the notify handler.
+        """
+        conn.add_notify_handler(self._on_notify)
+        try:
+            while await _wait_readable(conn.fileno(), stop):
+                await conn.execute("SELECT 1")
+        finally:
+            conn.remove_notify_handler(self._on_notify)
+
+
+async def _wait_readable(fileno: int, stop: asyncio.Event) -> bool:
+    """
+    Wait for `fileno` to become readable, returning `False` if `stop` is set first
+    """
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    loop.add_reader(fileno, lambda: readable.done() or readable.set_result(None))
+    stopped = asyncio.ensure_future(stop.wait())
+    try:
+        await asyncio.wait((readable, stopped), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        loop.remove_reader(fileno)
+        stopped.cancel()
+    return not stop.is_set()
+
+
+async def _listen_forever(
+    broker: CharacterEventBroker, conn_str: str, ready: asyncio.Event, stop: asyncio.Event
+) -> None:
+    """
+    Keep a LISTEN connection open for `broker` until `stop` is set, reconnecting if the database goes away or
+    anything else goes wrong, so one error doesn't stop live updates from the shard until the process restarts
+    """
+    while not stop.is_set():
+        try:
+            async with await psycopg.AsyncConnection.connect(conn_str, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {HITPOINTS_CHANNEL}")
+                ready.set()
+                await broker.listen(conn, stop)
+        except Exception as e:
+            LOG.error("Hit point event listener failed, reconnecting: %s", e, exc_info=e)
+            try:
+                await asyncio.wait_for(stop.wait(), app_config.EVENT_LISTENER_RECONNECT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+@asynccontextmanager
+async def character_event_listener(app: Litestar):
+    """
+    Creates a context manager for the per-process hit point event broker and its LISTEN connections (one per shard)
+
+    The broker is stored within the application state.
+    """
+    broker = CharacterEventBroker()
+    app.state.character_events = broker
+    stop = asyncio.Event()
+    listeners: list[asyncio.Task[None]] = []
+    try:
+        for conn_info in get_shard_conn_infos():
+            ready = asyncio.Event()
+            listeners.append(asyncio.create_task(_listen_forever(broker, conn_info.to_conn_str(), ready, stop)))
+            try:
+                async with asyncio.timeout(app_config.EVENT_LISTENER_READY_TIMEOUT_SECONDS):
+                    await ready.wait()
+            except TimeoutError as e:
+                raise AppError(
+                    f"Could not listen for hit point events on {conn_info.host}:{conn_info.port} within "
+                    f"{app_config.EVENT_LISTENER_READY_TIMEOUT_SECONDS}s"
+                ) from e
+        yield broker
+    finally:
+        stop.set()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        broker.close()
+
+
+def provide_character_event_broker(state: State) -> CharacterEventBroker:
+    """
+    Provides the hit point event broker stored in the application state
+    """
+    if "character_events" not in state:
+        raise AppError("Cannot find character event broker in application state")
+
+    return cast(CharacterEventBroker, state.character_events)
@@ -0,0 +1,83 @@
+"""
+Bulk character operations, run as background jobs. See `src.common.jobs`.
+
+Both handlers work through their characters `JOB_BATCH_SIZE` at a time and report the ids they've handled after each
+batch, so a job taken over by another worker carries on from there. A batch that was cut short is run again, so each
+batch has to be safe to repeat.
+"""
+
+import msgspec
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import ImportCharactersRequest, LongRestRequest
+from src.common import app_config
+from src.common.jobs import JobContext, job_handler
+from src.common.pool import acquire
+from src.common.utils import dict_row_camel
+
+IMPORT_CHARACTERS = "import_characters"
+LONG_REST = "long_rest"
+
+
+class ImportCharactersResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    # Ids of the imported characters, in the order they were given. Until the job succeeds, this also holds the ids
+    # allocated to the batch being imported, some of which may not have been inserted.
+    character_ids: list[int]
+
+
+class LongRestResult(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    # Ids of the characters that rested. Characters that don't exist are skipped.
+    character_ids: list[int]
+
+
+@job_handler(IMPORT_CHARACTERS, ImportCharactersRequest)
+async def import_characters(context: JobContext, params: ImportCharactersRequest) -> ImportCharactersResult:
+    """
+    Insert each character on the shard that owns its newly allocated id, with one transaction per shard for each batch
+
+    A batch's ids are allocated and recorded in the job's result before any of it is inserted. A worker taking the job
+    over then inserts the batch under the same ids, skipping characters that were already inserted, rather than
+    inserting them again.
+    """
+    character_ids = msgspec.convert(context.result, ImportCharactersResult).character_ids if context.result else []
+    for start in range(context.done, len(params.characters), app_config.JOB_BATCH_SIZE):
+        batch = params.characters[start : start + app_config.JOB_BATCH_SIZE]
+        if len(character_ids) < start + len(batch):
+            character_ids += [
+                await context.shards.allocate_character_id() for _ in range(start + len(batch) - len(character_ids))
+            ]
+            await context.report_progress(
+                start, len(params.characters), ImportCharactersResult(character_ids=character_ids)
+            )
+
+        characters = dict(zip(character_ids[start : start + len(batch)], batch))
+        for shard, shard_character_ids in context.shards.group_by_shard(characters).items():
+            async with acquire(context.shards.pools[shard]) as conn:
+                async with conn.cursor(row_factory=dict_row_camel) as cur:
+                    repo = CharacterRepo(cur)
+                    existing = await repo.get_existing_character_ids(shard_character_ids)
+                    for character_id in shard_character_ids:
+                        if character_id not in existing:
+                            await repo.insert_character(characters[character_id], character_id=character_id)
+        await context.report_progress(
+            start + len(batch), len(params.characters), ImportCharactersResult(character_ids=character_ids)
+        )
+    return ImportCharactersResult(character_ids=character_ids)
+
+
+@job_handler(LONG_REST, LongRestRequest)
+async def long_rest(context: JobContext, params: LongRestRequest) -> LongRestResult:
+    """
+    Restore every character's hit points, with one transaction per shard for each batch
+    """
+    character_ids = msgspec.convert(context.result, LongRestResult).character_ids if context.result else []
+    for start in range(context.done, len(params.character_ids), app_config.JOB_BATCH_SIZE):
+        batch = params.character_ids[start : start + app_config.JOB_BATCH_SIZE]
+        for shard, shard_character_ids in context.shards.group_by_shard(batch).items():
+            async with acquire(context.shards.pools[shard]) as conn:
+                async with conn.cursor(row_factory=dict_row_camel) as cur:
+                    character_ids += await CharacterRepo(cur).long_rest(shard_character_ids)
+        await context.report_progress(
+            start + len(batch), len(params.character_ids), LongRestResult(character_ids=character_ids)
+        )
+    return LongRestResult(character_ids=character_ids)
@@ -1,37 +1,79 @@
+from datetime import datetime
+from typing import Optional
+
 import msgspec
-from psycopg import AsyncCursor
+from psycopg import sql
 
 from src.character.exceptions import CharacterNotFoundException, CharacterRepoException
 from src.character.models import (
     Character,
     CharacterClass,
     CharacterHitpoints,
+    CharacterHitpointsEvent,
+    CharacterSearch,
     CharacterStats,
+    CharacterSummary,
     Defense,
+    DefenseMasks,
+    DefenseType,
     Item,
     ItemModifier,
 )
+from src.common import app_config
 from src.common.log_config import get_logger
+from src.common.metrics import timed_query
+from src.common.utils import DbCursor, acquire_lock
 
 LOG = get_logger(__name__)
 
+# Postgres NOTIFY channel that hit point changes are published to. Notifications are only delivered once the
+# updating transaction commits.
+HITPOINTS_CHANNEL = "character_hitpoints"
+
+_CHARACTER_DECODER = msgspec.json.Decoder(Character)
+
+
+def _character_id_column(table: str) -> str:
+    return "id" if table == "character" else "character_id"
+
 
 class CharacterRepo:
-    def __init__(self, db: AsyncCursor) -> None:
+    """
+    Postgres `CharacterStorage`. Its unit of work is the cursor's transaction.
+    """
+
+    def __init__(self, db: DbCursor) -> None:
         self.db = db
 
+    async def lock(self, key: str) -> None:
+        """
+        Take a transaction-scoped advisory lock on `key`
+        """
+        await acquire_lock(key, self.db)
+
+    @timed_query
     async def update_hitpoints(self, character_id: int, hitpoints: CharacterHitpoints) -> Character:
+        event = CharacterHitpointsEvent(character_id=character_id, hit_points=hitpoints)
         updated_res = await (
             await self.db.execute(
                 """
-                UPDATE operational.character_hitpoints
-                SET current_hit_points = %(current_hit_points)s,
-                    hit_point_max = %(hit_point_max)s,
-                    temporary_hit_points = %(temporary_hit_points)s
-                WHERE id = %(character_id)s
-                RETURNING id
+                WITH updated AS (
+                    UPDATE operational.character_hitpoints
+                    SET current_hit_points = %(current_hit_points)s,
+                        hit_point_max = %(hit_point_max)s,
+                        temporary_hit_points = %(temporary_hit_points)s
+                    WHERE character_id = %(character_id)s
+                    RETURNING character_id
+                )
+                SELECT character_id, pg_notify(%(channel)s, %(event)s)
+                FROM updated
                 """,
-                {"character_id": character_id} | msgspec.structs.asdict(hitpoints),
+                {
+                    "character_id": character_id,
+                    "channel": HITPOINTS_CHANNEL,
+                    "event": msgspec.json.encode(event).decode(),
+                }
+                | msgspec.structs.asdict(hitpoints),
             )
         ).fetchone()
 
@@ -40,7 +82,177 @@ class CharacterRepo:
 
         return await self.get_character(character_id=character_id)
 
+    @timed_query
+    async def set_temporary_hit_points_expiry(self, character_id: int, expire_at: Optional[datetime]) -> None:
+        await self.db.execute(
+            """
+            UPDATE operational.character_hitpoints
+            SET temporary_hit_points_expire_at = %(expire_at)s
+            WHERE character_id = %(character_id)s
+            """,
+            {"character_id": character_id, "expire_at": expire_at},
+        )
+
+    @timed_query
+    async def expire_temporary_hit_points(self, character_ids: list[int], now: datetime) -> list[int]:
+        """
+        Clear the temporary hit points of the characters in `character_ids` whose temporary hit points expired by
+        `now`, publishing their new hit points, and return their ids. Characters whose expiry has since been moved or
+        cleared are left alone.
+        """
+        res = await (
+            await self.db.execute(
+                """
+                WITH expired AS (
+                    UPDATE operational.character_hitpoints
+                    SET temporary_hit_points = NULL, temporary_hit_points_expire_at = NULL
+                    WHERE character_id = ANY(%(ids)s) AND temporary_hit_points_expire_at <= %(now)s
+                    RETURNING character_id, hit_point_max, current_hit_points, temporary_hit_points
+                )
+                SELECT character_id,
+                    pg_notify(
+                        %(channel)s,
+                        json_build_object(
+                            'characterId', character_id,
+                            'hitPoints', json_build_object(
+                                'hitPointMax', hit_point_max,
+                                'currentHitPoints', current_hit_points,
+                                'temporaryHitPoints', temporary_hit_points
+                            )
+                        )::text
+                    )
+                FROM expired
+                """,
+                {"ids": character_ids, "now": now, "channel": HITPOINTS_CHANNEL},
+            )
+        ).fetchall()
+        return [row["characterId"] for row in res]
+
+    @timed_query
+    async def long_rest(self, character_ids: list[int]) -> list[int]:
+        """
+        Restore the characters in `character_ids` to their hit point maximum, ending any temporary hit points,
+        publishing their new hit points, and return their ids
+        """
+        res = await (
+            await self.db.execute(
+                """
+                WITH rested AS (
+                    UPDATE operational.character_hitpoints
+                    SET current_hit_points = hit_point_max,
+                        temporary_hit_points = NULL,
+                        temporary_hit_points_expire_at = NULL
+                    WHERE character_id = ANY(%(ids)s)
+                    RETURNING character_id, hit_point_max, current_hit_points, temporary_hit_points
+                )
+                SELECT character_id,
+                    pg_notify(
+                        %(channel)s,
+                        json_build_object(
+                            'characterId', character_id,
+                            'hitPoints', json_build_object(
+                                'hitPointMax', hit_point_max,
+                                'currentHitPoints', current_hit_points,
+                                'temporaryHitPoints', temporary_hit_points
+                            )
+                        )::text
+                    )
+                FROM rested
+                """,
+                {"ids": character_ids, "channel": HITPOINTS_CHANNEL},
+            )
+        ).fetchall()
+        return [row["characterId"] for row in res]
+
+    @timed_query
+    async def set_party(self, character_ids: list[int], party_id: Optional[int]) -> list[int]:
+        """
+        Move the characters in `character_ids` into party `party_id`, or out of their party when it's `None`, and return
+        the ids of those that exist. Their hit points move between the parties' rollups in the same transaction.
+        """
+        res = await (
+            await self.db.execute(
+                "UPDATE operational.character SET party_id = %(party_id)s WHERE id = ANY(%(ids)s) RETURNING id",
+                {"ids": character_ids, "party_id": party_id},
+            )
+        ).fetchall()
+        return sorted(row["id"] for row in res)
+
+    @timed_query
+    async def leave_party(self, character_ids: list[int], party_id: int) -> list[int]:
+        """
+        Take the characters in `character_ids` that are in party `party_id` out of it, and return their ids
+        """
+        res = await (
+            await self.db.execute(
+                """
+                UPDATE operational.character
+                SET party_id = NULL
+                WHERE id = ANY(%(ids)s) AND party_id = %(party_id)s
+                RETURNING id
+                """,
+                {"ids": character_ids, "party_id": party_id},
+            )
+        ).fetchall()
+        return sorted(row["id"] for row in res)
+
+    @timed_query
+    async def get_party_ids(self, character_ids: list[int]) -> dict[int, int]:
+        """
+        The party of each character in `character_ids` that's in one
+        """
+        res = await (
+            await self.db.execute(
+                """
+                SELECT id, party_id
+                FROM operational.character
+                WHERE id = ANY(%(ids)s) AND party_id IS NOT NULL
+                """,
+                {"ids": character_ids},
+            )
+        ).fetchall()
+        return {row["id"]: row["partyId"] for row in res}
+
+    @timed_query
+    async def list_temporary_hit_points_expiries(self) -> list[tuple[int, datetime]]:
+        """
+        Every pending temporary hit point expiry, as `(character_id, expire_at)`
+        """
+        res = await (
+            await self.db.execute(
+                """
+                SELECT character_id, temporary_hit_points_expire_at
+                FROM operational.character_hitpoints
+                WHERE temporary_hit_points_expire_at IS NOT NULL
+                """
+            )
+        ).fetchall()
+        return [(row["characterId"], row["temporaryHitPointsExpireAt"]) for row in res]
+
+    @timed_query
+    async def get_temporary_hit_points_expiries(self, character_ids: list[int]) -> dict[int, datetime]:
+        """
+        When the temporary hit points of each character in `character_ids` with a pending expiry run out
+        """
+        res = await (
+            await self.db.execute(
+                """
+                SELECT character_id, temporary_hit_points_expire_at
+                FROM operational.character_hitpoints
+                WHERE character_id = ANY(%(ids)s) AND temporary_hit_points_expire_at IS NOT NULL
+                """,
+                {"ids": character_ids},
+            )
+        ).fetchall()
+        return {row["characterId"]: row["temporaryHitPointsExpireAt"] for row in res}
+
+    @timed_query
     async def get_character(self, character_id: int):
+        if app_config.CHARACTER_DOCUMENTS_ENABLED:
+            documents = await self.get_character_documents([character_id])
+            if character_id in documents:
+                return documents[character_id]
+
         character_res = await (
             await self.db.execute(
                 """
@@ -78,6 +290,55 @@ class CharacterRepo:
             defenses=character_defenses,
         )
 
+    @timed_query
+    async def get_hitpoints_and_defenses(self, character_id: int) -> tuple[CharacterHitpoints, DefenseMasks]:
+        """
+        The character's hit points and stored defense masks, without loading its defenses
+        """
+        res = await (
+            await self.db.execute(
+                """
+                SELECT hit_point_max,
+                    current_hit_points,
+                    temporary_hit_points,
+                    resistance_mask,
+                    immunity_mask
+                FROM operational.character c
+                JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+                WHERE c.id = %(id)s
+                """,
+                {"id": character_id},
+            )
+        ).fetchone()
+
+        if not res:
+            raise CharacterNotFoundException(
+                f"Cannot find character for character id {character_id}", character_id=character_id
+            )
+
+        defense_masks = DefenseMasks(resistance=res.pop("resistanceMask"), immunity=res.pop("immunityMask"))
+        return msgspec.convert(res, CharacterHitpoints), defense_masks
+
+    @timed_query
+    async def get_sheet_version(self, character_id: int) -> int:
+        """
+        Version of the character's level, classes, stats and items, bumped whenever any of them change
+        """
+        res = await (
+            await self.db.execute(
+                "SELECT sheet_version FROM operational.character WHERE id = %(id)s",
+                {"id": character_id},
+            )
+        ).fetchone()
+
+        if not res:
+            raise CharacterNotFoundException(
+                f"Cannot find character for character id {character_id}", character_id=character_id
+            )
+
+        return res["sheetVersion"]
+
+    @timed_query
     async def get_character_classes(self, character_id: int):
         res = await (
             await self.db.execute(
@@ -94,6 +355,7 @@ class CharacterRepo:
             list[CharacterClass],
         )
 
+    @timed_query
     async def get_character_defenses(self, character_id: int):
         return msgspec.convert(
             await (
@@ -109,6 +371,7 @@ class CharacterRepo:
             list[Defense],
         )
 
+    @timed_query
     async def get_character_stats(self, character_id: int):
         stats_res = await (
             await self.db.execute(
@@ -129,6 +392,7 @@ class CharacterRepo:
         stat_dict = {r["stat"]: r["value"] for r in stats_res}
         return msgspec.convert(stat_dict, CharacterStats)
 
+    @timed_query
     async def get_character_items(self, character_id: int):
         item_res = await (
             await self.db.execute(
@@ -137,7 +401,7 @@ class CharacterRepo:
                 cim.affected_value as "affectedValue", cim.value
                 FROM operational.character_item ci
                 JOIN operational.character_item_modifier cim ON ci.id = cim.character_item_id
-                WHERE character_id = %(id)s
+                WHERE ci.character_id = %(id)s
                 """,
                 {"id": character_id},
             )
@@ -161,20 +425,370 @@ class CharacterRepo:
 
         return items
 
-    async def insert_character(self, character: Character):
-        LOG.info(f"Inserting character: {character}")
+    @timed_query
+    async def get_character_documents(self, character_ids: list[int]) -> dict[int, Character]:
+        """
+        Load characters from their `character_document`, skipping ids that don't have one
+        """
+        res = await (
+            await self.db.execute(
+                """
+                SELECT character_id, document::text AS document
+                FROM operational.character_document
+                WHERE character_id = ANY(%(ids)s)
+                """,
+                {"ids": character_ids},
+            )
+        ).fetchall()
+        return {row["characterId"]: _CHARACTER_DECODER.decode(row["document"]) for row in res}
+
+    @timed_query
+    async def get_characters(self, character_ids: list[int]) -> dict[int, Character]:
+        """
+        Batch version of `get_character`. Loads every character in `character_ids` with one query per table, skipping
+        ids that don't exist.
+        """
+        documents: dict[int, Character] = {}
+        if app_config.CHARACTER_DOCUMENTS_ENABLED:
+            documents = await self.get_character_documents(character_ids)
+            character_ids = [character_id for character_id in character_ids if character_id not in documents]
+            if not character_ids:
+                return documents
+
+        params = {"ids": character_ids}
+        character_res = await (
+            await self.db.execute(
+                """
+                SELECT c.id,
+                    name,
+                    level,
+                    hit_point_max,
+                    current_hit_points,
+                    temporary_hit_points
+                FROM operational.character c
+                JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+                WHERE c.id = ANY(%(ids)s)
+                """,
+                params,
+            )
+        ).fetchall()
+
+        if not character_res:
+            return documents
+
+        classes: dict[int, list[CharacterClass]] = {}
+        for row in await (
+            await self.db.execute(
+                """
+                SELECT character_id as "characterId", class_name as name, hit_dice_value as "hitDiceValue",
+                class_level as "classLevel"
+                FROM operational.character_class
+                WHERE character_id = ANY(%(ids)s)
+                """,
+                params,
+            )
+        ).fetchall():
+            classes.setdefault(row.pop("characterId"), []).append(msgspec.convert(row, CharacterClass))
+
+        stats: dict[int, dict[str, int]] = {}
+        for row in await (
+            await self.db.execute(
+                """
+                SELECT character_id as "characterId", stat, value
+                FROM operational.character_stat
+                WHERE character_id = ANY(%(ids)s)
+                """,
+                params,
+            )
+        ).fetchall():
+            stats.setdefault(row["characterId"], {})[row["stat"]] = row["value"]
+
+        items: dict[int, list[Item]] = {}
+        for row in await (
+            await self.db.execute(
+                """
+                SELECT ci.character_id as "characterId", ci.name, cim.affected_object as "affectedObject",
+                cim.affected_value as "affectedValue", cim.value
+                FROM operational.character_item ci
+                JOIN operational.character_item_modifier cim ON ci.id = cim.character_item_id
+                WHERE ci.character_id = ANY(%(ids)s)
+                """,
+                params,
+            )
+        ).fetchall():
+            items.setdefault(row["characterId"], []).append(
+                Item(
+                    name=row["name"],
+                    modifier=ItemModifier(
+                        affected_object=row["affectedObject"],
+                        affected_value=row["affectedValue"],
+                        value=row["value"],
+                    ),
+                )
+            )
+
+        defenses: dict[int, list[Defense]] = {}
+        for row in await (
+            await self.db.execute(
+                """
+                SELECT character_id as "characterId", damage_type as type, defense_type as defense
+                FROM operational.character_defense
+                WHERE character_id = ANY(%(ids)s)
+                """,
+                params,
+            )
+        ).fetchall():
+            defenses.setdefault(row.pop("characterId"), []).append(msgspec.convert(row, Defense))
+
+        characters: dict[int, Character] = {}
+        for row in character_res:
+            character_id = row.pop("id")
+            if character_id not in stats:
+                raise CharacterNotFoundException(
+                    f"Cannot find character stats for character id {character_id}", character_id=character_id
+                )
+
+            name, level = row.pop("name"), row.pop("level")
+            characters[character_id] = Character(
+                name=name,
+                level=level,
+                hit_points=msgspec.convert(row, CharacterHitpoints),
+                classes=classes.get(character_id, []),
+                stats=msgspec.convert(stats[character_id], CharacterStats),
+                items=items.get(character_id, []),
+                defenses=defenses.get(character_id, []),
+            )
+
+        return documents | characters
+
+    @timed_query
+    async def list_characters(self, after_id: int = 0, limit: int = 100) -> list[CharacterSummary]:
+        """
+        List characters ordered by id, starting after `after_id`
+        """
+        return msgspec.convert(
+            await (
+                await self.db.execute(
+                    """
+                    SELECT c.id,
+                        name,
+                        level,
+                        json_build_object(
+                            'hitPointMax', hit_point_max,
+                            'currentHitPoints', current_hit_points,
+                            'temporaryHitPoints', temporary_hit_points
+                        ) as "hitPoints"
+                    FROM operational.character c
+                    JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+                    WHERE c.id > %(after_id)s
+                    ORDER BY c.id
+                    LIMIT %(limit)s
+                    """,
+                    {"after_id": after_id, "limit": limit},
+                )
+            ).fetchall(),
+            list[CharacterSummary],
+        )
+
+    @staticmethod
+    def _search_query(search: CharacterSearch, after_id: int, limit: int) -> tuple[str, dict[str, object]]:
+        """
+        The query for the ids of the first `limit` characters after `after_id` matching `search`, and its params
+
+        Each filter's search index (see migration V6) ends in `character_id`, so it can both list the characters
+        matching the filter in id order from `after_id` and check a single character. The filter likely to match the
+        fewest characters, in the order defenses, classes then items, is listed and every other filter checked for each
+        character it lists, so a page costs about as many index lookups as that filter has matches in the page's range.
+        """
+        params: dict[str, object] = {"after_id": after_id, "limit": limit}
+        # Each filter is its table and its condition on that table, aliased as `{t}`
+        filters: list[tuple[str, str]] = []
+        defenses = [(DefenseType.IMMUNITY, damage_type) for damage_type in search.immune_to] + [
+            (DefenseType.RESISTANCE, damage_type) for damage_type in search.resistant_to
+        ]
+        for i, (defense_type, damage_type) in enumerate(defenses):
+            filters.append(
+                (
+                    "character_defense",
+                    f"{{t}}.damage_type = %(damage_type_{i})s AND {{t}}.defense_type = %(defense_type_{i})s",
+                )
+            )
+            params[f"damage_type_{i}"] = damage_type.value
+            params[f"defense_type_{i}"] = defense_type.value
+
+        if search.class_name is not None:
+            filters.append(
+                (
+                    "character_class",
+                    "lower({t}.class_name) = lower(%(class_name)s) AND {t}.class_level >= %(min_class_level)s",
+                )
+            )
+            params["class_name"] = search.class_name
+            params["min_class_level"] = search.min_class_level or 0
+
+        for i, affected_value in enumerate(search.item_affects):
+            filters.append(("character_item_modifier", f"{{t}}.affected_value = %(affected_value_{i})s"))
+            params[f"affected_value_{i}"] = affected_value
+
+        if search.min_level is not None:
+            filters.append(("character", "{t}.level >= %(min_level)s"))
+            params["min_level"] = search.min_level
+
+        (table, condition), checks = filters[0] if filters else ("character", "true"), filters[1:]
+        column = _character_id_column(table)
+        checks_sql = "".join(
+            f"""
+            AND EXISTS (
+                SELECT 1 FROM operational.{check_table} f{i}
+                WHERE {check_condition.format(t=f"f{i}")}
+                    AND f{i}.{_character_id_column(check_table)} = f.{column}
+                    AND f{i}.{_character_id_column(check_table)} > %(after_id)s
+            )
+            """
+            for i, (check_table, check_condition) in enumerate(checks)
+        )
+        # A character can have several items affecting the same value
+        return (
+            f"""
+            SELECT DISTINCT f.{column} AS id
+            FROM operational.{table} f
+            WHERE {condition.format(t="f")} AND f.{column} > %(after_id)s {checks_sql}
+            ORDER BY f.{column}
+            LIMIT %(limit)s
+            """,
+            params,
+        )
+
+    @timed_query
+    async def search_character_ids(self, search: CharacterSearch, after_id: int = 0, limit: int = 100) -> list[int]:
+        """
+        The ids of the characters matching `search` in id order, starting after `after_id`
+        """
+        query, params = self._search_query(search, after_id, limit)
+        return [row["id"] for row in await (await self.db.execute(query, params)).fetchall()]
+
+    @timed_query
+    async def search_characters(
+        self, search: CharacterSearch, after_id: int = 0, limit: int = 100
+    ) -> list[CharacterSummary]:
+        """
+        Summaries of the characters matching `search` in id order, starting after `after_id`
+        """
+        query, params = self._search_query(search, after_id, limit)
+        return msgspec.convert(
+            await (
+                await self.db.execute(
+                    f"""
+                    SELECT c.id,
+                        name,
+                        level,
+                        json_build_object(
+                            'hitPointMax', hit_point_max,
+                            'currentHitPoints', current_hit_points,
+                            'temporaryHitPoints', temporary_hit_points
+                        ) as "hitPoints"
+                    FROM operational.character c
+                    JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+                    WHERE c.id IN ({query})
+                    ORDER BY c.id
+                    """,
+                    params,
+                )
+            ).fetchall(),
+            list[CharacterSummary],
+        )
+
+    @timed_query
+    async def list_character_ids(self, bucket_count: int, bucket: int, for_update: bool = False) -> list[int]:
+        """
+        List the ids of every character whose id falls into `bucket` out of `bucket_count`
+
+        With `for_update`, the characters' rows (including hit points) are locked until the transaction ends.
+        """
+        query = """
+            SELECT c.id
+            FROM operational.character c
+            JOIN operational.character_hitpoints ch ON c.id = ch.character_id
+            WHERE c.id %% %(bucket_count)s = %(bucket)s
+            ORDER BY c.id
+            """
+        res = await (
+            await self.db.execute(
+                query + " FOR UPDATE" if for_update else query,
+                {"bucket_count": bucket_count, "bucket": bucket},
+            )
+        ).fetchall()
+        return [r["id"] for r in res]
+
+    @timed_query
+    async def get_existing_character_ids(self, character_ids: list[int]) -> set[int]:
+        """
+        The ids in `character_ids` of the characters that exist
+        """
+        res = await (
+            await self.db.execute(
+                "SELECT id FROM operational.character WHERE id = ANY(%(ids)s)", {"ids": character_ids}
+            )
+        ).fetchall()
+        return {row["id"] for row in res}
+
+    @timed_query
+    async def delete_characters(self, character_ids: list[int]):
+        LOG.info("Deleting %s characters", len(character_ids))
+        params = {"ids": character_ids}
+        await self.db.execute(
+            """
+            DELETE FROM operational.character_item_modifier cim
+            USING operational.character_item ci
+            WHERE ci.id = cim.character_item_id AND ci.character_id = ANY(%(ids)s)
+            """,
+            params,
+        )
+        child_tables = (
+            "character_item",
+            "character_defense",
+            "character_stat",
+            "character_class",
+            "character_hitpoints",
+        )
+        for table in child_tables:
+            await self.db.execute(
+                sql.SQL("DELETE FROM {} WHERE character_id = ANY(%(ids)s)").format(
+                    sql.Identifier("operational", table)
+                ),
+                params,
+            )
+        await self.db.execute("DELETE FROM operational.character WHERE id = ANY(%(ids)s)", params)
+
+    @timed_query
+    async def insert_character(self, character: Character, character_id: Optional[int] = None) -> int:
+        """
+        Insert `character`, returning its id. An explicit `character_id` can be given for ids allocated up front
+        (e.g. by the shard directory).
+        """
+        LOG.info("Inserting character: %s", character)
         character_id_res = await (
             await self.db.execute(
                 """
                 INSERT INTO operational.character
-                (name, level)
+                (id, name, level, resistance_mask, immunity_mask)
                 VALUES
-                (%(name)s, %(level)s)
+                (
+                    coalesce(%(id)s, nextval('operational.character_id_seq')),
+                    %(name)s,
+                    %(level)s,
+                    %(resistance_mask)s,
+                    %(immunity_mask)s
+                )
                 RETURNING id
                 """,
                 {
+                    "id": character_id,
                     "name": character.name,
                     "level": character.level,
+                    # Kept in sync with the `character_defense` rows inserted below
+                    "resistance_mask": character.defense_masks.resistance,
+                    "immunity_mask": character.defense_masks.immunity,
                 },
             )
         ).fetchone()
@@ -191,8 +805,11 @@ class CharacterRepo:
             await self.insert_character_item(character_id=character_id, character_item=item)
         await self.insert_character_defenses(character_id=character_id, defenses=character.defenses)
 
+        return character_id
+
+    @timed_query
     async def insert_character_hit_points(self, character_id: int, hit_points: CharacterHitpoints):
-        LOG.info(f"Inserting character hitpoints for character id {character_id}")
+        LOG.info("Inserting character hitpoints for character id %s", character_id)
         await self.db.execute(
             """
             INSERT INTO operational.character_hitpoints
@@ -203,8 +820,9 @@ class CharacterRepo:
             {"character_id": character_id} | msgspec.structs.asdict(hit_points),
         )
 
+    @timed_query
     async def insert_character_classes(self, character_id: int, classes: list[CharacterClass]):
-        LOG.info(f"Inserting {len(classes)} character classes for character id {character_id}")
+        LOG.info("Inserting %s character classes for character id %s", len(classes), character_id)
         await self.db.executemany(
             """
             INSERT INTO operational.character_class
@@ -215,8 +833,9 @@ class CharacterRepo:
             [{"character_id": character_id} | msgspec.structs.asdict(clazz) for clazz in classes],
         )
 
+    @timed_query
     async def insert_character_stat(self, character_id: int, character_stats: CharacterStats):
-        LOG.info(f"Inserting character stats for character id {character_id}")
+        LOG.info("Inserting character stats for character id %s", character_id)
         await self.db.executemany(
             """
             INSERT INTO operational.character_stat
@@ -230,8 +849,9 @@ class CharacterRepo:
             ],
         )
 
+    @timed_query
     async def insert_character_item(self, character_id: int, character_item: Item):
-        LOG.info(f"Inserting character item for character id {character_id}")
+        LOG.info("Inserting character item for character id %s", character_id)
         item_id_res = await (
             await self.db.execute(
                 """
@@ -248,19 +868,21 @@ class CharacterRepo:
 
         item_id = item_id_res["id"]
 
-        LOG.info(f"Inserting character item modifier for character item id {item_id}")
+        LOG.info("Inserting character item modifier for character item id %s", item_id)
         await self.db.execute(
             """
             INSERT INTO operational.character_item_modifier
-            (character_item_id, affected_object, affected_value, value)
+            (character_id, character_item_id, affected_object, affected_value, value)
             VALUES
-            (%(character_item_id)s, %(affected_object)s, %(affected_value)s, %(value)s)
+            (%(character_id)s, %(character_item_id)s, %(affected_object)s, %(affected_value)s, %(value)s)
             """,
-            {"character_item_id": item_id} | msgspec.structs.asdict(character_item.modifier),
+            {"character_id": character_id, "character_item_id": item_id}
+            | msgspec.structs.asdict(character_item.modifier),
         )
 
+    @timed_query
     async def insert_character_defenses(self, character_id: int, defenses: list[Defense]):
-        LOG.info(f"Inserting character defenses for character id {character_id}")
+        LOG.info("Inserting character defenses for character id %s", character_id)
         await self.db.executemany(
             """
             INSERT INTO operational.character_defense
@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional, Protocol, runtime_checkable
+
+from src.character.models import Character, CharacterHitpoints, CharacterSummary, DefenseMasks
+
+
+@runtime_checkable
+class CharacterStorage(Protocol):
+    """
+    The character operations `CharacterService` depends on, so it can run on any storage backend
+
+    An instance covers one unit of work (a transaction for `CharacterRepo`, a session for `InMemoryCharacterStorage`).
+    Writes only become visible to other units of work once it ends successfully, and locks are held until it ends.
+    Every backend must pass the conformance suite in `tests/test_character_storage.py`.
+    """
+
+    async def get_character(self, character_id: int) -> Character: ...
+
+    async def get_hitpoints_and_defenses(self, character_id: int) -> tuple[CharacterHitpoints, DefenseMasks]:
+        """
+        Just the character's hit points and defenses, which is all dealing damage needs
+        """
+        ...
+
+    async def update_hitpoints(self, character_id: int, hitpoints: CharacterHitpoints) -> Character: ...
+
+    async def set_temporary_hit_points_expiry(self, character_id: int, expire_at: Optional[datetime]) -> None:
+        """
+        Record when the character's temporary hit points expire, or that they don't when `expire_at` is `None`
+        """
+        ...
+
+    async def insert_character(self, character: Character, character_id: Optional[int] = None) -> int: ...
+
+    async def list_characters(self, after_id: int = 0, limit: int = 100) -> list[CharacterSummary]: ...
+
+    async def lock(self, key: str) -> None:
+        """
+        Take the exclusive lock on `key`, waiting for any other unit of work holding it, and hold it until this unit
+        of work ends. Taking a lock that is already held by this unit of work returns immediately.
+        """
+        ...
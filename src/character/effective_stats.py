@@ -0,0 +1,135 @@
+"""
+Effective stats, a character's stats with their items applied and the values that depend on them
+
+Effective stats only change when a character's level, classes, stats or items do, which the database tracks as the
+character's `sheet_version` (bumped by triggers, see migration V3). They're cached per process by character and sheet
+version, so a hot read costs one single-row query for the version and no recomputation, while hit point updates, which
+don't change the sheet version, never invalidate them.
+"""
+
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, cast
+
+import msgspec
+from litestar import Litestar
+from litestar.datastructures import State
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import Character, CharacterStats
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.metrics import record_cache_lookup
+
+# Item modifiers with this `affectedObject` add to the stat named by their `affectedValue`
+STATS_OBJECT = "stats"
+MAX_ABILITY_SCORE = 30
+
+
+class EffectiveStats(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    sheet_version: int
+    stats: CharacterStats
+    ability_modifiers: CharacterStats
+    proficiency_bonus: int
+    # Maximum hit points from the character's hit dice and constitution, taking the average roll after first level
+    derived_hit_point_max: int
+
+
+def ability_modifier(score: int) -> int:
+    return (score - 10) // 2
+
+
+def compute_effective_stats(character: Character, sheet_version: int) -> EffectiveStats:
+    """
+    Apply `character`'s item modifiers to its stats and derive the values that depend on them. The first of its classes
+    is taken to be the one it started with.
+    """
+    scores = msgspec.structs.asdict(character.stats)
+    for item in character.items:
+        modifier = item.modifier
+        if modifier.affected_object == STATS_OBJECT and modifier.affected_value in scores:
+            scores[modifier.affected_value] = min(MAX_ABILITY_SCORE, scores[modifier.affected_value] + modifier.value)
+
+    stats = CharacterStats(**scores)
+    constitution = ability_modifier(stats.constitution)
+    hit_point_max = 0
+    for index, character_class in enumerate(character.classes):
+        average_roll = character_class.hit_dice_value // 2 + 1
+        for level in range(character_class.class_level):
+            roll = character_class.hit_dice_value if index == 0 and level == 0 else average_roll
+            # Every level gains at least one hit point, however low constitution is
+            hit_point_max += max(1, roll + constitution)
+
+    return EffectiveStats(
+        sheet_version=sheet_version,
+        stats=stats,
+        ability_modifiers=CharacterStats(**{stat: ability_modifier(score) for stat, score in scores.items()}),
+        proficiency_bonus=2 + (max(1, character.level) - 1) // 4,
+        derived_hit_point_max=hit_point_max,
+    )
+
+
+class EffectiveStatsCache:
+    """
+    Least recently used cache of effective stats by character, valid only for the sheet version they were computed from
+    """
+
+    def __init__(self, max_size: int = app_config.EFFECTIVE_STATS_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[int, EffectiveStats] = OrderedDict()
+
+    def get(self, character_id: int, sheet_version: int) -> Optional[EffectiveStats]:
+        effective_stats = self._entries.get(character_id)
+        hit = effective_stats is not None and effective_stats.sheet_version == sheet_version
+        record_cache_lookup("effective_stats", hit)
+        if not hit:
+            return None
+
+        self._entries.move_to_end(character_id)
+        return effective_stats
+
+    def put(self, character_id: int, effective_stats: EffectiveStats) -> EffectiveStats:
+        self._entries[character_id] = effective_stats
+        self._entries.move_to_end(character_id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return effective_stats
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+async def get_effective_stats(
+    character_repo: CharacterRepo, effective_stats_cache: EffectiveStatsCache, character_id: int
+) -> EffectiveStats:
+    """
+    Effective stats for `character_id`, only loading and recomputing them when its sheet version has changed
+    """
+    sheet_version = await character_repo.get_sheet_version(character_id)
+    effective_stats = effective_stats_cache.get(character_id, sheet_version)
+    if effective_stats is None:
+        character = await character_repo.get_character(character_id)
+        effective_stats = effective_stats_cache.put(character_id, compute_effective_stats(character, sheet_version))
+    return effective_stats
+
+
+@asynccontextmanager
+async def effective_stats_cache(app: Litestar):
+    """
+    Creates a context manager for the per-process effective stats cache
+
+    The cache is stored within the application state.
+    """
+    cache = EffectiveStatsCache()
+    app.state.effective_stats_cache = cache
+    yield cache
+
+
+def provide_effective_stats_cache(state: State) -> EffectiveStatsCache:
+    """
+    Provides the effective stats cache stored in the application state
+    """
+    if "effective_stats_cache" not in state:
+        raise AppError("Cannot find effective stats cache in application state")
+
+    return cast(EffectiveStatsCache, state.effective_stats_cache)
@@ -0,0 +1,228 @@
+"""
+Change data capture of hit points, through a transactional outbox into an append-only log
+
+Every committed change to a character's hit points (damage, healing, temporary hit points and their expiry, long rests
+and new characters) leaves a row in its shard's `operational.hit_point_outbox`, written by a trigger in the same
+transaction, so a change is captured exactly when it commits. A relay moves the rows, oldest first, to a segmented
+append-only log on local disk at `HIT_POINT_LOG_DIR` (see `src.common.segmented_log`) as msgpack encoded
+`HitPointChange`s, syncing the log before it deletes the rows. Consumers read the log rather than polling the database.
+
+Every app process with `HIT_POINT_LOG_ENABLED` runs the relay, but only the one holding its advisory lock on shard 0
+relays, and the rest wait to take over. Only enable it on the processes sharing the disk the log lives on, but keep it
+enabled on at least one: the trigger fills the outbox whether or not anything relays it. Changes to a character are
+logged in the order they were made. A crash after syncing the log but before deleting the rows relays them again, so
+consumers should skip changes whose `(shard, outbox_id)` they have already seen.
+
+`python -m src.character.hit_point_log CONSUMER [--follow]` prints the changes the named consumer hasn't read yet as
+JSON lines, and records that it has read them.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, cast
+
+import msgspec
+from litestar import Litestar
+from psycopg import AsyncConnection
+
+from src.common import app_config
+from src.common.db import get_shard_conn_infos
+from src.common.log_config import get_logger
+from src.common.segmented_log import ConsumerOffsets, SegmentedLogReader, SegmentedLogWriter
+from src.common.utils import advisory_lock_key
+
+LOG = get_logger(__name__)
+
+RELAY_LOCK_KEY = advisory_lock_key("hit_point_log_relay")
+
+
+class HitPointChange(msgspec.Struct, frozen=True, kw_only=True, array_like=True):
+    # The shard the change was made on and its id in that shard's outbox, which together identify the change
+    shard: int
+    outbox_id: int
+    character_id: int
+    hit_point_max: int
+    current_hit_points: int
+    temporary_hit_points: Optional[int]
+    changed_at: datetime
+
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(HitPointChange)
+
+
+def decode_change(record: bytes) -> HitPointChange:
+    return _decoder.decode(record)
+
+
+async def relay_changes(conn: AsyncConnection, shard: int, log: SegmentedLogWriter, batch_size: int) -> int:
+    """
+    Move up to `batch_size` of the oldest changes in the outbox on `conn` to `log`, returning how many were moved
+    """
+    async with conn.transaction():
+        rows = await (
+            await conn.execute(
+                """
+                DELETE FROM operational.hit_point_outbox
+                WHERE id IN (SELECT id FROM operational.hit_point_outbox ORDER BY id LIMIT %(limit)s)
+                RETURNING id, character_id, hit_point_max, current_hit_points, temporary_hit_points, changed_at
+                """,
+                {"limit": batch_size},
+            )
+        ).fetchall()
+        if rows:
+            changes = (
+                HitPointChange(
+                    shard=shard,
+                    outbox_id=row[0],
+                    character_id=row[1],
+                    hit_point_max=row[2],
+                    current_hit_points=row[3],
+                    temporary_hit_points=row[4],
+                    changed_at=row[5],
+                )
+                for row in sorted(rows)
+            )
+            log.append(_encoder.encode(change) for change in changes)
+            # The changes have to be safely in the log before the outbox rows are gone
+            await asyncio.to_thread(log.sync)
+    return len(rows)
+
+
+async def _try_lock(conn: AsyncConnection) -> bool:
+    res = await (await conn.execute("SELECT pg_try_advisory_lock(%s)", (RELAY_LOCK_KEY,))).fetchone()
+    return bool(res and res[0])
+
+
+class HitPointLogRelay:
+    """
+    Relays hit point changes from every shard's outbox to the hit point log, while this process holds the relay lock
+    """
+
+    def __init__(
+        self,
+        path: Path = app_config.HIT_POINT_LOG_DIR,
+        interval: float = app_config.HIT_POINT_LOG_INTERVAL_SECONDS,
+        batch_size: int = app_config.HIT_POINT_LOG_BATCH_SIZE,
+        segment_bytes: int = app_config.HIT_POINT_LOG_SEGMENT_BYTES,
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.relaying = False
+        self.relayed = 0
+        self._stopping = False
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # psycopg can lose a cancellation that lands just as a query finishes, so the relay also checks for this
+            self._stopping = True
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await self._relay()
+            except Exception:
+                LOG.exception("Hit point log relay failed, reconnecting")
+            self.relaying = False
+            await asyncio.sleep(self.interval)
+
+    async def _relay(self) -> None:
+        conn_infos = get_shard_conn_infos()
+        async with AsyncExitStack() as stack:
+            # The lock is held for as long as this connection stays open
+            directory = await stack.enter_async_context(
+                await AsyncConnection.connect(conn_infos[0].to_conn_str(), autocommit=True)
+            )
+            while not await _try_lock(directory):
+                if self._stopping:
+                    return
+                await asyncio.sleep(self.interval)
+
+            conns = [directory] + [
+                await stack.enter_async_context(await AsyncConnection.connect(conn_info.to_conn_str(), autocommit=True))
+                for conn_info in conn_infos[1:]
+            ]
+            log = stack.enter_context(SegmentedLogWriter(self.path, self.segment_bytes))
+            self.relaying = True
+            LOG.info("Relaying hit point changes to %s from offset %s", self.path, log.next_offset)
+            while not self._stopping:
+                relayed = [await relay_changes(conn, shard, log, self.batch_size) for shard, conn in enumerate(conns)]
+                self.relayed += sum(relayed)
+                # Carry straight on while any shard has a backlog
+                if max(relayed) < self.batch_size:
+                    await asyncio.sleep(self.interval)
+
+
+@asynccontextmanager
+async def hit_point_log_relay(app: Litestar):
+    """
+    Creates a context manager for the per-process hit point log relay, which is started once migrations have run by
+    `start_hit_point_log_relay`
+
+    The relay is stored within the application state.
+    """
+    relay = HitPointLogRelay(path=app_config.HIT_POINT_LOG_DIR)
+    app.state.hit_point_log_relay = relay
+    try:
+        yield relay
+    finally:
+        await relay.stop()
+
+
+async def start_hit_point_log_relay(app: Litestar):
+    """
+    App startup function for starting the hit point log relay, when `HIT_POINT_LOG_ENABLED`
+    """
+    if app_config.HIT_POINT_LOG_ENABLED:
+        await cast(HitPointLogRelay, app.state.hit_point_log_relay).start()
+
+
+def tail(path: Path, consumer: str, follow: bool, interval: float = app_config.HIT_POINT_LOG_INTERVAL_SECONDS) -> int:
+    """
+    Print the changes `consumer` hasn't read yet as JSON lines, committing its offset after each batch, and return how
+    many were printed. With `follow`, keep waiting for more.
+    """
+    offsets = ConsumerOffsets(path / "consumers")
+    offset = offsets.get(consumer)
+    printed = 0
+    with SegmentedLogReader(path) as reader:
+        while True:
+            records = reader.read(offset, 1000)
+            if not records:
+                if not follow:
+                    return printed
+                time.sleep(interval)
+                continue
+
+            for _, record in records:
+                sys.stdout.write(msgspec.json.encode(msgspec.structs.asdict(decode_change(record))).decode() + "\n")
+            sys.stdout.flush()
+            offset = records[-1][0] + 1
+            offsets.commit(consumer, offset)
+            printed += len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print hit point changes from the hit point log")
+    parser.add_argument("consumer", help="Name the offset read up to is stored under")
+    parser.add_argument("--follow", action="store_true", help="Keep printing changes as they're logged")
+    parser.add_argument("--path", type=Path, default=app_config.HIT_POINT_LOG_DIR, help="Hit point log directory")
+    args = parser.parse_args()
+    try:
+        tail(args.path, args.consumer, args.follow)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,153 @@
+import asyncio
+import bisect
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import msgspec
+
+from src.character.exceptions import CharacterNotFoundException, CharacterRepoException
+from src.character.models import Character, CharacterHitpoints, CharacterSummary, DefenseMasks
+
+
+class InMemoryCharacterEngine:
+    """
+    Characters held in process memory, for single-node deployments and fast unit tests
+
+    Each character is stored as one frozen `Character` struct, so reads share it without copying and an update swaps
+    in a replacement. Ids are kept sorted for paging, and allocated ids skip past any inserted explicitly. Locks are
+    `asyncio.Lock`s, created on first use and dropped once nothing holds or waits on them. Work is done through
+    `session()`.
+    """
+
+    def __init__(self, characters: Optional[dict[int, Character]] = None) -> None:
+        self._characters: dict[int, Character] = dict(characters or {})
+        self._ids: list[int] = sorted(self._characters)
+        self._next_id = max(self._ids, default=0) + 1
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+        self._expiries: dict[int, datetime] = {}
+
+    def get(self, character_id: int) -> Optional[Character]:
+        return self._characters.get(character_id)
+
+    def ids_after(self, after_id: int, limit: int) -> list[int]:
+        start = bisect.bisect_right(self._ids, after_id)
+        return self._ids[start : start + limit]
+
+    def expiry(self, character_id: int) -> Optional[datetime]:
+        return self._expiries.get(character_id)
+
+    def allocate_id(self) -> int:
+        while self._next_id in self._characters:
+            self._next_id += 1
+        character_id = self._next_id
+        self._next_id += 1
+        return character_id
+
+    def lock_for(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def apply(self, writes: dict[int, Character], expiries: Optional[dict[int, Optional[datetime]]] = None) -> None:
+        for character_id, character in writes.items():
+            if character_id not in self._characters:
+                bisect.insort(self._ids, character_id)
+                self._next_id = max(self._next_id, character_id + 1)
+            self._characters[character_id] = character
+        for character_id, expire_at in (expiries or {}).items():
+            if expire_at is None:
+                self._expiries.pop(character_id, None)
+            else:
+                self._expiries[character_id] = expire_at
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator["InMemoryCharacterStorage"]:
+        """
+        Run a unit of work. Its writes are applied when the block exits cleanly and dropped if it raises, and its
+        locks are released either way.
+        """
+        storage = InMemoryCharacterStorage(self)
+        try:
+            yield storage
+            self.apply(storage.writes, storage.expiries)
+        finally:
+            storage.release_locks()
+
+
+class InMemoryCharacterStorage:
+    """
+    One unit of work against an `InMemoryCharacterEngine`. Writes are buffered until the session ends.
+    """
+
+    def __init__(self, engine: InMemoryCharacterEngine) -> None:
+        self.engine = engine
+        self.writes: dict[int, Character] = {}
+        self.expiries: dict[int, Optional[datetime]] = {}
+        self._held: dict[str, asyncio.Lock] = {}
+
+    async def get_character(self, character_id: int) -> Character:
+        character = self.writes.get(character_id) or self.engine.get(character_id)
+        if character is None:
+            raise CharacterNotFoundException(
+                f"Cannot find character for character id {character_id}", character_id=character_id
+            )
+        return character
+
+    async def get_hitpoints_and_defenses(self, character_id: int) -> tuple[CharacterHitpoints, DefenseMasks]:
+        character = await self.get_character(character_id)
+        return character.hit_points, character.defense_masks
+
+    async def update_hitpoints(self, character_id: int, hitpoints: CharacterHitpoints) -> Character:
+        character = self.writes.get(character_id) or self.engine.get(character_id)
+        if character is None:
+            raise CharacterNotFoundException(f"Cannot find character with id {character_id}", character_id=character_id)
+
+        character = msgspec.structs.replace(character, hit_points=hitpoints)
+        self.writes[character_id] = character
+        return character
+
+    async def set_temporary_hit_points_expiry(self, character_id: int, expire_at: Optional[datetime]) -> None:
+        if character_id in self.writes or self.engine.get(character_id) is not None:
+            self.expiries[character_id] = expire_at
+
+    async def insert_character(self, character: Character, character_id: Optional[int] = None) -> int:
+        if character_id is None:
+            character_id = self.engine.allocate_id()
+            # Skip ids this unit of work has already inserted explicitly
+            while character_id in self.writes:
+                character_id = self.engine.allocate_id()
+        elif character_id in self.writes or self.engine.get(character_id) is not None:
+            raise CharacterRepoException(f"Character with id {character_id} already exists")
+
+        self.writes[character_id] = character
+        return character_id
+
+    async def list_characters(self, after_id: int = 0, limit: int = 100) -> list[CharacterSummary]:
+        ids = self.engine.ids_after(after_id, limit)
+        if self.writes:
+            ids = sorted(set(ids).union(i for i in self.writes if i > after_id))[:limit]
+
+        summaries: list[CharacterSummary] = []
+        for character_id in ids:
+            character = await self.get_character(character_id)
+            summaries.append(
+                CharacterSummary(
+                    id=character_id, name=character.name, level=character.level, hit_points=character.hit_points
+                )
+            )
+        return summaries
+
+    async def lock(self, key: str) -> None:
+        if key in self._held:
+            return
+        lock = self.engine.lock_for(key)
+        await lock.acquire()
+        self._held[key] = lock
+
+    def release_locks(self) -> None:
+        for lock in self._held.values():
+            lock.release()
+        self._held.clear()
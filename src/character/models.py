@@ -1,4 +1,5 @@
-from typing import Optional
+import functools
+from typing import Annotated, Optional
 
 import msgspec
 
@@ -32,6 +33,11 @@ class Item(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
 
 
 class DamageType(str, CaseInsensitiveEnum):
+    """
+    Damage types, in the order of their bits in `DefenseMasks`. Only ever add members at the end, since the masks are
+    stored in the database (and mirrored by `operational.damage_type_bit`).
+    """
+
     BLUDGEONING = "bludgeoning"
     PIERCING = "piercing"
     SLASHING = "slashing"
@@ -46,6 +52,13 @@ class DamageType(str, CaseInsensitiveEnum):
     PSYCHIC = "psychic"
     FORCE = "force"
 
+    @property
+    def bit(self) -> int:
+        return _DAMAGE_TYPE_BITS[self]
+
+
+_DAMAGE_TYPE_BITS = {damage_type: 1 << ordinal for ordinal, damage_type in enumerate(DamageType)}
+
 
 class DefenseType(str, CaseInsensitiveEnum):
     RESISTANCE = "resistance"
@@ -57,13 +70,48 @@ class Defense(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
     defense_type: DefenseType = msgspec.field(name="defense")
 
 
+class DefenseMasks(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    """
+    A character's defenses as bitmasks of `DamageType.bit`, one mask per `DefenseType`
+    """
+
+    resistance: int = 0
+    immunity: int = 0
+
+    @classmethod
+    def from_defenses(cls, defenses: list[Defense]) -> "DefenseMasks":
+        resistance = immunity = 0
+        for defense in defenses:
+            if defense.defense_type == DefenseType.IMMUNITY:
+                immunity |= defense.damage_type.bit
+            else:
+                resistance |= defense.damage_type.bit
+        return cls(resistance=resistance, immunity=immunity)
+
+    def resolve(self, damage_type: DamageType) -> Optional[DefenseType]:
+        """
+        The defense against `damage_type`, if any. Immunity wins over resistance.
+        """
+        bit = damage_type.bit
+        if self.immunity & bit:
+            return DefenseType.IMMUNITY
+        if self.resistance & bit:
+            return DefenseType.RESISTANCE
+        return None
+
+
 class CharacterHitpoints(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
     hit_point_max: int
     current_hit_points: int
     temporary_hit_points: Optional[int] = None
 
 
-class Character(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+class CharacterHitpointsEvent(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    character_id: int
+    hit_points: CharacterHitpoints
+
+
+class Character(msgspec.Struct, frozen=True, kw_only=True, rename="camel", dict=True):
     name: str
     level: int
     hit_points: CharacterHitpoints
@@ -72,6 +120,43 @@ class Character(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
     items: list[Item]
     defenses: list[Defense]
 
+    @functools.cached_property
+    def defense_masks(self) -> DefenseMasks:
+        """
+        `defenses` as bitmasks, computed once per character
+        """
+        return DefenseMasks.from_defenses(self.defenses)
+
+
+class CharacterSummary(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    id: int
+    name: str
+    level: int
+    hit_points: CharacterHitpoints
+
+
+class CharacterSearch(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    """
+    Filters for searching characters. Characters have to match every filter given.
+    """
+
+    immune_to: list[DamageType] = []
+    resistant_to: list[DamageType] = []
+    # Values an item's modifier affects, e.g. `constitution`
+    item_affects: list[str] = []
+    class_name: Optional[str] = None
+    # Levels in `class_name`
+    min_class_level: Optional[int] = None
+    min_level: Optional[int] = None
+
+
+class CharacterSearchPage(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    character_ids: list[int]
+    # Only included when asked for
+    characters: Optional[list[CharacterSummary]] = None
+    # The `afterId` of the next page, unless this is the last one
+    next_after_id: Optional[int] = None
+
 
 class DealDamageRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
     amount: int
@@ -84,3 +169,42 @@ class HealRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
 
 class AssignTemporaryHitPointsRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
     amount: int
+    # Temporary hit points last until they're used up when no duration is given
+    duration_seconds: Optional[Annotated[int, msgspec.Meta(gt=0)]] = None
+
+
+class ImportCharactersRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    characters: Annotated[list[Character], msgspec.Meta(min_length=1)]
+
+
+class LongRestRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    character_ids: Annotated[list[int], msgspec.Meta(min_length=1)]
+
+
+class Party(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    id: int
+    name: str
+
+
+class CreatePartyRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    name: Annotated[str, msgspec.Meta(min_length=1)]
+
+
+class PartyMembersRequest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    character_ids: Annotated[list[int], msgspec.Meta(min_length=1)]
+
+
+class PartyRollup(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    """
+    Hit point totals across the members of a party
+    """
+
+    party_id: int
+    member_count: int
+    hit_point_max: int
+    current_hit_points: int
+    temporary_hit_points: int
+    # Members at 0 hit points
+    downed_count: int
+    # Mean of the members' current hit points as a percentage of their maximum, if the party has any members
+    average_hit_point_percentage: Optional[float]
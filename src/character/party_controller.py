@@ -0,0 +1,60 @@
+from litestar import Controller, delete, get, post, put
+from litestar.exceptions import NotFoundException
+from litestar.status_codes import HTTP_200_OK
+
+from src.character.models import CreatePartyRequest, Party, PartyMembersRequest, PartyRollup
+from src.character.party_repo import PartyRepo
+from src.common.admission import AdmissionControlMiddleware
+
+
+class PartyController(Controller):
+    path = "/party"
+    middleware = [AdmissionControlMiddleware]
+
+    @staticmethod
+    async def _get_party(party_repo: PartyRepo, id: int) -> Party:
+        if party := await party_repo.get_party(id):
+            return party
+        raise NotFoundException(f"Party id {id} not found")
+
+    @post()
+    async def create_party(self, data: CreatePartyRequest, party_repo: PartyRepo) -> Party:
+        """
+        Create an empty party
+        """
+        return await party_repo.create_party(data.name)
+
+    @get("/{id:int}")
+    async def get_party(self, id: int, party_repo: PartyRepo) -> Party:
+        """
+        Retrieve a party
+        """
+        return await self._get_party(party_repo, id)
+
+    @get("/{id:int}/rollup")
+    async def get_party_rollup(self, id: int, party_repo: PartyRepo) -> PartyRollup:
+        """
+        Retrieve the party's hit point totals, the number of members at 0 hit points and their average hit point
+        percentage, without loading its members
+        """
+        await self._get_party(party_repo, id)
+        return await party_repo.get_rollup(id)
+
+    @put("/{id:int}/members")
+    async def add_party_members(self, id: int, data: PartyMembersRequest, party_repo: PartyRepo) -> PartyRollup:
+        """
+        Add characters to the party, moving them out of any party they were in, and return its new rollup. Characters
+        that don't exist are skipped.
+        """
+        await self._get_party(party_repo, id)
+        await party_repo.add_members(id, data.character_ids)
+        return await party_repo.get_rollup(id)
+
+    @delete("/{id:int}/members/{character_id:int}", status_code=HTTP_200_OK)
+    async def remove_party_member(self, id: int, character_id: int, party_repo: PartyRepo) -> PartyRollup:
+        """
+        Take a character out of the party, and return its new rollup
+        """
+        await self._get_party(party_repo, id)
+        await party_repo.remove_members(id, [character_id])
+        return await party_repo.get_rollup(id)
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Any, Optional
+
+import msgspec
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import Party, PartyRollup
+from src.common.pool import acquire
+from src.common.sharding import ShardRouter
+from src.common.utils import dict_row_camel
+
+
+class PartyRepo:
+    """
+    Parties and their hit point rollups. Parties live on the directory shard, while their members and each shard's share
+    of their rollups live on the members' shards. See `src.character.party_rollups`.
+    """
+
+    def __init__(self, shards: ShardRouter) -> None:
+        self.shards = shards
+
+    async def create_party(self, name: str) -> Party:
+        async with acquire(self.shards.directory) as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                res = await (
+                    await cur.execute(
+                        "INSERT INTO operational.party (name) VALUES (%(name)s) RETURNING id, name", {"name": name}
+                    )
+                ).fetchall()
+        return msgspec.convert(res[0], Party)
+
+    async def get_party(self, party_id: int) -> Optional[Party]:
+        async with acquire(self.shards.directory) as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                res = await (
+                    await cur.execute("SELECT id, name FROM operational.party WHERE id = %(id)s", {"id": party_id})
+                ).fetchall()
+        return msgspec.convert(res[0], Party) if res else None
+
+    async def _update_shard_members(
+        self, pool: AsyncConnectionPool, party_id: int, character_ids: list[int], joining: bool
+    ) -> list[int]:
+        async with acquire(pool) as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                repo = CharacterRepo(cur)
+                if joining:
+                    return await repo.set_party(character_ids, party_id)
+                return await repo.leave_party(character_ids, party_id)
+
+    async def _update_members(self, party_id: int, character_ids: list[int], joining: bool) -> list[int]:
+        results = await asyncio.gather(
+            *(
+                self._update_shard_members(self.shards.pools[shard], party_id, ids, joining)
+                for shard, ids in self.shards.group_by_shard(character_ids).items()
+            )
+        )
+        return sorted(character_id for result in results for character_id in result)
+
+    async def add_members(self, party_id: int, character_ids: list[int]) -> list[int]:
+        """
+        Move the characters in `character_ids` into the party, out of any party they were in, with one transaction per
+        shard, and return the ids of those that exist
+        """
+        return await self._update_members(party_id, character_ids, joining=True)
+
+    async def remove_members(self, party_id: int, character_ids: list[int]) -> list[int]:
+        """
+        Take the characters in `character_ids` out of the party, and return the ids of those that were in it
+        """
+        return await self._update_members(party_id, character_ids, joining=False)
+
+    async def _get_shard_rollup(self, pool: AsyncConnectionPool, party_id: int) -> Optional[dict[str, Any]]:
+        async with acquire(pool) as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                return await (
+                    await cur.execute(
+                        """
+                        SELECT member_count,
+                            hit_point_max,
+                            current_hit_points,
+                            temporary_hit_points,
+                            downed_count,
+                            hit_point_percentage_sum
+                        FROM operational.party_rollup
+                        WHERE party_id = %(party_id)s
+                        """,
+                        {"party_id": party_id},
+                    )
+                ).fetchone()
+
+    async def get_rollup(self, party_id: int) -> PartyRollup:
+        """
+        The party's hit point totals, adding up each shard's share of them with one lookup per shard
+        """
+        shares = [
+            share
+            for share in await asyncio.gather(*(self._get_shard_rollup(pool, party_id) for pool in self.shards.pools))
+            if share
+        ]
+        totals = {
+            key: sum(share[key] for share in shares)
+            for key in ("memberCount", "hitPointMax", "currentHitPoints", "temporaryHitPoints", "downedCount")
+        }
+        percentage_sum = sum(share["hitPointPercentageSum"] for share in shares)
+        return PartyRollup(
+            party_id=party_id,
+            member_count=totals["memberCount"],
+            hit_point_max=totals["hitPointMax"],
+            current_hit_points=totals["currentHitPoints"],
+            temporary_hit_points=totals["temporaryHitPoints"],
+            downed_count=totals["downedCount"],
+            average_hit_point_percentage=(
+                round(float(percentage_sum / totals["memberCount"]), 2) if totals["memberCount"] else None
+            ),
+        )
@@ -0,0 +1,238 @@
+"""
+Party hit point rollups, and consistency checks and repairs for them
+
+Characters can belong to a party (see `PartyRepo`). Each shard keeps its share of every party's hit point totals in
+`operational.party_rollup`, updated by triggers in the same transaction as any change to a member's hit points or to
+who's in the party (see migration V9). A party's rollup is then read with one primary key lookup per shard, rather than
+loading every member.
+
+Anything that writes with triggers disabled, such as a bulk load with `session_replication_role = replica`, or edits a
+rollup by hand leaves it out of date. Every `PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS`, a `PartyRollupReconciler` in
+one of the app's processes checks every shard's rollups against their members and rebuilds any that drifted, logging a
+warning since drift means something bypassed the triggers. Run `python -m src.character.party_rollups` to check by
+hand, and pass `--repair` to rebuild the rollups found drifted (or `--rebuild` to rebuild every rollup).
+"""
+
+import argparse
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from typing import Optional, cast
+
+from litestar import Litestar
+from litestar.datastructures import State
+from psycopg import AsyncConnection
+
+from src.common import app_config
+from src.common.db import get_shard_conn_infos
+from src.common.log_config import get_logger
+from src.common.pool import acquire
+from src.common.sharding import ShardRouter
+from src.common.utils import advisory_lock_key
+
+LOG = get_logger(__name__)
+
+RECONCILE_LOCK_KEY = advisory_lock_key("party_rollup_reconciler")
+
+# The next `limit` parties after `after_id` with members or a rollup on a shard, walking the party id index of each
+_PARTY_IDS = """
+SELECT party_id
+FROM (
+    (
+        SELECT DISTINCT party_id FROM operational.character WHERE party_id > %(after_id)s
+        ORDER BY party_id LIMIT %(limit)s
+    )
+    UNION
+    (SELECT party_id FROM operational.party_rollup WHERE party_id > %(after_id)s ORDER BY party_id LIMIT %(limit)s)
+) parties
+ORDER BY party_id
+LIMIT %(limit)s
+"""
+
+
+async def check_rollups(conn: AsyncConnection, batch_size: int = app_config.PARTY_ROLLUP_BATCH_SIZE) -> list[int]:
+    """
+    Compare the rollup of every party with members or a rollup on this shard with the one its members build, a batch of
+    parties at a time, and return the ids of those that differ. Each batch reads the rollups and members at the same
+    point in time, so changes committed meanwhile are never mistaken for drift.
+    """
+    drifted: list[int] = []
+    after_id = 0
+    while True:
+        res = await (
+            await conn.execute(
+                f"""
+                SELECT p.party_id,
+                    (
+                        coalesce(r.member_count, 0),
+                        coalesce(r.hit_point_max, 0),
+                        coalesce(r.current_hit_points, 0),
+                        coalesce(r.temporary_hit_points, 0),
+                        coalesce(r.downed_count, 0),
+                        coalesce(r.hit_point_percentage_sum, 0)
+                    ) IS DISTINCT FROM (
+                        b.member_count,
+                        b.hit_point_max,
+                        b.current_hit_points,
+                        b.temporary_hit_points,
+                        b.downed_count,
+                        b.hit_point_percentage_sum
+                    ) AS drifted
+                FROM ({_PARTY_IDS}) p
+                CROSS JOIN LATERAL operational.build_party_rollup(p.party_id) b
+                LEFT JOIN operational.party_rollup r ON r.party_id = p.party_id
+                ORDER BY p.party_id
+                """,
+                {"after_id": after_id, "limit": batch_size},
+            )
+        ).fetchall()
+        await conn.commit()
+        if not res:
+            return drifted
+
+        drifted += [party_id for party_id, is_drifted in res if is_drifted]
+        after_id = res[-1][0]
+
+
+async def rebuild_rollups(
+    conn: AsyncConnection,
+    party_ids: Optional[list[int]] = None,
+    batch_size: int = app_config.PARTY_ROLLUP_BATCH_SIZE,
+) -> int:
+    """
+    Rebuild the rollups of `party_ids` from their members, or of every party with members or a rollup on this shard
+    when not given, a batch at a time. Returns how many parties were rebuilt.
+    """
+    rebuilt = 0
+    after_id = 0
+    while True:
+        if party_ids is None:
+            res = await (await conn.execute(_PARTY_IDS, {"after_id": after_id, "limit": batch_size})).fetchall()
+            batch = [row[0] for row in res]
+        else:
+            batch = party_ids[rebuilt : rebuilt + batch_size]
+        if not batch:
+            return rebuilt
+
+        # In id order, the order the triggers lock rollups in
+        await conn.execute(
+            "SELECT operational.refresh_party_rollup(id) FROM unnest(%(ids)s::int[]) AS id ORDER BY id", {"ids": batch}
+        )
+        await conn.commit()
+        rebuilt += len(batch)
+        after_id = batch[-1]
+
+
+class PartyRollupReconciler:
+    """
+    Periodically checks the party rollups of every shard in the application state, rebuilding any that drifted. Only one
+    process reconciles a shard at a time.
+    """
+
+    def __init__(self, state: State, interval: float = app_config.PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS) -> None:
+        self.state = state
+        self.interval = interval
+        # Rounds run, and rollups found drifted and rebuilt
+        self.reconciles = 0
+        self.repaired = 0
+        self._stopping = False
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def reconcile(self) -> int:
+        """
+        Check every shard, skipping any another process is already checking, and return how many rollups were rebuilt
+        """
+        shards = cast(Optional[ShardRouter], self.state.get("shards"))
+        if not shards:
+            return 0
+
+        repaired = 0
+        for shard, pool in enumerate(shards.pools):
+            async with acquire(pool) as conn:
+                res = await (await conn.execute("SELECT pg_try_advisory_lock(%s)", (RECONCILE_LOCK_KEY,))).fetchone()
+                await conn.commit()
+                if not (res and res[0]):
+                    continue
+                try:
+                    if drifted := await check_rollups(conn):
+                        LOG.warning("Rebuilding %s drifted party rollups on shard %s: %s", len(drifted), shard, drifted)
+                        repaired += await rebuild_rollups(conn, drifted)
+                finally:
+                    await conn.rollback()
+                    await conn.execute("SELECT pg_advisory_unlock(%s)", (RECONCILE_LOCK_KEY,))
+                    await conn.commit()
+
+        self.reconciles += 1
+        self.repaired += repaired
+        return repaired
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # psycopg can lose a cancellation that lands just as a query finishes, so the loop also checks for this
+            self._stopping = True
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                LOG.exception("Party rollup reconciliation failed")
+
+
+@asynccontextmanager
+async def party_rollup_reconciler(app: Litestar):
+    """
+    Creates a context manager for the per-process party rollup reconciler, which is started once the shards are loaded
+    by `start_party_rollup_reconciler`
+
+    The reconciler is stored within the application state.
+    """
+    reconciler = PartyRollupReconciler(app.state)
+    app.state.party_rollup_reconciler = reconciler
+    try:
+        yield reconciler
+    finally:
+        await reconciler.stop()
+
+
+async def start_party_rollup_reconciler(app: Litestar):
+    """
+    App startup function for reconciling party rollups in the background, unless
+    `PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS` is 0
+    """
+    if app_config.PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS > 0:
+        await cast(PartyRollupReconciler, app.state.party_rollup_reconciler).start()
+
+
+async def main(args: argparse.Namespace) -> int:
+    drifted = 0
+    for shard, conn_info in enumerate(get_shard_conn_infos()):
+        async with await AsyncConnection.connect(conn_info.to_conn_str()) as conn:
+            if args.rebuild:
+                LOG.info("Rebuilt %s party rollups on shard %s", await rebuild_rollups(conn), shard)
+                continue
+
+            party_ids = await check_rollups(conn)
+            LOG.info("Shard %s: %s drifted party rollups", shard, len(party_ids))
+            if party_ids:
+                LOG.info("Drifted: %s", party_ids[:100])
+            if args.repair:
+                await rebuild_rollups(conn, party_ids)
+            else:
+                drifted += len(party_ids)
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and repair party hit point rollups")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--repair", action="store_true", help="Rebuild the rollups found drifted")
+    mode.add_argument("--rebuild", action="store_true", help="Rebuild every rollup without checking")
+    sys.exit(asyncio.run(main(parser.parse_args())))
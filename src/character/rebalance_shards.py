@@ -0,0 +1,123 @@
+"""
+Rebalance character buckets across the configured shards
+
+Run with `python -m src.character.rebalance_shards [--dry-run]` after adding shards to `DB_EXTRA_SHARDS`. Every bucket
+whose owner differs from the even spread for the current shard count is copied to its new shard, the shard map is
+updated, and the bucket is removed from its old shard. Running app processes load the shard map at startup, so restart
+them once rebalancing finishes.
+"""
+
+import argparse
+import asyncio
+from contextlib import AsyncExitStack
+
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.common import app_config
+from src.common.db import get_shard_conn_infos
+from src.common.log_config import get_logger
+from src.common.sharding import ShardMap, ShardRouter, load_shard_map
+from src.common.utils import dict_row_camel
+
+LOG = get_logger(__name__)
+
+
+async def move_bucket(shards: ShardRouter, bucket: int, source: int, dest: int) -> int:
+    """
+    Move every character in `bucket` from shard `source` to shard `dest`, returning the number of characters moved
+
+    Safe to re-run after a failure: characters are removed from `dest` before being copied, and only removed from
+    `source` once the shard map points at `dest`.
+    """
+    moved = 0
+    async with AsyncExitStack() as stack:
+        source_conn = await stack.enter_async_context(shards.pools[source].connection())
+        dest_conn = await stack.enter_async_context(shards.pools[dest].connection())
+        source_repo = CharacterRepo(await stack.enter_async_context(source_conn.cursor(row_factory=dict_row_camel)))
+        dest_repo = CharacterRepo(await stack.enter_async_context(dest_conn.cursor(row_factory=dict_row_camel)))
+
+        while character_ids := await source_repo.list_character_ids(
+            bucket_count=len(shards.shard_map.assignments), bucket=bucket, for_update=True
+        ):
+            characters = await source_repo.get_characters(character_ids)
+            party_ids = await source_repo.get_party_ids(character_ids)
+            expiries = await source_repo.get_temporary_hit_points_expiries(character_ids)
+            await dest_repo.delete_characters(character_ids)
+            for character_id, character in characters.items():
+                await dest_repo.insert_character(character, character_id=character_id)
+            # Characters are inserted without an expiry, which would leave their temporary hit points forever. Workers
+            # pick the moved expiries up from `dest` when they restart after rebalancing.
+            for character_id, expire_at in expiries.items():
+                await dest_repo.set_temporary_hit_points_expiry(character_id, expire_at)
+            # Party members bring their hit points to their party's rollup on `dest`, and take them away from its
+            # rollup on `source` when they're removed from there
+            members: dict[int, list[int]] = {}
+            for character_id, party_id in party_ids.items():
+                members.setdefault(party_id, []).append(character_id)
+            for party_id, member_ids in sorted(members.items()):
+                await dest_repo.set_party(member_ids, party_id)
+            await dest_conn.commit()
+
+            async with shards.directory.connection() as directory:
+                await directory.execute(
+                    "UPDATE operational.shard_map SET shard = %(shard)s WHERE bucket = %(bucket)s",
+                    {"shard": dest, "bucket": bucket},
+                )
+
+            await source_repo.delete_characters(character_ids)
+            await source_conn.commit()
+            moved += len(character_ids)
+
+        async with shards.directory.connection() as directory:
+            await directory.execute(
+                "UPDATE operational.shard_map SET shard = %(shard)s WHERE bucket = %(bucket)s",
+                {"shard": dest, "bucket": bucket},
+            )
+
+    return moved
+
+
+async def rebalance_shards(shards: ShardRouter, target: ShardMap, dry_run: bool = False) -> dict[int, tuple[int, int]]:
+    """
+    Move every bucket whose owner differs between the current shard map and `target`
+
+    Returns the moves as `{bucket: (source shard, destination shard)}`.
+    """
+    moves = {
+        bucket: (source, dest)
+        for bucket, (source, dest) in enumerate(zip(shards.shard_map.assignments, target.assignments))
+        if source != dest
+    }
+    LOG.info("Rebalancing %s of %s buckets across %s shards", len(moves), len(target.assignments), len(shards.pools))
+    if dry_run:
+        return moves
+
+    for bucket, (source, dest) in moves.items():
+        moved = await move_bucket(shards, bucket, source, dest)
+        LOG.info("Moved %s characters in bucket %s from shard %s to shard %s", moved, bucket, source, dest)
+
+    shards.shard_map = target
+    return moves
+
+
+async def main(dry_run: bool):
+    conn_infos = get_shard_conn_infos()
+    async with AsyncExitStack() as stack:
+        pools = [
+            await stack.enter_async_context(AsyncConnectionPool(conn_info.to_conn_str())) for conn_info in conn_infos
+        ]
+        async with pools[0].connection() as conn:
+            shard_map = await load_shard_map(conn, len(pools))
+
+        await rebalance_shards(
+            ShardRouter(pools, shard_map),
+            ShardMap.default(len(pools), app_config.SHARD_BUCKET_COUNT),
+            dry_run=dry_run,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebalance character buckets across shards")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the buckets that would move")
+    asyncio.run(main(dry_run=parser.parse_args().dry_run))
@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+from typing import AsyncIterator, Iterable, Optional, cast
+
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import Character, CharacterSearch, CharacterSearchPage, CharacterSummary
+from src.common.sharding import ShardRouter
+from src.common.utils import dict_row_camel
+
+
+class ShardedCharacterRepo:
+    """
+    Character operations that span shards. Each shard is queried through its own `CharacterRepo`, concurrently.
+    """
+
+    def __init__(self, shards: ShardRouter) -> None:
+        self.shards = shards
+
+    async def _get_shard_characters(self, pool: AsyncConnectionPool, character_ids: list[int]):
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                return await CharacterRepo(cur).get_characters(character_ids)
+
+    async def get_characters(self, character_ids: Iterable[int]) -> dict[int, Character]:
+        """
+        Load many characters with one batch of queries per shard that owns any of them
+        """
+        results = await asyncio.gather(
+            *(
+                self._get_shard_characters(self.shards.pools[shard], ids)
+                for shard, ids in self.shards.group_by_shard(character_ids).items()
+            )
+        )
+        return {character_id: character for result in results for character_id, character in result.items()}
+
+    async def _list_shard_characters(self, pool: AsyncConnectionPool, after_id: int, limit: int):
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                return await CharacterRepo(cur).list_characters(after_id=after_id, limit=limit)
+
+    async def list_characters(self, after_id: int = 0, limit: int = 100) -> list[CharacterSummary]:
+        """
+        List characters across every shard ordered by id, starting after `after_id`
+        """
+        pages = await asyncio.gather(
+            *(self._list_shard_characters(pool, after_id, limit) for pool in self.shards.pools)
+        )
+        return list(heapq.merge(*pages, key=lambda c: c.id))[:limit]
+
+    async def _search_shard(
+        self, pool: AsyncConnectionPool, search: CharacterSearch, after_id: int, limit: int, summaries: bool
+    ) -> list[CharacterSummary] | list[int]:
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                repo = CharacterRepo(cur)
+                if summaries:
+                    return await repo.search_characters(search, after_id=after_id, limit=limit)
+                return await repo.search_character_ids(search, after_id=after_id, limit=limit)
+
+    async def search_characters(
+        self, search: CharacterSearch, after_id: int = 0, limit: int = 100, summaries: bool = False
+    ) -> CharacterSearchPage:
+        """
+        Search characters across every shard in id order, starting after `after_id`, with their summaries if asked for
+        """
+        pages = await asyncio.gather(
+            *(self._search_shard(pool, search, after_id, limit, summaries) for pool in self.shards.pools)
+        )
+        characters: Optional[list[CharacterSummary]] = None
+        if summaries:
+            characters = list(heapq.merge(*cast(list[list[CharacterSummary]], pages), key=lambda c: c.id))[:limit]
+            character_ids = [c.id for c in characters]
+        else:
+            character_ids = list(heapq.merge(*cast(list[list[int]], pages)))[:limit]
+        return CharacterSearchPage(
+            character_ids=character_ids,
+            characters=characters,
+            next_after_id=character_ids[-1] if len(character_ids) == limit else None,
+        )
+
+    async def export_characters(self, batch_size: int = 100) -> AsyncIterator[tuple[int, Character]]:
+        """
+        Stream every character across every shard in id order, one page of `batch_size` at a time
+        """
+        after_id = 0
+        while page := await self.list_characters(after_id=after_id, limit=batch_size):
+            characters = await self.get_characters(c.id for c in page)
+            for summary in page:
+                if character := characters.get(summary.id):
+                    yield summary.id, character
+            after_id = page[-1].id
+
+    async def insert_character(self, character: Character) -> int:
+        """
+        Insert `character` on the shard that owns a freshly allocated, globally unique id
+        """
+        character_id = await self.shards.allocate_character_id()
+        async with self.shards.pool_for(character_id).connection() as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                return await CharacterRepo(cur).insert_character(character, character_id=character_id)
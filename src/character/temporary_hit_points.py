@@ -0,0 +1,136 @@
+"""
+Expiry of temporary hit points assigned with a duration
+
+Each worker keeps the expiries it knows about in a `TimerWheel`, ticking every
+`TEMPORARY_HIT_POINTS_EXPIRY_TICK_SECONDS`. The characters whose temporary hit points expire in the same tick are
+cleared together, with one UPDATE per shard that also publishes their new hit points to live subscribers. Expiry times
+are stored with the hit points, and every worker reloads all pending expiries on startup, so none are lost to a restart.
+
+The UPDATE only clears temporary hit points whose stored expiry has passed, which makes a timer that fires late, twice
+(from several workers) or after its expiry was moved or cleared harmless.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional, cast
+
+from litestar import Litestar
+from litestar.datastructures import State
+
+from src.character.character_repo import CharacterRepo
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.log_config import get_logger
+from src.common.pool import acquire
+from src.common.sharding import ShardRouter
+from src.common.timer_wheel import TimerWheel
+from src.common.utils import dict_row_camel
+
+LOG = get_logger(__name__)
+
+
+class TemporaryHitPointsExpiry:
+    """
+    Schedules and runs temporary hit point expiries for the characters on every shard
+    """
+
+    def __init__(self, tick: float = app_config.TEMPORARY_HIT_POINTS_EXPIRY_TICK_SECONDS) -> None:
+        self.wheel: TimerWheel[int] = TimerWheel(tick, now=time.time())
+        self.expired = 0
+        self._shards: Optional[ShardRouter] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def schedule(self, character_id: int, expire_at: datetime) -> None:
+        self.wheel.schedule(character_id, expire_at.timestamp())
+
+    async def restore(self, shards: ShardRouter) -> int:
+        """
+        Schedule every pending expiry stored on `shards`, returning how many there were
+        """
+        restored = 0
+        for pool in shards.pools:
+            async with acquire(pool) as conn:
+                async with conn.cursor(row_factory=dict_row_camel) as cur:
+                    for character_id, expire_at in await CharacterRepo(cur).list_temporary_hit_points_expiries():
+                        self.schedule(character_id, expire_at)
+                        restored += 1
+        return restored
+
+    async def expire(self, character_ids: list[int]) -> list[int]:
+        """
+        Clear the temporary hit points of the characters in `character_ids` that have expired, with one UPDATE per shard
+        """
+        if self._shards is None:
+            raise AppError("Temporary hit point expiry hasn't been started")
+
+        now = datetime.now(timezone.utc)
+        expired: list[int] = []
+        for shard, shard_character_ids in self._shards.group_by_shard(character_ids).items():
+            async with acquire(self._shards.pools[shard]) as conn:
+                async with conn.cursor(row_factory=dict_row_camel) as cur:
+                    expired += await CharacterRepo(cur).expire_temporary_hit_points(shard_character_ids, now)
+        self.expired += len(expired)
+        return expired
+
+    async def start(self, shards: ShardRouter) -> None:
+        self._shards = shards
+        restored = await self.restore(shards)
+        LOG.info("Restored %s temporary hit point expiries", restored)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        tick = self.wheel.tick
+        while True:
+            # Wake at the start of each tick
+            await asyncio.sleep(tick - time.time() % tick)
+            now = time.time()
+            due = self.wheel.advance(now)
+            if not due:
+                continue
+
+            try:
+                await self.expire(due)
+            except Exception:
+                LOG.exception("Failed to expire temporary hit points for %s characters, retrying next tick", len(due))
+                for character_id in due:
+                    self.wheel.schedule(character_id, now)
+
+
+@asynccontextmanager
+async def temporary_hit_points_expiry(app: Litestar):
+    """
+    Creates a context manager for the per-process temporary hit point expiry scheduler, which is started once the
+    shards are loaded by `start_temporary_hit_points_expiry`
+
+    The scheduler is stored within the application state.
+    """
+    expiry = TemporaryHitPointsExpiry()
+    app.state.temporary_hit_points_expiry = expiry
+    try:
+        yield expiry
+    finally:
+        await expiry.stop()
+
+
+async def start_temporary_hit_points_expiry(app: Litestar):
+    """
+    App startup function for restoring pending expiries and starting the scheduler, once the shards are loaded
+    """
+    await cast(TemporaryHitPointsExpiry, app.state.temporary_hit_points_expiry).start(app.state.shards)
+
+
+def provide_temporary_hit_points_expiry(state: State) -> TemporaryHitPointsExpiry:
+    """
+    Provides the temporary hit point expiry scheduler stored in the application state
+    """
+    if "temporary_hit_points_expiry" not in state:
+        raise AppError("Cannot find temporary hit point expiry scheduler in application state")
+
+    return cast(TemporaryHitPointsExpiry, state.temporary_hit_points_expiry)
@@ -0,0 +1,71 @@
+from litestar import Controller, Response, delete, get, put
+from litestar.datastructures import State
+from litestar.enums import MediaType
+from litestar.exceptions import PermissionDeniedException
+
+from src.common import app_config
+from src.common.admission import AdmissionController, LimiterStatus
+from src.common.db import get_all_pool_stats
+from src.common.pool import PoolStats
+from src.common.profiling import ProfilingSettings, ProfilingStatus, RequestProfiler
+from src.common.query_tracing import QueryReport, recent_reports
+
+
+class AdminController(Controller):
+    path = "/admin"
+
+    @get("/pool-stats")
+    async def pool_stats(self, state: State) -> list[PoolStats]:
+        """
+        Report size, waiters and acquire latency for every database connection pool
+        """
+        return get_all_pool_stats(state)
+
+    @get("/admission")
+    async def admission(self, admission_controller: AdmissionController) -> list[LimiterStatus]:
+        """
+        Report the concurrency limit, queue and latency of each admission control route class
+        """
+        return admission_controller.status()
+
+    @get("/query-reports")
+    async def query_reports(self) -> list[QueryReport]:
+        """
+        Report the queries run by the most recent requests, newest first. Only populated with `QUERY_TRACING_ENABLED`.
+        """
+        return list(reversed(recent_reports))
+
+    @get("/profiling")
+    async def get_profiling(self, request_profiler: RequestProfiler) -> ProfilingStatus:
+        """
+        Report the request profiler's sample rate and how much it has collected
+        """
+        return request_profiler.status()
+
+    @put("/profiling")
+    async def set_profiling(self, data: ProfilingSettings, request_profiler: RequestProfiler) -> ProfilingStatus:
+        """
+        Set the fraction of requests to profile. Requires `PROFILING_ENABLED`.
+        """
+        if not app_config.PROFILING_ENABLED:
+            raise PermissionDeniedException("Profiling is disabled, set PROFILING_ENABLED to allow it")
+
+        request_profiler.sample_rate = data.sample_rate
+        return request_profiler.status()
+
+    @get("/profiling/stacks", media_type=MediaType.TEXT)
+    async def get_profiling_stacks(self, request_profiler: RequestProfiler) -> Response[str]:
+        """
+        Download the profiled requests' samples as collapsed stacks, one `frame;frame;frame count` line per stack
+        """
+        return Response(
+            request_profiler.collapsed_stacks(),
+            headers={"Content-Disposition": 'attachment; filename="stacks.collapsed"'},
+        )
+
+    @delete("/profiling/stacks")
+    async def clear_profiling_stacks(self, request_profiler: RequestProfiler) -> None:
+        """
+        Discard the samples collected so far
+        """
+        request_profiler.clear()
@@ -0,0 +1,265 @@
+"""
+Admission control, shedding load before it queues for database connections
+
+Requests to database backed routes are split into two route classes, reads (`GET` and `HEAD`) and mutations, each with
+its own concurrency limit and bounded queue, so a burst of one can't starve the other. A request that finds its class at
+its limit waits in the queue for up to `ADMISSION_QUEUE_TIMEOUT_SECONDS`. When the queue is full, or the wait times out,
+it gets an immediate 503 with a `Retry-After` header instead of waiting on the pool for
+`DB_POOL_ACQUIRE_TIMEOUT_SECONDS`.
+
+Each limit adapts to the latency of the requests it admits, which for these routes is almost all database time. A slowly
+moving average of latency is the baseline and a quickly moving one the current latency. While current latency stays
+within `ADMISSION_LATENCY_TOLERANCE` times the baseline the limit grows, and as the database saturates and latency rises
+past it the limit shrinks in proportion, down to `ADMISSION_MIN_LIMIT`. This is the gradient algorithm of Netflix's
+concurrency-limits library.
+
+Admission control only applies to the controllers it's added to as middleware, so `/health`, metrics, admin and live
+event routes are never shed.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Optional, cast
+
+import msgspec
+from litestar import Litestar, Request
+from litestar.datastructures import State
+from litestar.enums import ScopeType
+from litestar.status_codes import HTTP_503_SERVICE_UNAVAILABLE
+from litestar.types import ASGIApp, Receive, Scope, Send
+from prometheus_client import Counter, Gauge
+
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.exceptions import ExceptionResponse, ExceptionResponseBody
+
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections",
+    "Requests shed by admission control, by route class and reason (queue_full or queue_timeout)",
+    ["route_class", "reason"],
+)
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit, by route class",
+    ["route_class"],
+    multiprocess_mode="liveall",
+)
+
+
+class RouteClass(Enum):
+    READ = "read"
+    MUTATION = "mutation"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class LimiterStatus(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    route_class: str
+    limit: int
+    in_flight: int
+    queued: int
+    baseline_latency_ms: float
+    current_latency_ms: float
+    rejected: int
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with a bounded FIFO queue, adapting the limit to the latency of admitted requests
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = app_config.ADMISSION_INITIAL_LIMIT,
+        min_limit: int = app_config.ADMISSION_MIN_LIMIT,
+        max_limit: int = app_config.ADMISSION_MAX_LIMIT,
+        max_queue: int = app_config.ADMISSION_MAX_QUEUE,
+        queue_timeout: float = app_config.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        tolerance: float = app_config.ADMISSION_LATENCY_TOLERANCE,
+    ) -> None:
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.rejected = 0
+        # Kept fractional so that small adjustments add up, `limit` rounds it
+        self._limit = float(initial_limit)
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._baseline: Optional[float] = None
+        self._current: Optional[float] = None
+        ADMISSION_LIMIT.labels(name).set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, round(self._limit))
+
+    async def acquire(self) -> None:
+        """
+        Wait for a slot, raising `AdmissionRejected` if the queue is full or the wait times out
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            # A slot may have been handed over just as the wait ended
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            if isinstance(e, TimeoutError):
+                self._reject("queue_timeout")
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        """
+        Give up a slot, handing it straight to the longest waiting request if the limit allows
+        """
+        if self.in_flight <= self.limit and self._hand_over():
+            return
+        self.in_flight -= 1
+
+    def _hand_over(self) -> bool:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        if app_config.METRICS_ENABLED:
+            ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        raise AdmissionRejected(reason)
+
+    def observe(self, latency: float) -> None:
+        """
+        Adjust the limit to the latency of a request that was admitted
+        """
+        if self._baseline is None or self._current is None:
+            self._baseline = self._current = latency
+            return
+
+        self._current += (latency - self._current) * 0.1
+        self._baseline += (latency - self._baseline) * 0.01
+        # Latency that stays far below the baseline means the baseline was measured under load, so let it catch up
+        if self._baseline > 2 * self._current:
+            self._baseline = (self._baseline + self._current) / 2
+
+        gradient = max(0.5, min(1.0, self.tolerance * self._baseline / self._current))
+        # The square root of the limit allows for some queueing, letting the limit grow while latency is steady
+        target = self._limit * gradient + math.sqrt(self._limit)
+        self._limit = min(float(self.max_limit), max(float(self.min_limit), 0.8 * self._limit + 0.2 * target))
+        ADMISSION_LIMIT.labels(self.name).set(self.limit)
+
+        # A higher limit admits requests that are already waiting
+        while self.in_flight < self.limit and self._hand_over():
+            self.in_flight += 1
+
+    def status(self) -> LimiterStatus:
+        return LimiterStatus(
+            route_class=self.name,
+            limit=self.limit,
+            in_flight=self.in_flight,
+            queued=len(self._waiters),
+            baseline_latency_ms=(self._baseline or 0.0) * 1000,
+            current_latency_ms=(self._current or 0.0) * 1000,
+            rejected=self.rejected,
+        )
+
+
+class AdmissionController:
+    """
+    One `AdaptiveLimiter` per route class
+    """
+
+    def __init__(self) -> None:
+        self.limiters = {route_class: AdaptiveLimiter(route_class.value) for route_class in RouteClass}
+
+    def limiter_for(self, method: str) -> AdaptiveLimiter:
+        route_class = RouteClass.READ if method in ("GET", "HEAD") else RouteClass.MUTATION
+        return self.limiters[route_class]
+
+    def status(self) -> list[LimiterStatus]:
+        return [limiter.status() for limiter in self.limiters.values()]
+
+
+@asynccontextmanager
+async def admission_controller(app: Litestar):
+    """
+    Creates a context manager for the per-process admission controller
+
+    The admission controller is stored within the application state.
+    """
+    controller = AdmissionController()
+    app.state.admission_controller = controller
+    yield controller
+
+
+def provide_admission_controller(state: State) -> AdmissionController:
+    """
+    Provides the admission controller stored in the application state
+    """
+    if "admission_controller" not in state:
+        raise AppError("Cannot find admission controller in application state")
+
+    return cast(AdmissionController, state.admission_controller)
+
+
+class AdmissionControlMiddleware:
+    """
+    Admits HTTP requests through the application's `AdmissionController`, answering 503 when over capacity
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = cast(Optional[AdmissionController], scope["app"].state.get("admission_controller"))
+        if scope["type"] != ScopeType.HTTP or not app_config.ADMISSION_CONTROL_ENABLED or controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = controller.limiter_for(scope["method"])
+        try:
+            await limiter.acquire()
+        except AdmissionRejected:
+            response = ExceptionResponse(
+                ExceptionResponseBody(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="Server is over capacity")
+            )
+            asgi_response = response.to_asgi_response(
+                app=None,
+                request=Request(scope),
+                headers={"Retry-After": str(app_config.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            await asgi_response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+            limiter.observe(time.perf_counter() - start)
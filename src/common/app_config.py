@@ -15,6 +15,9 @@ class Environment(Enum):
 ENV = Environment(os.getenv("APP_ENV", "local_dev"))
 
 LOG_LEVEL = logging.INFO
+# Keep only every Nth healthcheck access log and every Nth not found error log, or every one if N is 1 or less
+LOG_HEALTHCHECK_SAMPLE_EVERY = int(os.getenv("LOG_HEALTHCHECK_SAMPLE_EVERY", "100"))
+LOG_NOT_FOUND_SAMPLE_EVERY = int(os.getenv("LOG_NOT_FOUND_SAMPLE_EVERY", "10"))
 PROJECT_NAME = "dnd-health-tracker"
 VERSION = "1.0.0"
 API_MAJOR_VERSION = f"v{VERSION.split('.')[0]}"
@@ -23,11 +26,141 @@ MIGRATION_PATH = Path("./migrations")
 TEST_DATA_PATH = Path("./briv.json")
 HOST = "localhost"
 PORT = 3000
+# Number of worker processes serving the app, set by `python -m src.serve`
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Seconds a worker waits for in-flight requests to finish when shutting down, before closing them
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30"))
+# In local dev, the app loads the test data (or `SNAPSHOT_RESTORE_PATH`) on startup and tears the database down on
+# shutdown. `python -m src.serve` turns this off in its workers and does both once for all of them.
+LOAD_TEST_DATA = ENV == Environment.LOCAL_DEV and os.getenv("LOAD_TEST_DATA", "true").lower() == "true"
 
 
 # DB connection info
 DB_USER = "postgres"
 DB_PASS = "postgres"
 DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = 5432
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_DATABASE = "postgres"
+
+# Connection pool settings, applied to every pool (primary, shards and replica)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "4"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Optional cap on the pooled connections all worker processes together open to each database. Each of `WEB_WORKERS`
+# workers gets an equal share, further capping its pools' `DB_POOL_MAX_SIZE`.
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", "0")) or None
+DB_POOL_MAX_IDLE_SECONDS = float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "600"))
+DB_POOL_MAX_LIFETIME_SECONDS = float(os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "3600"))
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", "30"))
+DB_POOL_WARMUP_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_WARMUP_TIMEOUT_SECONDS", "30"))
+# Check connections with a round trip before handing them out
+DB_POOL_CHECK_CONNECTIONS = os.getenv("DB_POOL_CHECK_CONNECTIONS", "false").lower() == "true"
+# Number of acquisitions kept for acquire latency percentiles
+DB_POOL_STATS_WINDOW = 1024
+# Executions before psycopg prepares a statement server side. 0 prepares every statement on first use.
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "0"))
+
+# Optional read replica. When `DB_REPLICA_HOST` is unset, reads go to the primary.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = int(os.getenv("DB_REPLICA_PORT", str(DB_PORT)))
+
+# Optional extra shards as comma separated `host[:port][/database]` addresses. The primary database above is always
+# shard 0.
+DB_EXTRA_SHARDS = [shard for shard in os.getenv("DB_EXTRA_SHARDS", "").split(",") if shard]
+# Number of buckets characters are hashed into. Buckets, not characters, are assigned to shards. Must not change once
+# the shard map has been persisted.
+SHARD_BUCKET_COUNT = 1024
+
+
+# Admission control for database backed routes. Reads and mutations each get an adaptive concurrency limit between
+# `ADMISSION_MIN_LIMIT` and `ADMISSION_MAX_LIMIT`, and a queue of up to `ADMISSION_MAX_QUEUE` requests waiting at most
+# `ADMISSION_QUEUE_TIMEOUT_SECONDS`. Requests beyond that get a 503 asking to retry after
+# `ADMISSION_RETRY_AFTER_SECONDS`. The limit shrinks once latency exceeds `ADMISSION_LATENCY_TOLERANCE` times its
+# baseline.
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "1"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2"))
+
+
+# Record Prometheus metrics, exposed at `GET /api/v1/metrics`
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Trace every query a request runs, reporting them in a `Server-Timing` header and flagging statements run at least
+# `QUERY_TRACING_REPEAT_THRESHOLD` times in one request as likely N+1s
+QUERY_TRACING_ENABLED = os.getenv("QUERY_TRACING_ENABLED", "false").lower() == "true"
+QUERY_TRACING_REPEAT_THRESHOLD = 3
+# Number of recent query reports kept for `GET /api/v1/admin/query-reports`
+QUERY_TRACING_REPORT_HISTORY = 100
+
+# Allow on-demand request profiling. Requests carrying `PROFILING_TOKEN` in an `X-Profile-Token` header are always
+# profiled; leave it unset to only profile through the admin sample rate.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.005"))
+# Maximum number of distinct stacks kept. Samples of further stacks are counted together.
+PROFILING_MAX_STACKS = 10000
+
+# Read characters from the `character_document` read model, a single row kept up to date by triggers, falling back to
+# the normalized tables for characters without one. Only reads depend on this: the triggers keep documents current
+# whether or not it's set, so it can be turned on without a rebuild, and writes always pay for one document rebuild
+# per changed character per transaction.
+CHARACTER_DOCUMENTS_ENABLED = os.getenv("CHARACTER_DOCUMENTS_ENABLED", "false").lower() == "true"
+# Characters checked or rebuilt per query by `python -m src.character.character_documents`
+CHARACTER_DOCUMENTS_BATCH_SIZE = 10000
+
+# Number of characters whose effective stats are cached per worker process
+EFFECTIVE_STATS_CACHE_SIZE = int(os.getenv("EFFECTIVE_STATS_CACHE_SIZE", "10000"))
+
+# Resolution of temporary hit point expiry. Expiries due within the same tick are cleared together.
+TEMPORARY_HIT_POINTS_EXPIRY_TICK_SECONDS = float(os.getenv("TEMPORARY_HIT_POINTS_EXPIRY_TICK_SECONDS", "1"))
+
+# Readiness checks every database in the background every `HEALTH_CHECK_INTERVAL_SECONDS`, giving each check
+# `HEALTH_CHECK_TIMEOUT_SECONDS`, and reports not ready once its latest result is older than
+# `HEALTH_CHECK_MAX_AGE_SECONDS`
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "5"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "2"))
+HEALTH_CHECK_MAX_AGE_SECONDS = float(os.getenv("HEALTH_CHECK_MAX_AGE_SECONDS", "15"))
+
+# Snapshot to restore on startup in local dev, in place of the test character. See `src.common.snapshot`.
+SNAPSHOT_RESTORE_PATH = os.getenv("SNAPSHOT_RESTORE_PATH")
+# gzip level snapshots are saved with. Binary COPY data compresses well even at the fastest level.
+SNAPSHOT_COMPRESS_LEVEL = int(os.getenv("SNAPSHOT_COMPRESS_LEVEL", "1"))
+
+# Background jobs, see `src.common.jobs`. Each worker process runs up to `JOB_WORKER_CONCURRENCY` jobs at once (0 to
+# only queue jobs, leaving them to `python -m src.worker`), and each job holds at most one pooled connection at a time,
+# so jobs never take more than that many connections from a pool away from requests. Idle workers look for jobs every
+# `JOB_POLL_INTERVAL_SECONDS`. Running jobs heartbeat every `JOB_HEARTBEAT_SECONDS`, and a job without a heartbeat for
+# `JOB_STALE_AFTER_SECONDS` is taken over by another worker, up to `JOB_MAX_ATTEMPTS` times.
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+JOB_STALE_AFTER_SECONDS = float(os.getenv("JOB_STALE_AFTER_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Items a job handles between progress reports
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "100"))
+
+# Change data capture of hit points, see `src.character.hit_point_log`. The relay checks each shard's outbox every
+# `HIT_POINT_LOG_INTERVAL_SECONDS` (straight away while there's a backlog), moving up to `HIT_POINT_LOG_BATCH_SIZE`
+# changes at a time to the log at `HIT_POINT_LOG_DIR`, which starts a new segment every `HIT_POINT_LOG_SEGMENT_BYTES`.
+# Changes are written to the outbox regardless, so with the relay disabled in every process the outbox grows unbounded.
+HIT_POINT_LOG_ENABLED = os.getenv("HIT_POINT_LOG_ENABLED", "true").lower() == "true"
+HIT_POINT_LOG_DIR = Path(os.getenv("HIT_POINT_LOG_DIR", "./hit_point_log"))
+HIT_POINT_LOG_INTERVAL_SECONDS = float(os.getenv("HIT_POINT_LOG_INTERVAL_SECONDS", "0.5"))
+HIT_POINT_LOG_BATCH_SIZE = int(os.getenv("HIT_POINT_LOG_BATCH_SIZE", "1000"))
+HIT_POINT_LOG_SEGMENT_BYTES = int(os.getenv("HIT_POINT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+
+# Live hit point event settings
+EVENT_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "16"))
+EVENT_LISTENER_RECONNECT_SECONDS = 1.0
+# Startup fails if a shard's LISTEN connection isn't up within `EVENT_LISTENER_READY_TIMEOUT_SECONDS`
+EVENT_LISTENER_READY_TIMEOUT_SECONDS = float(os.getenv("EVENT_LISTENER_READY_TIMEOUT_SECONDS", "30"))
+
+# Party hit point rollups, see `src.character.party_rollups`. Every `PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS` (0 to
+# never) one process checks each shard's rollups against the members' hit points and repairs any that drifted, checking
+# `PARTY_ROLLUP_BATCH_SIZE` parties per query.
+PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS = float(os.getenv("PARTY_ROLLUP_RECONCILE_INTERVAL_SECONDS", "3600"))
+PARTY_ROLLUP_BATCH_SIZE = 1000
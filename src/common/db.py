@@ -1,13 +1,15 @@
+import asyncio
 import json
-from contextlib import asynccontextmanager
-from pathlib import Path
-from typing import cast
+import re
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Optional, cast
 
 import msgspec
 import psycopg
-from litestar import Litestar
+from litestar import Litestar, Request
 from litestar.datastructures import State
-from psycopg import AsyncConnection, AsyncCursor, Cursor
+from litestar.exceptions import ClientException
+from psycopg import AsyncConnection, AsyncCursor
 from psycopg_pool import AsyncConnectionPool
 
 from src.character.character_repo import CharacterRepo
@@ -15,14 +17,34 @@ from src.character.models import Character
 from src.common import app_config
 from src.common.app_error import AppError
 from src.common.log_config import get_logger
-from src.common.utils import dict_row_camel
+from src.common.migrations import migrate
+from src.common.pool import (
+    LazyConnection,
+    PoolStats,
+    acquire,
+    create_pool,
+    get_pool_stats,
+    open_pool,
+    warm_pool,
+)
+from src.common.query_tracing import QUERY_TRACER_STATE_KEY, QueryTracer, TracingCursor
+from src.common.sharding import ShardRouter, allocate_character_id, load_shard_map
+from src.common.utils import DbCursor, dict_row_camel
 
 LOG = get_logger(__name__)
 
 # Type aliases for convenience
-DbConn = AsyncConnection
+DbConn = LazyConnection
 DB = AsyncCursor
 
+# Header carrying the WAL position of a client's last write. Reads presenting it are only served by the replica once
+# the replica has replayed up to that position.
+READ_AFTER_LSN_HEADER = "X-Read-After-Lsn"
+_LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# Path parameter holding the character id on character routes. Requests carrying it are routed to the character's shard.
+SHARD_KEY_PATH_PARAM = "id"
+
 
 # Database configuration convenience class
 class DatabaseConnInfo(msgspec.Struct, frozen=True, kw_only=True):
@@ -52,79 +74,264 @@ def get_conn_info() -> DatabaseConnInfo:
     )
 
 
+def get_replica_conn_info() -> Optional[DatabaseConnInfo]:
+    """
+    Helper function to get read replica connection info, if a replica is configured
+    """
+    if not app_config.DB_REPLICA_HOST:
+        return None
+
+    return DatabaseConnInfo(
+        host=app_config.DB_REPLICA_HOST,
+        port=app_config.DB_REPLICA_PORT,
+        username=app_config.DB_USER,
+        password=app_config.DB_PASS,
+        database=app_config.DB_DATABASE,
+    )
+
+
+def get_shard_conn_infos() -> list[DatabaseConnInfo]:
+    """
+    Helper function to get connection info for every shard. The primary database is always shard 0.
+    """
+    shards = [get_conn_info()]
+    for shard in app_config.DB_EXTRA_SHARDS:
+        address, _, database = shard.partition("/")
+        host, _, port = address.partition(":")
+        shards.append(
+            msgspec.structs.replace(
+                shards[0], host=host, port=int(port or app_config.DB_PORT), database=database or shards[0].database
+            )
+        )
+    return shards
+
+
 @asynccontextmanager
 async def db_connection(app: Litestar):
     """
-    Creates a context manager for providing a database connection pool
+    Creates a context manager for providing a database connection pool per shard, plus a read replica pool if one is
+    configured
 
-    The pool is stored within the application state.
+    The pools are stored within the application state. The primary (shard 0) pool is `app.state.pool`.
     """
-    async with AsyncConnectionPool(get_conn_info().to_conn_str()) as pool:
+    async with AsyncExitStack() as stack:
+        shard_pools = [
+            await stack.enter_async_context(
+                open_pool(create_pool(conn_info.to_conn_str(), name="primary" if shard == 0 else f"shard-{shard}"))
+            )
+            for shard, conn_info in enumerate(get_shard_conn_infos())
+        ]
+        pool = shard_pools[0]
         app.state.pool = pool
+        app.state.shard_pools = shard_pools
+        app.state.shards = None
+
+        replica_conn_info = get_replica_conn_info()
+        app.state.replica_pool = (
+            await stack.enter_async_context(
+                open_pool(create_pool(replica_conn_info.to_conn_str(), name="replica", read_only=True))
+            )
+            if replica_conn_info
+            else None
+        )
+
         yield pool
 
 
-async def provide_db_conn(state: State):
+async def warm_pools(app: Litestar):
     """
-    Provides a database connection from the connection pool stored in the application state
+    App startup function for preparing the hot statements on every pool's idle connections, once migrations have run
+    """
+    replica_pool = app.state.get("replica_pool")
+    await asyncio.gather(*(warm_pool(pool, read_only=pool is replica_pool) for pool in get_all_pools(app.state)))
+
+
+async def load_shards(app: Litestar):
+    """
+    App startup function for loading the shard map, once migrations have created it
+    """
+    async with app.state.pool.connection() as conn:
+        shard_map = await load_shard_map(conn, len(app.state.shard_pools))
+    app.state.shards = ShardRouter(app.state.shard_pools, shard_map)
+
+
+def get_all_pools(state: State) -> list[AsyncConnectionPool]:
+    """
+    Every connection pool stored in the application state: each shard's, then the replica's if one is configured
+    """
+    pools = list(cast(list[AsyncConnectionPool], state.get("shard_pools", [])))
+    if replica_pool := state.get("replica_pool"):
+        pools.append(replica_pool)
+    return pools
+
+
+def get_all_pool_stats(state: State) -> list[PoolStats]:
+    """
+    Stats for every connection pool stored in the application state
+    """
+    return [get_pool_stats(pool) for pool in get_all_pools(state)]
+
+
+def _get_pool(state: State, request: Request[Any, Any, Any]) -> AsyncConnectionPool:
+    """
+    Resolve the pool for a request: the owning shard's pool for character routes, otherwise the primary pool
     """
     if "pool" not in state:
         raise AppError("Cannot find connection pool in application state")
 
-    connection_pool = cast(AsyncConnectionPool, state.pool)
-    async with connection_pool.connection() as conn:
+    shards = cast(Optional[ShardRouter], state.get("shards"))
+    character_id = request.path_params.get(SHARD_KEY_PATH_PARAM)
+    if shards and character_id is not None:
+        return shards.pool_for(character_id)
+
+    return cast(AsyncConnectionPool, state.pool)
+
+
+async def provide_db_conn(state: State, request: Request[Any, Any, Any]):
+    """
+    Provides a lazily acquired database connection from the connection pool stored in the application state
+    """
+    connection_pool = _get_pool(state, request)
+    async with LazyConnection(lambda: acquire(connection_pool)) as conn:
         yield conn
 
 
-async def provide_db(db_conn: AsyncConnection):
+async def replica_has_replayed(conn: AsyncConnection, lsn: str) -> bool:
+    """
+    Returns whether the server behind `conn` has replayed the WAL up to `lsn`
+
+    A server that is not in recovery (i.e. a primary) has always "replayed" its own writes.
+    """
+    cur = await conn.execute(
+        "SELECT coalesce(pg_last_wal_replay_lsn() >= %(lsn)s::pg_lsn, true)",
+        {"lsn": lsn},
+    )
+    res = await cur.fetchone()
+    return bool(res and res[0])
+
+
+@asynccontextmanager
+async def _acquire_read(replica_pool: AsyncConnectionPool, primary_pool: AsyncConnectionPool, min_lsn: Optional[str]):
+    async with acquire(replica_pool) as conn:
+        if min_lsn is None or await replica_has_replayed(conn, min_lsn):
+            yield conn
+            return
+
+    LOG.info("Replica has not replayed to %s, reading from primary", min_lsn)
+    async with acquire(primary_pool) as conn:
+        yield conn
+
+
+async def provide_read_db_conn(state: State, request: Request[Any, Any, Any]):
+    """
+    Provides a lazily acquired database connection for read-only work
+
+    Uses the replica pool if one is configured, unless the request carries a `READ_AFTER_LSN_HEADER` that the replica
+    hasn't replayed yet, in which case the read falls back to the primary so clients always see their own writes.
+    """
+    min_lsn = request.headers.get(READ_AFTER_LSN_HEADER)
+    if min_lsn is not None and not _LSN_PATTERN.match(min_lsn):
+        raise ClientException(f"Invalid {READ_AFTER_LSN_HEADER} header: {min_lsn}")
+
+    connection_pool = _get_pool(state, request)
+    replica_pool = cast(Optional[AsyncConnectionPool], state.get("replica_pool"))
+    # Only the primary (shard 0) has a replica
+    if replica_pool and connection_pool is state.pool:
+        async with LazyConnection(lambda: _acquire_read(replica_pool, connection_pool, min_lsn)) as conn:
+            yield conn
+        return
+
+    async with LazyConnection(lambda: acquire(connection_pool)) as conn:
+        yield conn
+
+
+async def commit_with_lsn(db_conn: DbConn, state: State) -> dict[str, str]:
+    """
+    Commits the current transaction, returning the connection to its pool, and returns response headers carrying the
+    transaction's WAL position
+
+    The client can send the headers back on later reads to guarantee it sees its own writes. When no replica is
+    configured every read goes to the primary, so no header is returned.
+    """
+    if not db_conn.checked_out:
+        return {}
+
+    conn = await db_conn.connection()
+    await conn.commit()
+    headers = {}
+    if state.get("replica_pool"):
+        res = await (await conn.execute("SELECT pg_current_wal_lsn()::text")).fetchone()
+        headers = {READ_AFTER_LSN_HEADER: res[0]} if res else {}
+
+    await db_conn.commit()
+    return headers
+
+
+def _trace(cursor: DbCursor, request: Request[Any, Any, Any]) -> DbCursor:
+    """
+    Wrap `cursor` in a `TracingCursor` when the request is being traced
+    """
+    tracer = cast(Optional[QueryTracer], request.state.get(QUERY_TRACER_STATE_KEY))
+    return TracingCursor(cursor, tracer) if tracer else cursor
+
+
+def provide_db(db_conn: DbConn, request: Request[Any, Any, Any]) -> DbCursor:
     """
     Provides a database cursor object from a database connection object
     """
-    async with db_conn.cursor(row_factory=dict_row_camel) as cur:
-        yield cur
+    return _trace(db_conn.cursor(row_factory=dict_row_camel), request)
 
 
-async def insert_test_data():
+def provide_read_db(read_db_conn: DbConn, request: Request[Any, Any, Any]) -> DbCursor:
     """
-    App startup function for inserting initial data
+    Provides a database cursor object for read-only work
+    """
+    return _trace(read_db_conn.cursor(row_factory=dict_row_camel), request)
+
+
+def load_test_character() -> Character:
+    """
+    Load the test character from `TEST_DATA_PATH`, starting on full hit points
     """
     with open(app_config.TEST_DATA_PATH, "r") as fp:
         test_data = json.load(fp)
 
     test_data["hitPoints"] = {"hitPointMax": test_data["hitPoints"], "currentHitPoints": test_data["hitPoints"]}
-
-    character = msgspec.convert(test_data, Character)
-    async with await psycopg.AsyncConnection.connect(get_conn_info().to_conn_str()) as conn:
-        async with conn.cursor(row_factory=dict_row_camel) as cur:
-            character_repo = CharacterRepo(cur)
-            await character_repo.insert_character(character=character)
+    return msgspec.convert(test_data, Character)
 
 
-def run_migration_script(path: Path, cur: Cursor):
+async def insert_test_data():
     """
-    Run the migration script at `path`
+    App startup function for inserting initial data
     """
-    LOG.info(f"Executing migration '{path.name}'")
-    with open(path, "r") as fp:
-        for statement in fp.read().split(";"):
-            cur.execute(statement)  # type: ignore
+    character = load_test_character()
+    shard_conn_infos = get_shard_conn_infos()
+    async with await psycopg.AsyncConnection.connect(get_conn_info().to_conn_str()) as directory:
+        shard_map = await load_shard_map(directory, len(shard_conn_infos))
+        character_id = await allocate_character_id(directory)
+
+    shard_conn_info = shard_conn_infos[shard_map.shard_for(character_id)]
+    async with await psycopg.AsyncConnection.connect(shard_conn_info.to_conn_str()) as conn:
+        async with conn.cursor(row_factory=dict_row_camel) as cur:
+            character_repo = CharacterRepo(cur)
+            await character_repo.insert_character(character=character, character_id=character_id)
 
 
-# In a real app, we'd use a database migration tool like Flyway to run proper migrations, but for this exercise, a
-# simple setup and teardown script will do
 async def migrate_db():
     """
-    App startup function to setup the db
+    App startup function to bring the schema on every shard up to date. See `src.common.migrations`.
     """
-    with psycopg.connect(get_conn_info().to_conn_str()) as conn:
-        with conn.cursor() as cur:
-            run_migration_script(app_config.MIGRATION_PATH / "setup.sql", cur)
+    for conn_info in get_shard_conn_infos():
+        applied = await migrate(conn_info.to_conn_str(), app_config.MIGRATION_PATH)
+        if applied:
+            LOG.info("Applied %s migrations to %s/%s", applied, conn_info.host, conn_info.database)
 
 
 async def teardown_db():
     """
-    App shutdown function to teardown the db
+    App shutdown function to teardown the db on every shard
     """
-    with psycopg.connect(get_conn_info().to_conn_str()) as conn:
-        with conn.cursor() as cur:
-            run_migration_script(app_config.MIGRATION_PATH / "teardown.sql", cur)
+    teardown = (app_config.MIGRATION_PATH / "teardown.sql").read_bytes()
+    for conn_info in get_shard_conn_infos():
+        async with await psycopg.AsyncConnection.connect(conn_info.to_conn_str(), autocommit=True) as conn:
+            await conn.execute(teardown)
@@ -1,14 +1,79 @@
+from typing import Optional, cast
+
+from litestar.datastructures import State
 from litestar.di import Provide
 
+from src.character.character_events import provide_character_event_broker
 from src.character.character_repo import CharacterRepo
 from src.character.character_service import CharacterService
-from src.common.db import provide_db, provide_db_conn
+from src.character.character_storage import CharacterStorage
+from src.character.effective_stats import provide_effective_stats_cache
+from src.character.party_repo import PartyRepo
+from src.character.sharded_character_repo import ShardedCharacterRepo
+from src.character.temporary_hit_points import provide_temporary_hit_points_expiry
+from src.common.admission import provide_admission_controller
+from src.common.app_error import AppError
+from src.common.db import provide_db, provide_db_conn, provide_read_db, provide_read_db_conn
+from src.common.health import provide_health_checker
+from src.common.jobs import provide_job_queue
+from src.common.profiling import provide_request_profiler
+from src.common.sharding import ShardRouter
+from src.common.utils import DbCursor
+
+
+def provide_character_storage(db: DbCursor) -> CharacterStorage:
+    """
+    Provides the `CharacterStorage` that `CharacterService` runs on
+    """
+    return CharacterRepo(db)
+
+
+def provide_read_character_repo(read_db: DbCursor) -> CharacterRepo:
+    """
+    Provides a `CharacterRepo` for read-only handlers, backed by the read replica when one is configured
+    """
+    return CharacterRepo(read_db)
+
+
+def provide_sharded_character_repo(state: State) -> ShardedCharacterRepo:
+    """
+    Provides a `ShardedCharacterRepo` for work that spans every shard
+    """
+    shards = cast(Optional[ShardRouter], state.get("shards"))
+    if not shards:
+        raise AppError("Cannot find shard router in application state")
+
+    return ShardedCharacterRepo(shards)
+
+
+def provide_party_repo(state: State) -> PartyRepo:
+    """
+    Provides a `PartyRepo` for parties and their rollups, which span every shard
+    """
+    shards = cast(Optional[ShardRouter], state.get("shards"))
+    if not shards:
+        raise AppError("Cannot find shard router in application state")
+
+    return PartyRepo(shards)
 
 
 def provide_dependencies():
     return {
         "db_conn": Provide(provide_db_conn),
-        "db": Provide(provide_db),
+        "db": Provide(provide_db, sync_to_thread=False),
+        "read_db_conn": Provide(provide_read_db_conn),
+        "read_db": Provide(provide_read_db, sync_to_thread=False),
         "character_repo": Provide(CharacterRepo, sync_to_thread=False),
+        "read_character_repo": Provide(provide_read_character_repo, sync_to_thread=False),
+        "sharded_character_repo": Provide(provide_sharded_character_repo, sync_to_thread=False),
+        "party_repo": Provide(provide_party_repo, sync_to_thread=False),
+        "character_storage": Provide(provide_character_storage, sync_to_thread=False),
         "character_service": Provide(CharacterService, sync_to_thread=False),
+        "character_event_broker": Provide(provide_character_event_broker, sync_to_thread=False),
+        "request_profiler": Provide(provide_request_profiler, sync_to_thread=False),
+        "admission_controller": Provide(provide_admission_controller, sync_to_thread=False),
+        "effective_stats_cache": Provide(provide_effective_stats_cache, sync_to_thread=False),
+        "temporary_hit_points_expiry": Provide(provide_temporary_hit_points_expiry, sync_to_thread=False),
+        "health_checker": Provide(provide_health_checker, sync_to_thread=False),
+        "job_queue": Provide(provide_job_queue, sync_to_thread=False),
     }
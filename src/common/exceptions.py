@@ -3,7 +3,8 @@ from typing import Any, Optional
 import msgspec
 from litestar import Request, Response
 from litestar.exceptions import HTTPException
-from litestar.status_codes import HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR
+from litestar.status_codes import HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_503_SERVICE_UNAVAILABLE
+from psycopg_pool import PoolTimeout
 
 from src.character.exceptions import CharacterNotFoundException
 from src.common.log_config import get_logger
@@ -41,11 +42,17 @@ def app_exception_handler(request: Request[Any, Any, Any], exception: Exception)
                     status_code=HTTP_404_NOT_FOUND, detail=f"Character id {exception.character_id} not found"
                 )
             )
+        case PoolTimeout():
+            response = ExceptionResponse(
+                ExceptionResponseBody(
+                    status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="Timed out waiting for a database connection"
+                )
+            )
         case _:
             response = ExceptionResponse(
                 ExceptionResponseBody(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
             )
 
-    LOG.info("HERE")
-    LOG.error(exception, exc_info=exception)
+    # Not found errors are sampled by the log pipeline, see `LogSampler`
+    LOG.error(exception, exc_info=exception, extra={"status_code": response.status_code})
     return response
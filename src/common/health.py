@@ -0,0 +1,203 @@
+"""
+Liveness and readiness health checks
+
+`GET /health` and `GET /health/live` only say the process is up and serving requests. `GET /health/ready` also reports
+whether every database the app uses (each shard, and the replica if one is configured) is reachable and migrated to the
+latest version this app knows about, along with its connection pool's stats.
+
+Readiness comes from a `HealthChecker` running in the background of each worker, which checks every database with one
+query every `HEALTH_CHECK_INTERVAL_SECONDS`. Probes are answered from its latest result, so probing at any frequency
+never costs a database round trip. A result older than `HEALTH_CHECK_MAX_AGE_SECONDS`, e.g. because checks are stuck
+waiting on an exhausted pool, is reported as not ready.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional, cast
+
+import msgspec
+from litestar import Litestar
+from litestar.datastructures import State
+from psycopg_pool import AsyncConnectionPool
+
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.db import get_all_pools
+from src.common.log_config import get_logger
+from src.common.migrations import load_migrations
+from src.common.pool import PoolStats, acquire, get_pool_stats
+
+LOG = get_logger(__name__)
+
+
+class DatabaseHealth(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    name: str
+    reachable: bool
+    latency_ms: Optional[float]
+    migration_version: Optional[int]
+    error: Optional[str]
+    pool: PoolStats
+
+
+class Readiness(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    status: str
+    description: str
+    environment: str
+    checked_at: Optional[datetime]
+    expected_migration_version: int
+    databases: list[DatabaseHealth]
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "pass"
+
+
+async def check_database(pool: AsyncConnectionPool, timeout: float) -> DatabaseHealth:
+    """
+    Check that a connection can be checked out of `pool` and queried within `timeout`, returning the database's
+    migration version
+    """
+    start = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            async with acquire(pool) as conn:
+                res = await (await conn.execute("SELECT max(version) FROM operational.schema_version")).fetchone()
+    except Exception as e:
+        return DatabaseHealth(
+            name=pool.name,
+            reachable=False,
+            latency_ms=None,
+            migration_version=None,
+            error=str(e) or type(e).__name__,
+            pool=get_pool_stats(pool),
+        )
+
+    return DatabaseHealth(
+        name=pool.name,
+        reachable=True,
+        latency_ms=(time.perf_counter() - start) * 1000,
+        migration_version=res[0] if res else None,
+        error=None,
+        pool=get_pool_stats(pool),
+    )
+
+
+class HealthChecker:
+    """
+    Periodically checks every database in the application state, keeping the latest result for readiness probes
+    """
+
+    def __init__(
+        self,
+        state: State,
+        interval: float = app_config.HEALTH_CHECK_INTERVAL_SECONDS,
+        timeout: float = app_config.HEALTH_CHECK_TIMEOUT_SECONDS,
+        max_age: float = app_config.HEALTH_CHECK_MAX_AGE_SECONDS,
+    ) -> None:
+        self.state = state
+        self.interval = interval
+        self.timeout = timeout
+        self.max_age = max_age
+        self.expected_migration_version = max(
+            (migration.version for migration in load_migrations(app_config.MIGRATION_PATH)), default=0
+        )
+        self.checks = 0
+        self._databases: list[DatabaseHealth] = []
+        self._checked_at: Optional[datetime] = None
+        self._checked_at_monotonic = 0.0
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def refresh(self) -> None:
+        """
+        Check every database concurrently and keep the results
+        """
+        self._databases = list(
+            await asyncio.gather(*(check_database(pool, self.timeout) for pool in get_all_pools(self.state)))
+        )
+        self._checked_at = datetime.now(timezone.utc)
+        self._checked_at_monotonic = time.monotonic()
+        self.checks += 1
+
+    def _problem(self) -> Optional[str]:
+        if self._checked_at is None:
+            return "Databases haven't been checked yet"
+        if time.monotonic() - self._checked_at_monotonic > self.max_age:
+            return f"Databases haven't been checked for over {self.max_age:g}s"
+
+        for database in self._databases:
+            if not database.reachable:
+                return f"Database '{database.name}' is unreachable: {database.error}"
+            if (database.migration_version or 0) < self.expected_migration_version:
+                return (
+                    f"Database '{database.name}' is at migration version {database.migration_version}, expected "
+                    f"{self.expected_migration_version}"
+                )
+        if self.state.get("shards") is None:
+            return "Shard map hasn't been loaded"
+        return None
+
+    def readiness(self) -> Readiness:
+        """
+        Readiness as of the latest check, without touching the database
+        """
+        problem = self._problem()
+        return Readiness(
+            status="fail" if problem else "pass",
+            description=problem or "Application is ready",
+            environment=app_config.ENV.value,
+            checked_at=self._checked_at,
+            expected_migration_version=self.expected_migration_version,
+            databases=self._databases,
+        )
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:
+                LOG.exception("Health check failed")
+
+
+@asynccontextmanager
+async def health_checker(app: Litestar):
+    """
+    Creates a context manager for the per-process health checker, which is started once the shards are loaded by
+    `start_health_checker`
+
+    The checker is stored within the application state.
+    """
+    checker = HealthChecker(app.state)
+    app.state.health_checker = checker
+    try:
+        yield checker
+    finally:
+        await checker.stop()
+
+
+async def start_health_checker(app: Litestar):
+    """
+    App startup function for running the first health check and then checking in the background
+    """
+    await cast(HealthChecker, app.state.health_checker).start()
+
+
+def provide_health_checker(state: State) -> HealthChecker:
+    """
+    Provides the health checker stored in the application state
+    """
+    if "health_checker" not in state:
+        raise AppError("Cannot find health checker in application state")
+
+    return cast(HealthChecker, state.health_checker)
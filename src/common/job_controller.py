@@ -0,0 +1,27 @@
+from litestar import Controller, get, post
+from litestar.exceptions import NotFoundException
+from litestar.status_codes import HTTP_200_OK
+
+from src.common.jobs import Job, JobQueue
+
+
+class JobController(Controller):
+    path = "/jobs/{id:int}"
+
+    @get()
+    async def get_job(self, id: int, job_queue: JobQueue) -> Job:
+        """
+        Report a background job's status and progress, and its result or error once it has finished
+        """
+        if job := await job_queue.get(id):
+            return job
+        raise NotFoundException(f"Job id {id} not found")
+
+    @post("/cancel", status_code=HTTP_200_OK)
+    async def cancel_job(self, id: int, job_queue: JobQueue) -> Job:
+        """
+        Cancel a queued job, or ask a running one to stop after its current batch. Finished jobs are left as they are.
+        """
+        if job := await job_queue.cancel(id):
+            return job
+        raise NotFoundException(f"Job id {id} not found")
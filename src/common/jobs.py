@@ -0,0 +1,418 @@
+"""
+Background jobs for long running bulk operations
+
+Bulk work, such as importing characters or a long rest for a whole party, is queued as a job rather than done while a
+request holds a pooled connection. `JobQueue.enqueue` stores the job in `operational.job` on shard 0 and the API answers
+straight away with it. `GET /api/v1/jobs/{id}` reports its status, progress and, once it's done, its result or error.
+
+Each worker process runs `JOB_WORKER_CONCURRENCY` job workers, which claim the oldest queued job with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so workers in any number of processes never wait on each other or run the same job.
+Job handlers work in batches, committing each batch on its own and reporting progress after it, and only ever hold one
+pooled connection at a time. Jobs therefore never take more than `JOB_WORKER_CONCURRENCY` connections from a worker's
+pools, and interactive requests get connections between batches. Set it to 0 to run jobs only in `python -m src.worker`.
+
+Cancelling a job (`POST /api/v1/jobs/{id}/cancel`) that hasn't started cancels it straight away. A running job is asked
+to stop, and does at its next progress report, keeping the batches it already committed.
+
+Running jobs heartbeat every `JOB_HEARTBEAT_SECONDS`. A job whose worker died stops heartbeating and is taken over by
+another worker after `JOB_STALE_AFTER_SECONDS`, resuming from its last progress report, up to `JOB_MAX_ATTEMPTS` times.
+Handlers have to be safe to resume that way, as the batch a worker died in may be run again. Jobs a worker was running
+when it shut down are queued again straight away.
+
+Handlers are registered per job kind with `job_handler`, along with the type the job's params are decoded to.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, cast
+
+import msgspec
+from litestar import Litestar
+from litestar.datastructures import State
+from psycopg.rows import DictRow
+
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.log_config import get_logger
+from src.common.pool import acquire
+from src.common.sharding import ShardRouter
+from src.common.utils import dict_row_camel
+
+LOG = get_logger(__name__)
+
+
+class JobException(AppError): ...
+
+
+class JobCancelled(JobException):
+    """
+    Raised by `JobContext.report_progress` once the job has been cancelled
+    """
+
+
+class JobLost(JobException):
+    """
+    Raised by `JobContext.report_progress` once another worker has taken the job over
+    """
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Job(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    id: int
+    kind: str
+    status: JobStatus
+    progress_done: int
+    # Unknown until the handler first reports progress
+    progress_total: Optional[int]
+    # The handler's result, or what it had done so far when it hasn't succeeded
+    result: Any
+    error: Optional[str]
+    cancel_requested: bool
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
+_JOB_COLUMNS = """
+    id, kind, status, progress_done, progress_total, result, error, cancel_requested, attempts, created_at, started_at,
+    finished_at
+"""
+
+JobHandler = Callable[["JobContext", Any], Awaitable[Any]]
+
+
+class _Registration(NamedTuple):
+    params_type: type[Any]
+    handler: JobHandler
+
+
+_handlers: dict[str, _Registration] = {}
+
+
+def job_handler(kind: str, params_type: type[Any]) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register the decorated function as the handler of jobs of `kind`, whose params are decoded as `params_type`
+
+    Handlers are called with a `JobContext` and the params, and return the job's result.
+    """
+
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = _Registration(params_type, handler)
+        return handler
+
+    return register
+
+
+def _encode(value: Any) -> Optional[str]:
+    return None if value is None else msgspec.json.encode(value).decode()
+
+
+class JobContext:
+    """
+    A running job, as its handler sees it: the shards to work on, the progress and result reported by earlier attempts
+    to resume from, and a way to report more
+    """
+
+    def __init__(self, queue: "JobQueue", job: Job, shards: ShardRouter) -> None:
+        self.queue = queue
+        self.job = job
+        self.shards = shards
+        self.done = job.progress_done
+        self.total = job.progress_total
+        self.result = job.result
+
+    async def report_progress(self, done: int, total: Optional[int] = None, result: Any = None) -> None:
+        """
+        Record that `done` (of `total`) items are finished, along with the result so far, which a later attempt resumes
+        from. Raises `JobCancelled` once the job has been cancelled and `JobLost` once another worker has taken it over.
+        """
+        self.done = done
+        if total is not None:
+            self.total = total
+        if result is not None:
+            self.result = msgspec.to_builtins(result)
+        if await self.queue.checkpoint(self.job, done, self.total, self.result):
+            raise JobCancelled(f"Job {self.job.id} was cancelled")
+
+
+class JobQueue:
+    """
+    Queues jobs in `operational.job` and runs them with a pool of workers
+    """
+
+    def __init__(
+        self,
+        concurrency: int = app_config.JOB_WORKER_CONCURRENCY,
+        poll_interval: float = app_config.JOB_POLL_INTERVAL_SECONDS,
+        heartbeat_interval: float = app_config.JOB_HEARTBEAT_SECONDS,
+        stale_after: float = app_config.JOB_STALE_AFTER_SECONDS,
+        max_attempts: int = app_config.JOB_MAX_ATTEMPTS,
+    ) -> None:
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.finished = 0
+        self._shards: Optional[ShardRouter] = None
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @property
+    def shards(self) -> ShardRouter:
+        if self._shards is None:
+            raise JobException("Job queue hasn't been started")
+        return self._shards
+
+    async def _execute(self, query: str, params: dict[str, Any]) -> list[DictRow]:
+        async with acquire(self.shards.directory) as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                return await (await cur.execute(query, params)).fetchall()
+
+    async def enqueue(self, kind: str, params: Any) -> Job:
+        """
+        Queue a job of `kind` with `params`, which must have a registered handler
+        """
+        if kind not in _handlers:
+            raise JobException(f"No handler is registered for jobs of kind {kind}")
+
+        rows = await self._execute(
+            f"""
+            INSERT INTO operational.job (kind, params)
+            VALUES (%(kind)s, %(params)s::jsonb)
+            RETURNING {_JOB_COLUMNS}
+            """,
+            {"kind": kind, "params": _encode(params)},
+        )
+        # Workers in this process needn't wait for their next poll
+        self._wakeup.set()
+        return msgspec.convert(rows[0], Job)
+
+    async def get(self, job_id: int) -> Optional[Job]:
+        rows = await self._execute(f"SELECT {_JOB_COLUMNS} FROM operational.job WHERE id = %(id)s", {"id": job_id})
+        return msgspec.convert(rows[0], Job) if rows else None
+
+    async def cancel(self, job_id: int) -> Optional[Job]:
+        """
+        Cancel a queued job, or ask a running one to stop. Finished jobs are left as they are.
+        """
+        rows = await self._execute(
+            f"""
+            UPDATE operational.job
+            SET cancel_requested = true,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END
+            WHERE id = %(id)s AND status IN ('queued', 'running')
+            RETURNING {_JOB_COLUMNS}
+            """,
+            {"id": job_id},
+        )
+        return msgspec.convert(rows[0], Job) if rows else await self.get(job_id)
+
+    async def _claim(self) -> Optional[tuple[Job, Any]]:
+        """
+        Claim the oldest queued job, or running job whose heartbeat is stale, skipping jobs other workers are claiming
+        """
+        rows = await self._execute(
+            f"""
+            UPDATE operational.job
+            SET status = 'running', attempts = attempts + 1, started_at = coalesce(started_at, now()),
+                heartbeat_at = now()
+            WHERE id = (
+                SELECT id
+                FROM operational.job
+                WHERE status = 'queued'
+                    OR (status = 'running' AND heartbeat_at < now() - make_interval(secs => %(stale_after)s))
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {_JOB_COLUMNS}, params
+            """,
+            {"stale_after": self.stale_after},
+        )
+        if not rows:
+            return None
+        return msgspec.convert(rows[0], Job), rows[0]["params"]
+
+    async def checkpoint(self, job: Job, done: int, total: Optional[int], result: Any) -> bool:
+        """
+        Store a running job's progress, returning whether it has been asked to stop
+        """
+        rows = await self._execute(
+            """
+            UPDATE operational.job
+            SET progress_done = %(done)s, progress_total = %(total)s, result = coalesce(%(result)s::jsonb, result),
+                heartbeat_at = now()
+            WHERE id = %(id)s AND attempts = %(attempts)s AND status = 'running'
+            RETURNING cancel_requested
+            """,
+            {"id": job.id, "attempts": job.attempts, "done": done, "total": total, "result": _encode(result)},
+        )
+        if not rows:
+            raise JobLost(f"Job {job.id} was taken over by another worker")
+        return rows[0]["cancelRequested"]
+
+    async def _finish(
+        self, job: Job, status: JobStatus, result: Any = None, error: Optional[str] = None
+    ) -> Optional[Job]:
+        rows = await self._execute(
+            f"""
+            UPDATE operational.job
+            SET status = %(status)s, result = coalesce(%(result)s::jsonb, result), error = %(error)s,
+                finished_at = now()
+            WHERE id = %(id)s AND attempts = %(attempts)s AND status = 'running'
+            RETURNING {_JOB_COLUMNS}
+            """,
+            {
+                "id": job.id,
+                "attempts": job.attempts,
+                "status": status.value,
+                "result": _encode(msgspec.to_builtins(result)),
+                "error": error,
+            },
+        )
+        self.finished += 1
+        LOG.info("Job %s (%s) %s", job.id, job.kind, status.value)
+        return msgspec.convert(rows[0], Job) if rows else None
+
+    async def _release(self, job: Job) -> None:
+        """
+        Queue a running job again, without counting the attempt, for when its worker is stopped
+        """
+        await self._execute(
+            """
+            UPDATE operational.job
+            SET status = 'queued', attempts = attempts - 1, heartbeat_at = NULL
+            WHERE id = %(id)s AND attempts = %(attempts)s AND status = 'running'
+            RETURNING id
+            """,
+            {"id": job.id, "attempts": job.attempts},
+        )
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._execute(
+                    """
+                    UPDATE operational.job
+                    SET heartbeat_at = now()
+                    WHERE id = %(id)s AND attempts = %(attempts)s AND status = 'running'
+                    RETURNING id
+                    """,
+                    {"id": job.id, "attempts": job.attempts},
+                )
+            except Exception:
+                LOG.exception("Failed to heartbeat job %s", job.id)
+
+    async def _run(self, job: Job, params: Any) -> Optional[Job]:
+        registration = _handlers.get(job.kind)
+        if job.cancel_requested:
+            return await self._finish(job, JobStatus.CANCELLED)
+        if registration is None:
+            return await self._finish(
+                job, JobStatus.FAILED, error=f"No handler is registered for jobs of kind {job.kind}"
+            )
+        if job.attempts > self.max_attempts:
+            return await self._finish(job, JobStatus.FAILED, error=f"Gave up after {self.max_attempts} attempts")
+
+        context = JobContext(self, job, self.shards)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            try:
+                result = await registration.handler(context, msgspec.convert(params, registration.params_type))
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+        except JobCancelled:
+            return await self._finish(job, JobStatus.CANCELLED)
+        except JobLost:
+            LOG.warning("Job %s was taken over by another worker", job.id)
+            return None
+        except asyncio.CancelledError:
+            await self._release(job)
+            raise
+        except Exception as e:
+            LOG.exception("Job %s (%s) failed", job.id, job.kind)
+            return await self._finish(job, JobStatus.FAILED, error=str(e) or type(e).__name__)
+
+        return await self._finish(job, JobStatus.SUCCEEDED, result=result)
+
+    async def run_next(self) -> bool:
+        """
+        Claim and run the next job, returning whether there was one
+        """
+        claimed = await self._claim()
+        if claimed is None:
+            return False
+
+        await self._run(*claimed)
+        return True
+
+    async def start(self, shards: ShardRouter) -> None:
+        self._shards = shards
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                if await self.run_next():
+                    continue
+            except Exception:
+                LOG.exception("Failed to claim a job")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+
+
+@asynccontextmanager
+async def job_queue(app: Litestar):
+    """
+    Creates a context manager for the per-process job queue, whose workers are started once the shards are loaded by
+    `start_job_queue`
+
+    The queue is stored within the application state.
+    """
+    queue = JobQueue()
+    app.state.job_queue = queue
+    try:
+        yield queue
+    finally:
+        await queue.stop()
+
+
+async def start_job_queue(app: Litestar):
+    """
+    App startup function for starting the job workers, once the shards are loaded
+    """
+    await cast(JobQueue, app.state.job_queue).start(app.state.shards)
+
+
+def provide_job_queue(state: State) -> JobQueue:
+    """
+    Provides the job queue stored in the application state
+    """
+    if "job_queue" not in state:
+        raise AppError("Cannot find job queue in application state")
+
+    return cast(JobQueue, state.job_queue)
@@ -1,13 +1,21 @@
+import atexit
 import datetime
-import json
+import functools
+import itertools
 import logging
+import queue
 import traceback
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Optional
 
 import click
+import msgspec
 from dateutil import tz
 
 from src.common import app_config
 
+_CENTRAL_TZ = tz.gettz("America/Chicago")
+
 
 class ColorFormatter(logging.Formatter):
     level_name_colors = {
@@ -29,7 +37,51 @@ class ColorFormatter(logging.Formatter):
         return super().formatMessage(record)
 
 
+class StructuredLog(msgspec.Struct, frozen=True, kw_only=True):
+    time: str
+    utc_time: str
+    cst_time: str
+    level: str
+    message: str
+    stack_trace: Optional[str]
+    thread_name: Optional[str]
+    thread_id: Optional[int]
+    process_id: Optional[int]
+    process_name: Optional[str]
+    is_healthcheck: bool
+    environment: str
+
+
+@functools.lru_cache(maxsize=8)
+def _second_timestamps(second: int) -> tuple[str, str]:
+    """
+    The UTC and Central timestamps for a whole second. They only have second precision, so records logged within the
+    same second share them.
+    """
+    utc_time = datetime.datetime.fromtimestamp(second, tz=datetime.UTC)
+    return (
+        utc_time.strftime("%Y-%m-%d %I:%M:%S%p"),
+        utc_time.astimezone(tz=_CENTRAL_TZ).strftime("%Y-%m-%d %I:%M:%S%p"),
+    )
+
+
+_HEALTHCHECK_PATHS = frozenset(
+    f"{base_url}/health{probe}" for base_url in ("", app_config.API_BASE_URL) for probe in ("", "/live", "/ready")
+)
+
+
+def _is_healthcheck(record: logging.LogRecord) -> bool:
+    return (
+        record.name == "uvicorn.access"
+        and isinstance(record.args, tuple)
+        and len(record.args) >= 3
+        and record.args[2] in _HEALTHCHECK_PATHS
+    )
+
+
 class StructuredFormatter(logging.Formatter):
+    _encoder = msgspec.json.Encoder()
+
     def format(self, record: logging.LogRecord) -> str:
         stack_trace = (
             "".join(traceback.format_exception(record.exc_info[1])) if record.exc_info and record.exc_info[1] else None
@@ -39,33 +91,93 @@ class StructuredFormatter(logging.Formatter):
             if record.exc_info and record.exc_info[1]
             else None
         )
-        is_healthcheck = (
-            record.name == "uvicorn.access"
-            and hasattr(record, "args")
-            and record.args is not None
-            and isinstance(record.args, tuple)
-            and len(record.args) >= 3
-            and record.args[2] == "/health"
+        utc_time, cst_time = _second_timestamps(int(record.created))
+        structured_log = StructuredLog(
+            time=datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(),
+            utc_time=utc_time,
+            cst_time=cst_time,
+            level=record.levelname,
+            message=formatted_exc if formatted_exc else record.getMessage(),
+            stack_trace=stack_trace,
+            thread_name=record.threadName,
+            thread_id=record.thread,
+            process_id=record.process,
+            process_name=record.processName,
+            is_healthcheck=getattr(record, "is_healthcheck", False) or _is_healthcheck(record),
+            environment=app_config.ENV.value,
         )
-        message = formatted_exc if formatted_exc else record.getMessage()
-        local_time = datetime.datetime.fromtimestamp(record.created).astimezone()
-        utc_time = local_time.astimezone(datetime.UTC)
-        cst_time = local_time.astimezone(tz=tz.gettz("America/Chicago"))
-        json_log = {
-            "time": local_time.isoformat(),
-            "utc_time": utc_time.strftime("%Y-%m-%d %I:%M:%S%p"),
-            "cst_time": cst_time.strftime("%Y-%m-%d %I:%M:%S%p"),
-            "level": record.levelname,
-            "message": message,
-            "stack_trace": stack_trace,
-            "thread_name": record.threadName,
-            "thread_id": record.thread,
-            "process_id": record.process,
-            "process_name": record.processName,
-            "is_healthcheck": is_healthcheck,
-            "environment": app_config.ENV.value,
-        }
-        return json.dumps(json_log)
+        return self._encoder.encode(structured_log).decode()
+
+
+class LogSampler(logging.Filter):
+    """
+    Keeps only every Nth healthcheck access log and every Nth not found (404) error log, which would otherwise
+    dominate the logs of a healthy app. N of 1 or less keeps every one.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._healthchecks = itertools.count()
+        self._not_found = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if _is_healthcheck(record):
+            record.is_healthcheck = True
+            return _sample(self._healthchecks, app_config.LOG_HEALTHCHECK_SAMPLE_EVERY)
+        if getattr(record, "status_code", None) == 404:
+            return _sample(self._not_found, app_config.LOG_NOT_FOUND_SAMPLE_EVERY)
+        return True
+
+
+def _sample(counter: Iterator[int], every: int) -> bool:
+    return every <= 1 or next(counter) % every == 0
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    A `QueueHandler` that leaves formatting to the listener thread
+
+    Only the message is interpolated on the logging thread, so later changes to the arguments can't change it.
+    Timestamps, tracebacks and JSON encoding are all handled by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_queue_handler: Optional[QueueHandler] = None
+
+
+def _get_queue_handler() -> QueueHandler:
+    """
+    The handler shared by every app logger. Records are put on a queue and written to stderr by a single listener
+    thread, so the event loop never waits on formatting or I/O.
+    """
+    global _queue_handler
+    if _queue_handler is None:
+        if app_config.ENV == app_config.Environment.LOCAL_DEV:
+            formatter = ColorFormatter("%(levelprefix)s%(message)s")
+        else:
+            formatter = StructuredFormatter()
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setLevel(app_config.LOG_LEVEL)
+        stream_handler.setFormatter(formatter)
+
+        log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        listener.start()
+        # Flush anything still queued when the process exits
+        atexit.register(listener.stop)
+
+        sampler = LogSampler()
+        _queue_handler = _DeferredQueueHandler(log_queue)
+        _queue_handler.addFilter(sampler)
+        logging.getLogger("uvicorn.access").addFilter(sampler)
+
+    return _queue_handler
 
 
 def get_logger(name: str) -> logging.Logger:
@@ -73,14 +185,8 @@ def get_logger(name: str) -> logging.Logger:
 
     logger.setLevel(app_config.LOG_LEVEL)
 
-    if app_config.ENV == app_config.Environment.LOCAL_DEV:
-        formatter = ColorFormatter("%(levelprefix)s%(message)s")
-    else:
-        formatter = StructuredFormatter()
-
-    ch = logging.StreamHandler()
-    ch.setLevel(app_config.LOG_LEVEL)
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,138 @@
+"""
+Prometheus metrics for the app, exposed at `GET /api/v1/metrics`
+
+Metrics are recorded into prometheus_client's default registry. Set `METRICS_ENABLED=false` to skip recording.
+"""
+
+import functools
+import time
+from typing import Awaitable, Callable, Optional, ParamSpec, TypeVar
+
+from litestar.enums import ScopeType
+from litestar.types import ASGIApp, Message, Receive, Scope, Send
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.common import app_config
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# Database work is mostly sub-millisecond, so it needs finer buckets than prometheus_client's request-sized defaults
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve HTTP requests, by route template",
+    ["method", "route", "status_code"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served, by route template",
+    ["method", "route"],
+    # Summed across worker processes when running with several
+    multiprocess_mode="livesum",
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time spent in CharacterRepo queries, by repo method",
+    ["query"],
+    buckets=DB_BUCKETS,
+)
+LOCK_WAIT = Histogram(
+    "db_advisory_lock_wait_seconds",
+    "Time spent waiting for advisory locks, by lock name",
+    ["lock"],
+    buckets=DB_BUCKETS,
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of a pool, by pool name",
+    ["pool"],
+    buckets=DB_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups",
+    "Cache lookups by cache name and result (hit or miss). Divide hits by the total for the hit ratio.",
+    ["cache", "result"],
+)
+
+
+def timed_query(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+    """
+    Decorate a repo method to record how long it takes in `QUERY_DURATION`, labelled with the method's name
+    """
+    histogram = QUERY_DURATION.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        if not app_config.METRICS_ENABLED:
+            return await func(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    if app_config.METRICS_ENABLED:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and in-flight requests for HTTP routes
+
+    Requests are labelled with their route template (e.g. `/api/v1/character/{id:int}`) rather than their path, so that
+    every character shares the same series.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._routes: dict[int, str] = {}
+
+    def _route_template(self, scope: Scope) -> str:
+        route_handler = scope["route_handler"]
+        route = self._routes.get(id(route_handler))
+        if route is None:
+            for app_route in scope["app"].routes:
+                for handler in getattr(app_route, "route_handlers", ()):
+                    self._routes[id(handler)] = app_route.path
+            route = self._routes.setdefault(id(route_handler), scope["path"])
+        return route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != ScopeType.HTTP or not app_config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_template(scope)
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_DURATION.labels(method, route, str(status_code or 500)).observe(time.perf_counter() - start)
+
+
+def lock_name(key: str) -> str:
+    """
+    Strip the trailing id from an advisory lock key (e.g. `CharacterService__heal_1`), so locks are labelled by
+    operation rather than by character
+    """
+    name, _, suffix = key.rpartition("_")
+    return name if name and suffix.isdigit() else key
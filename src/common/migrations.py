@@ -0,0 +1,128 @@
+"""
+Versioned schema migrations
+
+Migrations are SQL files in `MIGRATION_PATH` named like Flyway's versioned migrations, `V<version>__<description>.sql`.
+Each database records the migrations applied to it, with their checksums, in `operational.schema_version`. `migrate`
+applies any pending migrations in version order, each in its own transaction along with its `schema_version` row.
+
+When the schema is already current, `migrate` costs one query. Otherwise it takes a session-level advisory lock before
+applying anything, so when several workers start at once exactly one of them migrates and the rest wait for it and then
+find nothing left to do. A migration whose file no longer matches the checksum it was applied with fails startup,
+since editing an applied migration never changes a database that has already run it.
+"""
+
+import functools
+import hashlib
+import re
+from pathlib import Path
+
+import msgspec
+from psycopg import AsyncConnection, errors
+
+from src.common.app_error import AppError
+from src.common.log_config import get_logger
+from src.common.utils import advisory_lock_key
+
+LOG = get_logger(__name__)
+
+MIGRATION_LOCK_KEY = advisory_lock_key("schema_migrations")
+
+_MIGRATION_FILE = re.compile(r"^V(\d+)__(\w+)\.sql$")
+
+
+class MigrationException(AppError): ...
+
+
+class Migration(msgspec.Struct, frozen=True, kw_only=True):
+    version: int
+    description: str
+    sql: str
+    checksum: str
+
+
+@functools.cache
+def load_migrations(path: Path) -> tuple[Migration, ...]:
+    """
+    Load the migrations in `path`, in version order
+    """
+    migrations: dict[int, Migration] = {}
+    for file in path.iterdir():
+        match = _MIGRATION_FILE.match(file.name)
+        if not match:
+            continue
+
+        version = int(match[1])
+        if version in migrations:
+            raise MigrationException(f"Found more than one migration with version {version}")
+        sql = file.read_text()
+        migrations[version] = Migration(
+            version=version,
+            description=match[2].replace("_", " "),
+            sql=sql,
+            checksum=hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+        )
+    return tuple(migrations[version] for version in sorted(migrations))
+
+
+async def _applied_checksums(conn: AsyncConnection) -> dict[int, str]:
+    res = await (await conn.execute("SELECT version, checksum FROM operational.schema_version")).fetchall()
+    return {version: checksum for version, checksum in res}
+
+
+def _pending(migrations: tuple[Migration, ...], applied: dict[int, str]) -> list[Migration]:
+    pending: list[Migration] = []
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            pending.append(migration)
+        elif checksum != migration.checksum:
+            raise MigrationException(
+                f"Migration V{migration.version} ({migration.description}) has changed since it was applied"
+            )
+    if unknown := set(applied) - {migration.version for migration in migrations}:
+        LOG.warning("Database has migrations this version of the app doesn't know about: %s", sorted(unknown))
+    return pending
+
+
+async def migrate(conn_str: str, path: Path) -> int:
+    """
+    Apply the pending migrations in `path` to the database at `conn_str`, returning how many were applied
+    """
+    migrations = load_migrations(path)
+    async with await AsyncConnection.connect(conn_str, autocommit=True) as conn:
+        try:
+            if not _pending(migrations, await _applied_checksums(conn)):
+                return 0
+        except errors.UndefinedTable:
+            pass
+
+        await conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            await conn.execute(
+                """
+                CREATE SCHEMA IF NOT EXISTS operational;
+                CREATE TABLE IF NOT EXISTS operational.schema_version (
+                    version INT PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    checksum TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+
+            # Another worker may have migrated while this one waited for the lock
+            pending = _pending(migrations, await _applied_checksums(conn))
+            for migration in pending:
+                LOG.info("Applying migration V%s (%s)", migration.version, migration.description)
+                async with conn.transaction():
+                    await conn.execute(migration.sql.encode("utf-8"))
+                    await conn.execute(
+                        """
+                        INSERT INTO operational.schema_version (version, description, checksum)
+                        VALUES (%s, %s, %s)
+                        """,
+                        (migration.version, migration.description, migration.checksum),
+                    )
+            return len(pending)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
@@ -0,0 +1,316 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import AbstractAsyncContextManager, AsyncExitStack, asynccontextmanager
+from functools import partial
+from types import TracebackType
+from typing import Any, AsyncIterator, Callable, Optional
+
+import msgspec
+from psycopg import AsyncConnection, AsyncCursor, errors
+from psycopg.rows import AsyncRowFactory
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.character.exceptions import CharacterNotFoundException
+from src.character.models import CharacterHitpoints
+from src.common import app_config
+from src.common.log_config import get_logger
+from src.common.metrics import POOL_CHECKOUT_WAIT
+from src.common.utils import dict_row_camel
+
+LOG = get_logger(__name__)
+
+
+class AcquireStats:
+    """
+    Tracks how long requests wait to check a connection out of a pool
+
+    Percentiles are computed over a bounded window of the most recent acquisitions.
+    """
+
+    def __init__(self, window: int = app_config.DB_POOL_STATS_WINDOW) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self._recent.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self._recent:
+            return 0.0
+        recent = sorted(self._recent)
+        return recent[min(len(recent) - 1, int(p * len(recent)))]
+
+
+class PoolStats(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    name: str
+    pool_min: int
+    pool_max: int
+    pool_size: int
+    pool_available: int
+    requests_waiting: int
+    requests_num: int
+    requests_errors: int
+    connections_lost: int
+    acquire_count: int
+    acquire_avg_ms: float
+    acquire_p50_ms: float
+    acquire_p99_ms: float
+    acquire_max_ms: float
+
+
+# Acquire stats for every pool created with `create_pool`, keyed by pool name
+_acquire_stats: dict[str, AcquireStats] = {}
+
+
+async def _configure_connection(conn: AsyncConnection[Any], read_only: bool = False) -> None:
+    """
+    Configure each new pooled connection and prepare the repo's hot statements on it
+
+    Pools are opened before migrations run, so on first boot the tables may not exist yet. Those connections are
+    prepared by `warm_pool` once the schema is in place.
+    """
+    conn.prepare_threshold = app_config.DB_PREPARE_THRESHOLD
+    await _prepare_connection(conn, read_only)
+
+
+async def _prepare_connection(conn: AsyncConnection[Any], read_only: bool = False) -> None:
+    try:
+        async with conn.cursor(row_factory=dict_row_camel) as cur:
+            await prepare_hot_statements(CharacterRepo(cur), read_only)
+    except errors.UndefinedTable:
+        await conn.rollback()
+    else:
+        # Rolling back deallocates every prepared statement, and these only touched a character that doesn't exist
+        await conn.commit()
+
+
+async def prepare_hot_statements(character_repo: CharacterRepo, read_only: bool = False):
+    """
+    Run the statements behind `get_character` and `update_hitpoints` against a character id that doesn't exist, so
+    that they are prepared before the connection serves its first request
+
+    Read only connections, such as a hot standby's, can't run `update_hitpoints`, so only the reads are prepared on
+    them.
+    """
+    if not read_only:
+        try:
+            await character_repo.update_hitpoints(
+                character_id=0,
+                hitpoints=CharacterHitpoints(hit_point_max=0, current_hit_points=0, temporary_hit_points=0),
+            )
+        except CharacterNotFoundException:
+            pass
+
+    try:
+        await character_repo.get_character(character_id=0)
+    except CharacterNotFoundException:
+        pass
+
+    try:
+        await character_repo.get_character_stats(character_id=0)
+    except CharacterNotFoundException:
+        pass
+
+    await character_repo.get_character_classes(character_id=0)
+    await character_repo.get_character_items(character_id=0)
+    await character_repo.get_character_defenses(character_id=0)
+
+
+def pool_size() -> tuple[int, int]:
+    """
+    The min and max size of this worker's pools: `DB_POOL_MIN_SIZE` and `DB_POOL_MAX_SIZE`, capped at this worker's
+    share of `DB_CONNECTION_BUDGET` when one is set
+    """
+    max_size = app_config.DB_POOL_MAX_SIZE
+    if app_config.DB_CONNECTION_BUDGET:
+        max_size = min(max_size, max(1, app_config.DB_CONNECTION_BUDGET // app_config.WEB_WORKERS))
+    return min(app_config.DB_POOL_MIN_SIZE, max_size), max_size
+
+
+def create_pool(conn_str: str, name: str, read_only: bool = False) -> AsyncConnectionPool:
+    """
+    Create an unopened connection pool sized and tuned from `app_config`. Open it with `open_pool`.
+
+    Pass `read_only` for pools of a read replica, whose connections only prepare the read statements.
+    """
+    _acquire_stats[name] = AcquireStats()
+    min_size, max_size = pool_size()
+    return AsyncConnectionPool(
+        conn_str,
+        name=name,
+        open=False,
+        min_size=min_size,
+        max_size=max_size,
+        max_idle=app_config.DB_POOL_MAX_IDLE_SECONDS,
+        max_lifetime=app_config.DB_POOL_MAX_LIFETIME_SECONDS,
+        timeout=app_config.DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+        configure=partial(_configure_connection, read_only=read_only),
+        check=AsyncConnectionPool.check_connection if app_config.DB_POOL_CHECK_CONNECTIONS else None,
+    )
+
+
+@asynccontextmanager
+async def open_pool(pool: AsyncConnectionPool) -> AsyncIterator[AsyncConnectionPool]:
+    """
+    Open `pool`, waiting until it holds `min_size` warmed connections, and close it on exit
+    """
+    start = time.perf_counter()
+    await pool.open(wait=True, timeout=app_config.DB_POOL_WARMUP_TIMEOUT_SECONDS)
+    LOG.info("Warmed %s connections for pool '%s' in %.3fs", pool.min_size, pool.name, time.perf_counter() - start)
+    try:
+        yield pool
+    finally:
+        await pool.close()
+
+
+async def warm_pool(pool: AsyncConnectionPool, read_only: bool = False) -> None:
+    """
+    Prepare the hot statements on `min_size` connections of an open pool by checking them out concurrently, only the
+    read statements if the pool is `read_only`
+    """
+    checked_out = asyncio.Event()
+    waiting = pool.min_size
+
+    async def prepare_one():
+        nonlocal waiting
+        async with pool.connection() as conn:
+            await _prepare_connection(conn, read_only)
+            # Hold on to the connection until every other one is checked out, so each gets its own connection
+            waiting -= 1
+            if not waiting:
+                checked_out.set()
+            await checked_out.wait()
+
+    await asyncio.gather(*(prepare_one() for _ in range(pool.min_size)))
+
+
+@asynccontextmanager
+async def acquire(pool: AsyncConnectionPool) -> AsyncIterator[AsyncConnection[Any]]:
+    """
+    Check a connection out of `pool`, recording how long the checkout took
+    """
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        waited = time.perf_counter() - start
+        if stats := _acquire_stats.get(pool.name):
+            stats.record(waited)
+        if app_config.METRICS_ENABLED:
+            POOL_CHECKOUT_WAIT.labels(pool.name).observe(waited)
+        yield conn
+
+
+class LazyConnection:
+    """
+    A database connection that is only checked out when the first query runs and is returned to its pool as soon as its
+    transaction is committed
+
+    Requests that never query, or that fail validation first, never hold a connection, and handlers that commit before
+    returning give the connection back before their response is encoded. Querying again after a commit checks out a
+    new connection. On exit, a connection that is still checked out is committed, or rolled back on error, and returned.
+    """
+
+    def __init__(self, connect: Callable[[], AbstractAsyncContextManager[AsyncConnection[Any]]]) -> None:
+        self._connect = connect
+        self._stack: Optional[AsyncExitStack] = None
+        self._conn: Optional[AsyncConnection[Any]] = None
+
+    async def __aenter__(self) -> "LazyConnection":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        await self._release(exc_type, exc, tb)
+
+    @property
+    def checked_out(self) -> bool:
+        return self._conn is not None
+
+    async def connection(self) -> AsyncConnection[Any]:
+        """
+        The underlying connection, checking one out if needed
+        """
+        if self._conn is None:
+            stack = AsyncExitStack()
+            self._conn = await stack.enter_async_context(self._connect())
+            self._stack = stack
+        return self._conn
+
+    async def execute(self, query: Any, params: Any = None) -> AsyncCursor[Any]:
+        return await (await self.connection()).execute(query, params)
+
+    def cursor(self, row_factory: AsyncRowFactory[Any]) -> "LazyCursor":
+        return LazyCursor(self, row_factory)
+
+    async def commit(self) -> None:
+        """
+        Commit the current transaction, if any, and return the connection to its pool
+        """
+        if self._conn is not None:
+            await self._conn.commit()
+            await self._release(None, None, None)
+
+    async def _release(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        if self._stack is not None:
+            stack, self._stack, self._conn = self._stack, None, None
+            await stack.__aexit__(exc_type, exc, tb)
+
+
+class LazyCursor:
+    """
+    A cursor over a `LazyConnection`. Only `execute` and `executemany` are supported; results are read from the
+    `AsyncCursor` that `execute` returns.
+    """
+
+    def __init__(self, conn: LazyConnection, row_factory: AsyncRowFactory[Any]) -> None:
+        self.conn = conn
+        self._row_factory = row_factory
+        self._cur: Optional[AsyncCursor[Any]] = None
+
+    async def _cursor(self) -> AsyncCursor[Any]:
+        conn = await self.conn.connection()
+        if self._cur is None or self._cur.connection is not conn:
+            self._cur = conn.cursor(row_factory=self._row_factory)
+        return self._cur
+
+    async def execute(self, query: Any, params: Any = None) -> AsyncCursor[Any]:
+        return await (await self._cursor()).execute(query, params)
+
+    async def executemany(self, query: Any, params_seq: Any) -> None:
+        await (await self._cursor()).executemany(query, params_seq)
+
+
+def get_pool_stats(pool: AsyncConnectionPool) -> PoolStats:
+    stats = pool.get_stats()
+    acquire_stats = _acquire_stats.get(pool.name) or AcquireStats()
+    return PoolStats(
+        name=pool.name,
+        pool_min=stats.get("pool_min", 0),
+        pool_max=stats.get("pool_max", 0),
+        pool_size=stats.get("pool_size", 0),
+        pool_available=stats.get("pool_available", 0),
+        requests_waiting=stats.get("requests_waiting", 0),
+        requests_num=stats.get("requests_num", 0),
+        requests_errors=stats.get("requests_errors", 0),
+        connections_lost=stats.get("connections_lost", 0),
+        acquire_count=acquire_stats.count,
+        acquire_avg_ms=(acquire_stats.total_seconds / acquire_stats.count * 1000) if acquire_stats.count else 0.0,
+        acquire_p50_ms=acquire_stats.percentile(0.5) * 1000,
+        acquire_p99_ms=acquire_stats.percentile(0.99) * 1000,
+        acquire_max_ms=acquire_stats.max_seconds * 1000,
+    )
@@ -0,0 +1,211 @@
+"""
+On-demand sampling profiler for requests
+
+Profiling has to be allowed with `PROFILING_ENABLED`. Once allowed, a fraction of requests set through
+`PUT /api/v1/admin/profiling` is profiled, as is any request carrying `PROFILING_TOKEN` in its `X-Profile-Token` header.
+While a profiled request is running on the event loop, a background thread samples the loop thread's stack every
+`PROFILING_INTERVAL_SECONDS`. Samples are aggregated as collapsed stacks (`frame;frame;frame count`), ready for
+flamegraph.pl or speedscope, and downloaded from `GET /api/v1/admin/profiling/stacks`.
+
+Only time spent running Python on the event loop is sampled. Time a request spends awaiting the database shows up in
+the metrics and query tracing instead.
+"""
+
+import asyncio
+import random
+import sys
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from types import FrameType
+from typing import Annotated, Iterator, Optional, cast
+
+import msgspec
+from litestar import Litestar
+from litestar.datastructures import Headers, State
+from litestar.enums import ScopeType
+from litestar.types import ASGIApp, Receive, Scope, Send
+
+from src.common import app_config
+from src.common.app_error import AppError
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+
+# Stack that samples are counted under once `PROFILING_MAX_STACKS` distinct stacks have been collected
+TRUNCATED_STACK = "[truncated]"
+
+
+class ProfilingSettings(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    sample_rate: Annotated[float, msgspec.Meta(ge=0, le=1)]
+
+
+class ProfilingStatus(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    enabled: bool
+    sample_rate: float
+    profiled_requests: int
+    samples: int
+    stacks: int
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+    """
+    Collapse a stack into a single `;`-separated line, outermost frame first
+    """
+    frames: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class RequestProfiler:
+    """
+    Samples the event loop thread's stack while profiled requests are running, aggregating the samples by stack
+    """
+
+    def __init__(
+        self,
+        interval: float = app_config.PROFILING_INTERVAL_SECONDS,
+        max_stacks: int = app_config.PROFILING_MAX_STACKS,
+    ) -> None:
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.sample_rate = 0.0
+        self.profiled_requests = 0
+        self.samples = 0
+        self._stacks: Counter[str] = Counter()
+        self._tasks: set[asyncio.Task[object]] = set()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def should_profile(self, headers: Headers) -> bool:
+        token = headers.get(PROFILE_TOKEN_HEADER)
+        if token is not None and app_config.PROFILING_TOKEN and token == app_config.PROFILING_TOKEN:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """
+        Sample the stack whenever the current task is running, until the block exits
+        """
+        task = asyncio.current_task()
+        if task is None:
+            yield
+            return
+
+        self._start()
+        self.profiled_requests += 1
+        self._tasks.add(task)
+        self._active.set()
+        try:
+            yield
+        finally:
+            self._tasks.discard(task)
+            if not self._tasks:
+                self._active.clear()
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._active.wait()
+            if self._stop.wait(self.interval):
+                return
+            self._sample()
+
+    def _sample(self) -> None:
+        # Only count the sample if the loop is running one of the profiled requests right now
+        if asyncio.current_task(self._loop) not in self._tasks or self._loop_thread_id is None:
+            return
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = collapse_stack(frame)
+        with self._lock:
+            self.samples += 1
+            if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                stack = TRUNCATED_STACK
+            self._stacks[stack] += 1
+
+    def collapsed_stacks(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.profiled_requests = 0
+
+    def status(self) -> ProfilingStatus:
+        return ProfilingStatus(
+            enabled=app_config.PROFILING_ENABLED,
+            sample_rate=self.sample_rate,
+            profiled_requests=self.profiled_requests,
+            samples=self.samples,
+            stacks=len(self._stacks),
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._active.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+@asynccontextmanager
+async def request_profiler(app: Litestar):
+    """
+    Creates a context manager for the per-process request profiler, stopping its sampling thread on exit
+
+    The profiler is stored within the application state.
+    """
+    profiler = RequestProfiler()
+    app.state.request_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+
+
+def provide_request_profiler(state: State) -> RequestProfiler:
+    """
+    Provides the request profiler stored in the application state
+    """
+    if "request_profiler" not in state:
+        raise AppError("Cannot find request profiler in application state")
+
+    return cast(RequestProfiler, state.request_profiler)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests picked by the application's `RequestProfiler`
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profiler = cast(Optional[RequestProfiler], scope["app"].state.get("request_profiler"))
+        if (
+            scope["type"] != ScopeType.HTTP
+            or not app_config.PROFILING_ENABLED
+            or profiler is None
+            or not profiler.should_profile(Headers.from_scope(scope))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        with profiler.profile():
+            await self.app(scope, receive, send)
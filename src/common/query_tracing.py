@@ -0,0 +1,188 @@
+"""
+Per-request query tracing
+
+When `QUERY_TRACING_ENABLED` is set, `provide_db` and `provide_read_db` wrap their cursors in a `TracingCursor` that
+records every statement a request runs into the request's `QueryTracer`. `QueryTracingMiddleware` then reports the
+queries in a `Server-Timing` header, logs statements repeated often enough to look like an N+1, and keeps recent
+reports for `GET /api/v1/admin/query-reports`.
+"""
+
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Iterable, Optional
+
+import msgspec
+from litestar.datastructures import MutableScopeHeaders
+from litestar.enums import ScopeType
+from litestar.types import ASGIApp, Message, Receive, Scope, Send
+from psycopg import AsyncCursor, sql
+
+from src.common import app_config
+from src.common.log_config import get_logger
+from src.common.utils import DbCursor
+
+LOG = get_logger(__name__)
+
+# Key the request's tracer is stored under in the request state
+QUERY_TRACER_STATE_KEY = "query_tracer"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryTrace(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    statement: str
+    params_shape: str
+    duration_ms: float
+    row_count: int
+
+
+class RepeatedStatement(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    statement: str
+    count: int
+
+
+class QueryReport(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    method: str
+    path: str
+    query_count: int
+    total_ms: float
+    likely_n_plus_one: list[RepeatedStatement]
+    queries: list[QueryTrace]
+
+
+def params_shape(params: Any) -> str:
+    """
+    Describe the shape of query parameters without their values, e.g. `{id: int, name: str}`
+    """
+    match params:
+        case None:
+            return "none"
+        case dict():
+            return "{" + ", ".join(f"{k}: {params_shape(v)}" for k, v in params.items()) + "}"
+        case list() | tuple():
+            return f"{type(params).__name__}[{len(params)}]"
+        case _:
+            return type(params).__name__
+
+
+class QueryTracer:
+    """
+    Collects the statements run during one request
+    """
+
+    def __init__(self, repeat_threshold: int = app_config.QUERY_TRACING_REPEAT_THRESHOLD) -> None:
+        self.repeat_threshold = repeat_threshold
+        self.queries: list[QueryTrace] = []
+
+    def record(self, statement: str, params_shape: str, seconds: float, row_count: int) -> None:
+        self.queries.append(
+            QueryTrace(
+                statement=_WHITESPACE.sub(" ", statement).strip(),
+                params_shape=params_shape,
+                duration_ms=seconds * 1000,
+                row_count=row_count,
+            )
+        )
+
+    @property
+    def total_ms(self) -> float:
+        return sum(query.duration_ms for query in self.queries)
+
+    def repeated_statements(self) -> list[RepeatedStatement]:
+        """
+        Statements run at least `repeat_threshold` times, most repeated first. Running the same statement over and
+        over in one request usually means a loop issuing one query per row, which is better done as one batch query.
+        """
+        counts = Counter(query.statement for query in self.queries)
+        return [
+            RepeatedStatement(statement=statement, count=count)
+            for statement, count in counts.most_common()
+            if count >= self.repeat_threshold
+        ]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.3f};desc="{len(self.queries)} queries"'
+
+    def report(self, method: str = "", path: str = "") -> QueryReport:
+        return QueryReport(
+            method=method,
+            path=path,
+            query_count=len(self.queries),
+            total_ms=self.total_ms,
+            likely_n_plus_one=self.repeated_statements(),
+            queries=list(self.queries),
+        )
+
+
+class TracingCursor:
+    """
+    Wraps a cursor to record every statement it runs, with its parameters' shape, duration and row count
+    """
+
+    def __init__(self, cursor: DbCursor, tracer: QueryTracer) -> None:
+        self.cursor = cursor
+        self.tracer = tracer
+
+    async def execute(self, query: Any, params: Any = None) -> AsyncCursor[Any]:
+        start = time.perf_counter()
+        cur = await self.cursor.execute(query, params)
+        self.tracer.record(_statement(query, cur), params_shape(params), time.perf_counter() - start, cur.rowcount)
+        return cur
+
+    async def executemany(self, query: Any, params_seq: Iterable[Any]) -> None:
+        params_list = list(params_seq)
+        start = time.perf_counter()
+        await self.cursor.executemany(query, params_list)
+        shape = f"{len(params_list)} x {params_shape(params_list[0]) if params_list else 'none'}"
+        # executemany doesn't report a row count without `returning`, so report the number of parameter sets
+        self.tracer.record(_statement(query, None), shape, time.perf_counter() - start, len(params_list))
+
+
+def _statement(query: Any, cur: Optional[AsyncCursor[Any]]) -> str:
+    if isinstance(query, sql.Composable) and cur is not None:
+        return query.as_string(cur)
+    if isinstance(query, bytes):
+        return query.decode()
+    return str(query)
+
+
+# Reports for the most recent traced requests
+recent_reports: deque[QueryReport] = deque(maxlen=app_config.QUERY_TRACING_REPORT_HISTORY)
+
+
+class QueryTracingMiddleware:
+    """
+    Adds a `Server-Timing` header for the queries a request ran, and logs and keeps a report of them
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != ScopeType.HTTP or not app_config.QUERY_TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        tracer = QueryTracer()
+        scope.setdefault("state", {})[QUERY_TRACER_STATE_KEY] = tracer
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and tracer.queries:
+                MutableScopeHeaders.from_message(message).add("Server-Timing", tracer.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if tracer.queries:
+                report = tracer.report(method=scope["method"], path=scope["path"])
+                recent_reports.append(report)
+                for repeated in report.likely_n_plus_one:
+                    LOG.warning(
+                        "Likely N+1: %s %s ran %s times: %s",
+                        report.method,
+                        report.path,
+                        repeated.count,
+                        repeated.statement,
+                    )
@@ -0,0 +1,254 @@
+"""
+A local append-only log of records, split across segment files
+
+Each record is an opaque byte string stored with a 4 byte big endian length prefix, and is identified by its offset,
+its position in the log counting from 0. Segments are named after the offset of their first record
+(`00000000000000000000.log`) and a new one is started once the current one reaches its size limit, so the log can be
+trimmed by deleting the oldest segments once every consumer has read past them.
+
+There is one writer per log, `SegmentedLogWriter`, and any number of readers, `SegmentedLogReader`, in any process.
+Readers memory map the segments and never take locks, so a reader can find the writer's last record half written. It
+stops before it until the writer finishes it. A writer opening a log cuts off a half written last record left by a
+crash. `ConsumerOffsets` keeps the offset each named consumer has read up to, so a consumer can carry on where it left
+off.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, Iterable, Optional
+
+from src.common.app_error import AppError
+
+_LENGTH = struct.Struct(">I")
+_SEGMENT_SUFFIX = ".log"
+
+
+class SegmentedLogException(AppError): ...
+
+
+def _segment_path(path: Path, base_offset: int) -> Path:
+    return path / f"{base_offset:020d}{_SEGMENT_SUFFIX}"
+
+
+def _list_segments(path: Path) -> list[int]:
+    """
+    The base offsets of the log's segments, in order
+    """
+    return sorted(int(segment.stem) for segment in path.glob(f"*{_SEGMENT_SUFFIX}") if segment.stem.isdigit())
+
+
+def _scan(data: bytes, size: int) -> tuple[int, int]:
+    """
+    Walk the complete records of `data[:size]`, returning how many there are and where the last one ends
+    """
+    count = 0
+    position = 0
+    while position + _LENGTH.size <= size:
+        (length,) = _LENGTH.unpack_from(data, position)
+        if position + _LENGTH.size + length > size:
+            break
+        position += _LENGTH.size + length
+        count += 1
+    return count, position
+
+
+class SegmentedLogWriter:
+    """
+    Appends records to the log at `path`, starting a new segment once the current one holds `segment_bytes`
+    """
+
+    def __init__(self, path: Path, segment_bytes: int) -> None:
+        self.path = path
+        self.segment_bytes = segment_bytes
+        path.mkdir(parents=True, exist_ok=True)
+
+        segments = _list_segments(path)
+        base_offset = segments[-1] if segments else 0
+        segment = _segment_path(path, base_offset)
+        data = segment.read_bytes() if segment.exists() else b""
+        count, end = _scan(data, len(data))
+
+        self._file: BinaryIO = open(segment, "ab")
+        if end < len(data):
+            # A crash left the last record half written
+            self._file.truncate(end)
+        self._size = end
+        self.next_offset = base_offset + count
+
+    def __enter__(self) -> "SegmentedLogWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def _roll(self) -> None:
+        self.sync()
+        self._file.close()
+        self._file = open(_segment_path(self.path, self.next_offset), "ab")
+        self._size = 0
+
+    def append(self, records: Iterable[bytes]) -> int:
+        """
+        Append `records`, returning the offset the next record will get. They're only durable once `sync` returns.
+        """
+        for record in records:
+            if self._size >= self.segment_bytes:
+                self._roll()
+            self._file.write(_LENGTH.pack(len(record)))
+            self._file.write(record)
+            self._size += _LENGTH.size + len(record)
+            self.next_offset += 1
+        return self.next_offset
+
+    def sync(self) -> None:
+        """
+        Flush appended records to disk
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+class SegmentedLogReader:
+    """
+    Reads records from the log at `path` by offset, picking up records and segments as they're written
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._maps: dict[int, mmap.mmap] = {}
+        # Where the last read ended, as (offset, segment base offset, position in segment), so reading on from there
+        # doesn't have to walk the segment from its start
+        self._cursor: Optional[tuple[int, int, int]] = None
+
+    def __enter__(self) -> "SegmentedLogReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def _map(self, base_offset: int) -> Optional[mmap.mmap]:
+        """
+        Map a segment, mapping it again when it has grown since it was last mapped
+        """
+        mapped = self._maps.get(base_offset)
+        segment = _segment_path(self.path, base_offset)
+        size = segment.stat().st_size
+        if mapped is not None and len(mapped) == size:
+            return mapped
+        if mapped is not None:
+            mapped.close()
+            del self._maps[base_offset]
+        if size == 0:
+            return None
+
+        with open(segment, "rb") as fp:
+            mapped = mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ)
+        self._maps[base_offset] = mapped
+        return mapped
+
+    def _seek(self, offset: int) -> Optional[tuple[int, int, int]]:
+        """
+        Find `offset` by walking its segment from the start, or `None` if it hasn't been written yet
+        """
+        segments = _list_segments(self.path)
+        index = bisect.bisect_right(segments, offset) - 1
+        if index < 0:
+            if segments:
+                raise SegmentedLogException(f"Offset {offset} is before the start of the log")
+            return None
+
+        base_offset = segments[index]
+        mapped = self._map(base_offset)
+        size = len(mapped) if mapped is not None else 0
+        position = 0
+        for _ in range(offset - base_offset):
+            if mapped is None or position + _LENGTH.size > size:
+                return None
+            (length,) = _LENGTH.unpack_from(mapped, position)
+            position += _LENGTH.size + length
+        return offset, base_offset, position
+
+    def read(self, offset: int, max_records: int) -> list[tuple[int, bytes]]:
+        """
+        Up to `max_records` records from `offset` on, with their offsets. Empty once the reader has caught up.
+        """
+        cursor = self._cursor if self._cursor is not None and self._cursor[0] == offset else self._seek(offset)
+        if cursor is None:
+            return []
+
+        records: list[tuple[int, bytes]] = []
+        _, base_offset, position = cursor
+        mapped = self._map(base_offset)
+        while len(records) < max_records:
+            size = len(mapped) if mapped is not None else 0
+            if mapped is not None and position + _LENGTH.size <= size:
+                (length,) = _LENGTH.unpack_from(mapped, position)
+                start = position + _LENGTH.size
+                if start + length <= size:
+                    records.append((offset, mapped[start : start + length]))
+                    position = start + length
+                    offset += 1
+                    continue
+
+            # The writer only starts a segment once the one before it is complete, so at the end of this one carry on
+            # in the next if it exists
+            if offset == base_offset or not _segment_path(self.path, offset).exists():
+                break
+            base_offset, position = offset, 0
+            mapped = self._map(base_offset)
+
+        self._cursor = (offset, base_offset, position)
+        return records
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+
+class ConsumerOffsets:
+    """
+    The offset each named consumer of a log will read next, stored as one small file per consumer in `path`
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.mkdir(parents=True, exist_ok=True)
+
+    def get(self, consumer: str) -> int:
+        try:
+            return int((self.path / f"{consumer}.offset").read_text())
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, consumer: str, offset: int) -> None:
+        """
+        Record that `consumer` has handled every record before `offset`
+        """
+        target = self.path / f"{consumer}.offset"
+        temporary = target.with_suffix(".tmp")
+        with open(temporary, "w") as fp:
+            fp.write(str(offset))
+            fp.flush()
+            os.fsync(fp.fileno())
+        # Replacing the file is atomic, so a crash leaves either the old offset or the new one
+        os.replace(temporary, target)
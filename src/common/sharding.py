@@ -0,0 +1,100 @@
+from typing import Iterable, Sequence
+
+import msgspec
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from src.common import app_config
+from src.common.app_error import AppError
+
+
+class ShardingException(AppError): ...
+
+
+class ShardMap(msgspec.Struct, frozen=True):
+    """
+    Maps each of a fixed number of buckets to the index of the shard that owns it
+
+    A character belongs to bucket `character_id % len(assignments)`. Keeping the bucket count fixed means rebalancing
+    only has to move whole buckets between shards instead of rehashing every character.
+    """
+
+    assignments: tuple[int, ...]
+
+    def shard_for(self, character_id: int) -> int:
+        return self.assignments[character_id % len(self.assignments)]
+
+    @staticmethod
+    def default(shard_count: int, bucket_count: int = app_config.SHARD_BUCKET_COUNT) -> "ShardMap":
+        return ShardMap(assignments=tuple(bucket % shard_count for bucket in range(bucket_count)))
+
+
+async def load_shard_map(directory: AsyncConnection, shard_count: int) -> ShardMap:
+    """
+    Load the shard map from the directory shard, persisting the default map for `shard_count` shards the first time
+
+    The map is persisted even with a single shard so that characters stay where they are when shards are added later.
+    """
+    await directory.execute(
+        """
+        INSERT INTO operational.shard_map (bucket, shard)
+        SELECT bucket, bucket %% %(shard_count)s
+        FROM generate_series(0, %(bucket_count)s - 1) bucket
+        ON CONFLICT DO NOTHING
+        """,
+        {"shard_count": shard_count, "bucket_count": app_config.SHARD_BUCKET_COUNT},
+    )
+    res = await (await directory.execute("SELECT bucket, shard FROM operational.shard_map ORDER BY bucket")).fetchall()
+    await directory.commit()
+
+    assignments = tuple(shard for _, shard in res)
+    if len(assignments) != app_config.SHARD_BUCKET_COUNT:
+        raise ShardingException(
+            f"Shard map has {len(assignments)} buckets but {app_config.SHARD_BUCKET_COUNT} are configured"
+        )
+    if max(assignments) >= shard_count:
+        raise ShardingException(f"Shard map references shard {max(assignments)} but only {shard_count} are configured")
+
+    return ShardMap(assignments=assignments)
+
+
+async def allocate_character_id(directory: AsyncConnection) -> int:
+    """
+    Allocate a globally unique character id from the directory shard's character id sequence
+    """
+    res = await (await directory.execute("SELECT nextval('operational.character_id_seq')")).fetchone()
+    if not res:
+        raise ShardingException("Unable to allocate character id")
+    return res[0]
+
+
+class ShardRouter:
+    """
+    Routes characters to the connection pool of the shard that owns them
+
+    Shard 0 is the directory shard: it is the primary database, holds the shard map and allocates character ids.
+    """
+
+    def __init__(self, pools: Sequence[AsyncConnectionPool], shard_map: ShardMap) -> None:
+        self.pools = list(pools)
+        self.shard_map = shard_map
+
+    @property
+    def directory(self) -> AsyncConnectionPool:
+        return self.pools[0]
+
+    def shard_for(self, character_id: int) -> int:
+        return self.shard_map.shard_for(character_id)
+
+    def pool_for(self, character_id: int) -> AsyncConnectionPool:
+        return self.pools[self.shard_for(character_id)]
+
+    def group_by_shard(self, character_ids: Iterable[int]) -> dict[int, list[int]]:
+        groups: dict[int, list[int]] = {}
+        for character_id in character_ids:
+            groups.setdefault(self.shard_for(character_id), []).append(character_id)
+        return groups
+
+    async def allocate_character_id(self) -> int:
+        async with self.directory.connection() as conn:
+            return await allocate_character_id(conn)
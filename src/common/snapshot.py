@@ -0,0 +1,310 @@
+"""
+Binary snapshots of the `operational` schema
+
+`python -m src.common.snapshot save PATH` streams every table of the `operational` schema on every shard into a single
+gzip compressed file with binary `COPY`, and `python -m src.common.snapshot restore PATH` loads one back, replacing the
+data that's there. Pass `--character-id` (repeatedly) to `save` to only keep some characters, e.g. the party of one
+campaign, along with everything that isn't per character (such as the shard map). Set `SNAPSHOT_RESTORE_PATH` to restore
+a snapshot instead of inserting the test character when the app starts in local dev.
+
+Binary `COPY` moves rows in Postgres' own format with no per-row round trips or parsing, and restores run with triggers
+and foreign key checks off (which needs a superuser), so restoring millions of rows takes seconds. Snapshots can only be
+restored into databases with exactly the migrations they were taken with, since binary rows are only readable with the
+same column types. `operational.schema_version` itself is never part of a snapshot.
+
+A snapshot file is a line of JSON describing it (`SnapshotManifest`), then a section per shard and table: a length
+prefixed JSON `SnapshotTable` header followed by length prefixed chunks of `COPY` data, ending with an empty chunk. An
+empty header ends the file.
+"""
+
+import argparse
+import asyncio
+import gzip
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import msgspec
+from psycopg import AsyncConnection, sql
+
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.db import DatabaseConnInfo, get_shard_conn_infos
+from src.common.log_config import get_logger
+
+LOG = get_logger(__name__)
+
+SNAPSHOT_FORMAT = "dnd-health-tracker-snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+
+_LENGTH = struct.Struct(">I")
+
+
+class SnapshotException(AppError): ...
+
+
+class SnapshotManifest(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    format: str
+    format_version: int
+    created_at: datetime
+    # Checksum of each migration the snapshot's databases had applied, by version
+    migrations: dict[int, str]
+    shards: int
+    # The characters kept, when the snapshot was filtered
+    character_ids: Optional[list[int]] = None
+
+
+class SnapshotTable(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    shard: int
+    table: str
+    columns: list[str]
+
+
+class SnapshotStats(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    tables: int
+    bytes: int
+    seconds: float
+
+
+async def _migrations(conn: AsyncConnection) -> dict[int, str]:
+    res = await (await conn.execute("SELECT version, checksum FROM operational.schema_version")).fetchall()
+    return {version: checksum for version, checksum in res}
+
+
+async def _tables(conn: AsyncConnection) -> dict[str, list[str]]:
+    """
+    The columns of every table of the `operational` schema, besides `schema_version`
+    """
+    res = await (
+        await conn.execute(
+            """
+            SELECT c.relname, array_agg(a.attname ORDER BY a.attnum)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped AND a.attgenerated = ''
+            WHERE n.nspname = 'operational' AND c.relkind = 'r' AND c.relname <> 'schema_version'
+            GROUP BY c.relname
+            ORDER BY c.relname
+            """
+        )
+    ).fetchall()
+    return {table: columns for table, columns in res}
+
+
+def _select(table: str, columns: list[str], character_ids: Optional[list[int]]) -> sql.Composable:
+    query = sql.SQL("SELECT {} FROM {}").format(
+        sql.SQL(", ").join(map(sql.Identifier, columns)), sql.Identifier("operational", table)
+    )
+    key = "id" if table == "character" else "character_id"
+    if character_ids is None or key not in columns:
+        return query
+    return sql.SQL("{} WHERE {} = ANY({})").format(query, sql.Identifier(key), sql.Literal(character_ids))
+
+
+def _write_frame(out: BinaryIO, data: bytes) -> None:
+    out.write(_LENGTH.pack(len(data)))
+    out.write(data)
+
+
+def _read_frame(src: BinaryIO) -> bytes:
+    header = src.read(_LENGTH.size)
+    if len(header) < _LENGTH.size:
+        raise SnapshotException("Snapshot is truncated")
+    (length,) = _LENGTH.unpack(header)
+    data = src.read(length)
+    if len(data) < length:
+        raise SnapshotException("Snapshot is truncated")
+    return data
+
+
+async def save_snapshot(
+    conn_infos: list[DatabaseConnInfo],
+    path: Path,
+    character_ids: Optional[list[int]] = None,
+    compress_level: int = app_config.SNAPSHOT_COMPRESS_LEVEL,
+) -> SnapshotStats:
+    """
+    Save every `operational` table of the databases in `conn_infos` (the shards, in order) to `path`, only keeping
+    `character_ids` when given
+    """
+    start = time.perf_counter()
+    tables = 0
+    with gzip.open(path, "wb", compresslevel=compress_level) as out:
+        for shard, conn_info in enumerate(conn_infos):
+            async with await AsyncConnection.connect(conn_info.to_conn_str()) as conn:
+                # Every table is read from the same snapshot of the database
+                await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                migrations = await _migrations(conn)
+                if shard == 0:
+                    manifest = SnapshotManifest(
+                        format=SNAPSHOT_FORMAT,
+                        format_version=SNAPSHOT_FORMAT_VERSION,
+                        created_at=datetime.now(timezone.utc),
+                        migrations=migrations,
+                        shards=len(conn_infos),
+                        character_ids=character_ids,
+                    )
+                    out.write(msgspec.json.encode(manifest) + b"\n")
+                elif migrations != manifest.migrations:
+                    raise SnapshotException(f"Shard {shard} has different migrations to shard 0")
+
+                for table, columns in (await _tables(conn)).items():
+                    _write_frame(out, msgspec.json.encode(SnapshotTable(shard=shard, table=table, columns=columns)))
+                    copy_sql = sql.SQL("COPY ({}) TO STDOUT (FORMAT BINARY)").format(
+                        _select(table, columns, character_ids)
+                    )
+                    async with conn.cursor().copy(copy_sql) as copy:
+                        async for chunk in copy:
+                            if chunk:
+                                _write_frame(out, bytes(chunk))
+                    _write_frame(out, b"")
+                    tables += 1
+                await conn.rollback()
+        _write_frame(out, b"")
+
+    return SnapshotStats(tables=tables, bytes=path.stat().st_size, seconds=time.perf_counter() - start)
+
+
+def read_manifest(src: BinaryIO) -> SnapshotManifest:
+    manifest = msgspec.json.decode(src.readline(), type=SnapshotManifest)
+    if manifest.format != SNAPSHOT_FORMAT or manifest.format_version != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotException(f"Unsupported snapshot format {manifest.format} v{manifest.format_version}")
+    return manifest
+
+
+async def _reset_sequences(conn: AsyncConnection) -> None:
+    """
+    Move every sequence owned by an `operational` table past the largest value in its column
+    """
+    res = await (
+        await conn.execute(
+            """
+            SELECT c.relname, a.attname, s.oid::regclass::text
+            FROM pg_depend d
+            JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+            JOIN pg_class c ON c.oid = d.refobjid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = d.refobjsubid
+            WHERE n.nspname = 'operational' AND c.relkind = 'r' AND d.deptype IN ('a', 'i')
+            """
+        )
+    ).fetchall()
+    for table, column, sequence in res:
+        # Sequences of empty tables are left alone
+        await conn.execute(
+            sql.SQL("SELECT setval({}, max({})) FROM {} HAVING max({}) IS NOT NULL").format(
+                sql.Literal(sequence),
+                sql.Identifier(column),
+                sql.Identifier("operational", table),
+                sql.Identifier(column),
+            )
+        )
+
+
+async def restore_snapshot(conn_infos: list[DatabaseConnInfo], path: Path) -> SnapshotStats:
+    """
+    Replace the data of every `operational` table of the databases in `conn_infos` (the shards, in order) with the
+    snapshot at `path`
+
+    Each shard is restored in a single transaction. Character ids are allocated by shard 0, so its character id
+    sequence is moved past the largest id restored to any shard.
+    """
+    start = time.perf_counter()
+    tables = 0
+    max_character_id = 0
+    with gzip.open(path, "rb") as src:
+        manifest = read_manifest(src)
+        if manifest.shards != len(conn_infos):
+            raise SnapshotException(f"Snapshot has {manifest.shards} shards but {len(conn_infos)} are configured")
+
+        header = _read_frame(src)
+        for shard, conn_info in enumerate(conn_infos):
+            async with await AsyncConnection.connect(conn_info.to_conn_str()) as conn:
+                if (migrations := await _migrations(conn)) != manifest.migrations:
+                    raise SnapshotException(
+                        f"Shard {shard} has migrations {sorted(migrations)} but the snapshot was taken with "
+                        f"{sorted(manifest.migrations)}. Migrate both to the same version first."
+                    )
+
+                existing = await _tables(conn)
+                await conn.execute("SET LOCAL session_replication_role = replica")
+                await conn.execute(
+                    sql.SQL("TRUNCATE {}").format(
+                        sql.SQL(", ").join(sql.Identifier("operational", table) for table in existing)
+                    )
+                )
+                while header:
+                    table = msgspec.json.decode(header, type=SnapshotTable)
+                    if table.shard != shard:
+                        break
+                    if existing.get(table.table) != table.columns:
+                        raise SnapshotException(f"Table {table.table} doesn't match the snapshot's columns")
+
+                    copy_sql = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+                        sql.Identifier("operational", table.table),
+                        sql.SQL(", ").join(map(sql.Identifier, table.columns)),
+                    )
+                    async with conn.cursor().copy(copy_sql) as copy:
+                        while chunk := _read_frame(src):
+                            await copy.write(chunk)
+                    tables += 1
+                    header = _read_frame(src)
+
+                # A snapshot of some characters keeps the rows derived from every character (such as party rollups),
+                # which the triggers that maintain them didn't see being left out
+                if manifest.character_ids is not None:
+                    await conn.execute("SELECT operational.refresh_derived_data()")
+                await _reset_sequences(conn)
+                res = await (await conn.execute("SELECT coalesce(max(id), 0) FROM operational.character")).fetchone()
+                max_character_id = max(max_character_id, res[0] if res else 0)
+                await conn.commit()
+                LOG.info("Restored shard %s from %s", shard, path)
+
+        async with await AsyncConnection.connect(conn_infos[0].to_conn_str()) as directory:
+            await directory.execute(
+                """
+                SELECT setval('operational.character_id_seq', %(id)s)
+                WHERE %(id)s > (SELECT last_value FROM operational.character_id_seq)
+                """,
+                {"id": max_character_id},
+            )
+            await directory.commit()
+
+    return SnapshotStats(tables=tables, bytes=path.stat().st_size, seconds=time.perf_counter() - start)
+
+
+async def restore_startup_snapshot():
+    """
+    App startup function for restoring `SNAPSHOT_RESTORE_PATH` in place of the test data, once migrations have run
+    """
+    path = Path(app_config.SNAPSHOT_RESTORE_PATH or "")
+    stats = await restore_snapshot(get_shard_conn_infos(), path)
+    LOG.info("Restored %s tables from %s in %.2fs", stats.tables, path, stats.seconds)
+
+
+async def main(args: argparse.Namespace) -> int:
+    path = Path(args.path)
+    if args.command == "save":
+        stats = await save_snapshot(get_shard_conn_infos(), path, character_ids=args.character_ids)
+        LOG.info("Saved %s tables to %s (%s bytes) in %.2fs", stats.tables, path, stats.bytes, stats.seconds)
+    else:
+        stats = await restore_snapshot(get_shard_conn_infos(), path)
+        LOG.info("Restored %s tables from %s in %.2fs", stats.tables, path, stats.seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save and restore binary snapshots of the operational schema")
+    parser.add_argument("command", choices=["save", "restore"])
+    parser.add_argument("path", help="Snapshot file")
+    parser.add_argument(
+        "--character-id",
+        dest="character_ids",
+        type=int,
+        action="append",
+        help="Only save this character (repeat for several), along with the data that isn't per character",
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,102 @@
+"""
+Hierarchical timer wheel
+
+Timers are kept in `levels` wheels of `slots` buckets each. A bucket of the first wheel covers one tick, and a bucket of
+each wheel after that covers a whole turn of the wheel below it. Scheduling a timer drops it in the bucket for its
+deadline on the finest wheel that reaches that far, and cancelling removes it from its bucket, both in constant time no
+matter how many timers are pending. As time advances, each bucket of a coarser wheel is emptied into the finer wheels
+when the wheel below it turns over, so a timer only moves at most `levels` times before it fires.
+
+See Varghese and Lauck, "Hashed and Hierarchical Timing Wheels" (1987).
+"""
+
+import math
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TimerWheel(Generic[K]):
+    """
+    Timers keyed by `K`, each firing once at a deadline in seconds (e.g. from `time.time()`). A key has at most one
+    timer, so scheduling a key again replaces its timer.
+    """
+
+    def __init__(self, tick: float, now: float, slots: int = 256, levels: int = 4) -> None:
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._current = math.floor(now / tick)
+        # Bucket contents map each key to its deadline tick
+        self._wheels: list[list[dict[K, int]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._buckets: dict[K, dict[K, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._buckets
+
+    def schedule(self, key: K, deadline: float) -> None:
+        """
+        Fire `key` at `deadline`, or on the next tick if that has passed
+        """
+        self.cancel(key)
+        self._place(key, max(math.ceil(deadline / self.tick), self._current + 1))
+
+    def cancel(self, key: K) -> bool:
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def _place(self, key: K, deadline_tick: int) -> None:
+        delta = deadline_tick - self._current
+        level = 0
+        span = self.slots
+        while delta >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        # Deadlines beyond the coarsest wheel wait in its furthest bucket and are placed again once it's emptied
+        bucket_tick = min(deadline_tick, self._current + span - 1)
+        bucket = self._wheels[level][(bucket_tick // self.slots**level) % self.slots]
+        bucket[key] = deadline_tick
+        self._buckets[key] = bucket
+
+    def advance(self, now: float) -> list[K]:
+        """
+        Move time forward to `now`, returning the keys whose timers fired, soonest first
+        """
+        target = math.floor(now / self.tick)
+        fired: list[K] = []
+        while self._current < target:
+            self._current += 1
+            # Empty the coarser wheels' buckets that start at this tick into the finer wheels, coarsest first
+            level = 1
+            while level < self.levels and self._current % self.slots**level == 0:
+                level += 1
+            for cascade_level in range(level - 1, 0, -1):
+                self._cascade(cascade_level)
+
+            bucket = self._wheels[0][self._current % self.slots]
+            if not bucket:
+                continue
+            self._wheels[0][self._current % self.slots] = {}
+            for key, deadline_tick in bucket.items():
+                del self._buckets[key]
+                if deadline_tick <= self._current:
+                    fired.append(key)
+                else:
+                    self._place(key, deadline_tick)
+        return fired
+
+    def _cascade(self, level: int) -> None:
+        slot = (self._current // self.slots**level) % self.slots
+        bucket = self._wheels[level][slot]
+        if not bucket:
+            return
+        self._wheels[level][slot] = {}
+        for key, deadline_tick in bucket.items():
+            del self._buckets[key]
+            self._place(key, deadline_tick)
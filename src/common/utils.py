@@ -1,13 +1,16 @@
 import hashlib
+import time
 from enum import Enum
-from typing import Any, NoReturn, Optional, Sequence
+from typing import Any, Iterable, NoReturn, Optional, Protocol, Sequence, runtime_checkable
 
 from psycopg import AsyncCursor, InterfaceError
 from psycopg.cursor import BaseCursor
 from psycopg.pq.abc import PGresult
 from psycopg.rows import COMMAND_OK, SINGLE_TUPLE, TUPLES_OK, DictRow, RowMaker
 
+from src.common import app_config
 from src.common.log_config import get_logger
+from src.common.metrics import LOCK_WAIT, lock_name
 
 LOG = get_logger(__name__)
 
@@ -15,19 +18,42 @@ LOG = get_logger(__name__)
 class CaseInsensitiveEnum(Enum):
     @classmethod
     def _missing_(cls, value: object):
-        for member in cls:
-            if member.name.lower() == str(value).lower():
-                return member
+        # Built on the first miss, since members don't exist yet when the class body runs
+        lookup = cls.__dict__.get("_casefolded_members")
+        if lookup is None:
+            lookup = {member.name.casefold(): member for member in cls}
+            setattr(cls, "_casefolded_members", lookup)
+        return lookup.get(str(value).casefold())
 
 
-async def acquire_lock(key: str, cur: AsyncCursor):
-    key_bytes: bytes = key.encode("utf-8")
+@runtime_checkable
+class DbCursor(Protocol):
+    """
+    The part of `AsyncCursor` that repos use, so they can run on a plain cursor or a `LazyCursor`
+    """
+
+    async def execute(self, query: Any, params: Any = None) -> AsyncCursor[Any]: ...
+
+    async def executemany(self, query: Any, params_seq: Iterable[Any]) -> None: ...
+
+
+def advisory_lock_key(key: str) -> int:
+    """
+    Hash `key` into the signed 64 bit integer Postgres advisory locks are keyed by
+    """
     m = hashlib.sha256()
-    m.update(key_bytes)
-    key_int = int.from_bytes(m.digest()[:8], byteorder="big", signed=True)
-    LOG.info(f"Attempting to retrieve lock {key} ({key_int})")
+    m.update(key.encode("utf-8"))
+    return int.from_bytes(m.digest()[:8], byteorder="big", signed=True)
+
+
+async def acquire_lock(key: str, cur: DbCursor):
+    key_int = advisory_lock_key(key)
+    LOG.debug("Attempting to retrieve lock %s (%s)", key, key_int)
+    start = time.perf_counter()
     await cur.execute("SELECT pg_advisory_xact_lock(%(hash)s)", {"hash": key_int})
-    LOG.info(f"Successfully retrieved lock {key} ({key_int})")
+    if app_config.METRICS_ENABLED:
+        LOCK_WAIT.labels(lock_name(key)).observe(time.perf_counter() - start)
+    LOG.debug("Successfully retrieved lock %s (%s)", key, key_int)
 
 
 def snake_to_camel(string: str):
@@ -1,53 +1,124 @@
 from typing import Any
 
 import uvicorn
-from litestar import Litestar, Router, get
+from litestar import Litestar, Response, Router, get
+from litestar.contrib.prometheus import PrometheusController
 from litestar.logging import LoggingConfig
 from litestar.openapi import OpenAPIConfig, OpenAPIController
+from litestar.status_codes import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
 
-from src.character.character_controller import CharacterController
+from src.character.character_controller import (
+    CharacterController,
+    CharacterEventsController,
+    CharacterListController,
+)
+from src.character.character_events import character_event_listener
+from src.character.effective_stats import effective_stats_cache
+from src.character.hit_point_log import hit_point_log_relay, start_hit_point_log_relay
+from src.character.party_controller import PartyController
+from src.character.party_rollups import party_rollup_reconciler, start_party_rollup_reconciler
+from src.character.temporary_hit_points import start_temporary_hit_points_expiry, temporary_hit_points_expiry
 from src.common import app_config
-from src.common.db import db_connection, insert_test_data, migrate_db, teardown_db
+from src.common.admin_controller import AdminController
+from src.common.admission import admission_controller
+from src.common.db import db_connection, insert_test_data, load_shards, migrate_db, teardown_db, warm_pools
 from src.common.deps import provide_dependencies
 from src.common.exceptions import app_exception_handler
+from src.common.health import HealthChecker, Readiness, health_checker, start_health_checker
+from src.common.job_controller import JobController
+from src.common.jobs import job_queue, start_job_queue
 from src.common.log_config import get_logger
+from src.common.metrics import MetricsMiddleware
+from src.common.profiling import ProfilingMiddleware, request_profiler
+from src.common.query_tracing import QueryTracingMiddleware
+from src.common.snapshot import restore_startup_snapshot
 
 LOG = get_logger(__name__)
 
 
-# Define health check route for checking server status
-@get("/health")
+# Define health check routes for checking server status. Liveness only checks the process is serving requests.
+@get(["/health", "/health/live"])
 async def health() -> dict[str, Any]:
     return {"status": "pass", "description": "Application is healthy", "environment": app_config.ENV}
 
 
+# Readiness reports the latest background check of every database, answering with a 503 when any is unhealthy
+@get("/health/ready")
+async def readiness(health_checker: HealthChecker) -> Response[Readiness]:
+    report = health_checker.readiness()
+    return Response(report, status_code=HTTP_200_OK if report.ready else HTTP_503_SERVICE_UNAVAILABLE)
+
+
 # Customize the path where OpenAPI docs live
 class CustomOpenApiController(OpenAPIController):
     path = f"{app_config.API_BASE_URL}/docs"
 
 
 # Main api router for the application
-api_router = Router(app_config.API_BASE_URL, route_handlers=[health, CharacterController])
+api_router = Router(
+    app_config.API_BASE_URL,
+    route_handlers=[
+        health,
+        readiness,
+        CharacterController,
+        CharacterListController,
+        CharacterEventsController,
+        PartyController,
+        JobController,
+        AdminController,
+        PrometheusController,
+    ],
+)
 
 
 def startup_log():
     app_url = f"http://{app_config.HOST}:{app_config.PORT}{app_config.API_BASE_URL}"
-    LOG.info(f"Started application at {app_url}")
-    LOG.info(f"See docs at {app_url}/docs/swagger")
+    LOG.info("Started application at %s", app_url)
+    LOG.info("See docs at %s/docs/swagger", app_url)
 
 
 # Setup main application
 app = Litestar(
     # Set main api router
     route_handlers=[api_router],
-    # Make a DB connection pool available for the lifespan of the application
-    lifespan=[db_connection],
-    # Migrate db and insert test data on startup. Only insert test data in local dev
-    on_startup=[migrate_db]
-    + ([insert_test_data] if app_config.ENV == app_config.Environment.LOCAL_DEV else [])
+    # Make a DB connection pool, the hit point event broker, the request profiler, the admission controller, the
+    # effective stats cache, the temporary hit point expiry scheduler, the health checker, the job queue, the hit point
+    # log relay and the party rollup reconciler available for the lifespan of the application
+    lifespan=[
+        db_connection,
+        character_event_listener,
+        request_profiler,
+        admission_controller,
+        effective_stats_cache,
+        temporary_hit_points_expiry,
+        health_checker,
+        job_queue,
+        hit_point_log_relay,
+        party_rollup_reconciler,
+    ],
+    # Migrate db, warm the connection pools, load the shard map, start expiring temporary hit points, start checking
+    # health, start the job workers, start relaying hit point changes, start reconciling party rollups and insert test
+    # data (or restore `SNAPSHOT_RESTORE_PATH`) on startup. Only insert test data in local dev
+    on_startup=[
+        migrate_db,
+        warm_pools,
+        load_shards,
+        start_temporary_hit_points_expiry,
+        start_health_checker,
+        start_job_queue,
+        start_hit_point_log_relay,
+        start_party_rollup_reconciler,
+    ]
+    + (
+        [restore_startup_snapshot if app_config.SNAPSHOT_RESTORE_PATH else insert_test_data]
+        if app_config.LOAD_TEST_DATA
+        else []
+    )
     + [startup_log],
     # Only run db teardown in local dev
-    on_shutdown=[teardown_db] if app_config.ENV == app_config.Environment.LOCAL_DEV else [],
+    on_shutdown=[teardown_db] if app_config.LOAD_TEST_DATA else [],
+    # Record request latency and in-flight requests per route, and trace queries and profile requests when enabled
+    middleware=[MetricsMiddleware, QueryTracingMiddleware, ProfilingMiddleware],
     # Setup dependencies
     dependencies=provide_dependencies(),
     # Base exception handler for application
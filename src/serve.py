@@ -0,0 +1,90 @@
+"""
+Production entry point, serving the app from several worker processes
+
+Run with `python -m src.serve [--workers N]`. Migrations are applied once, before the port is bound and any worker
+starts, so nothing can reach a worker until the schema is current (workers still check it on startup, which is a
+single query once it's current). Each worker then sizes its pools from its share of `DB_CONNECTION_BUDGET`.
+
+On SIGINT or SIGTERM, workers stop accepting connections and wait up to `SHUTDOWN_GRACE_SECONDS` for in-flight
+requests to finish before closing them and their pools.
+
+In local dev, the test data (or `SNAPSHOT_RESTORE_PATH`) is loaded once after migrating, rather than by every worker,
+and the database is torn down once every worker has stopped.
+
+With more than one worker, Prometheus metrics are aggregated across workers through `PROMETHEUS_MULTIPROC_DIR`, which
+defaults to a fresh temporary directory.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+from src.common import app_config
+from src.common.db import insert_test_data, migrate_db, teardown_db
+from src.common.log_config import get_logger
+from src.common.snapshot import restore_startup_snapshot
+
+LOG = get_logger(__name__)
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may run on, which can be fewer than the machine has (e.g. under a container CPU set)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _prepare_multiprocess_metrics() -> None:
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir is None:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="dnd-health-tracker-metrics-")
+        return
+
+    # Files left by a previous run's workers would be counted as live
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def main(args: argparse.Namespace) -> None:
+    workers: int = args.workers
+    # Workers are started as new processes, which read these when importing `app_config`
+    os.environ["WEB_WORKERS"] = str(workers)
+    if workers > 1:
+        _prepare_multiprocess_metrics()
+
+    # Workers leave the test data to this process. A single worker runs in this process, so its `app_config` is ours.
+    load_test_data = app_config.LOAD_TEST_DATA
+    os.environ["LOAD_TEST_DATA"] = "false"
+    app_config.LOAD_TEST_DATA = False
+
+    asyncio.run(migrate_db())
+    if load_test_data:
+        asyncio.run(restore_startup_snapshot() if app_config.SNAPSHOT_RESTORE_PATH else insert_test_data())
+
+    LOG.info("Starting %s workers on %s:%s", workers, args.host, args.port)
+    try:
+        uvicorn.run(
+            "src.main:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            timeout_graceful_shutdown=app_config.SHUTDOWN_GRACE_SECONDS,
+            log_level="warning",
+        )
+    finally:
+        if load_test_data:
+            asyncio.run(teardown_db())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the app from several worker processes")
+    parser.add_argument("--workers", type=int, default=available_cpus(), help="Worker processes (default: one per CPU)")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to bind")
+    parser.add_argument("--port", type=int, default=app_config.PORT, help="Port to bind")
+    main(parser.parse_args())
@@ -0,0 +1,62 @@
+"""
+Job worker entry point, running background jobs outside of the processes serving requests
+
+Run with `python -m src.worker [--concurrency N]`, typically next to `python -m src.serve` started with
+`JOB_WORKER_CONCURRENCY=0`, so that bulk work never shares a process or its pools with interactive requests. Any number
+of these can run at once. See `src.common.jobs`.
+
+On SIGINT or SIGTERM, the jobs being run are queued again for another worker to pick up.
+"""
+
+import argparse
+import asyncio
+import signal
+from contextlib import AsyncExitStack
+
+# Registers the character job handlers
+import src.character.character_jobs  # noqa: F401
+from src.common import app_config
+from src.common.db import get_shard_conn_infos, migrate_db
+from src.common.jobs import JobQueue
+from src.common.log_config import get_logger
+from src.common.pool import create_pool, open_pool
+from src.common.sharding import ShardRouter, load_shard_map
+
+LOG = get_logger(__name__)
+
+
+async def main(args: argparse.Namespace) -> None:
+    await migrate_db()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    async with AsyncExitStack() as stack:
+        pools = [
+            await stack.enter_async_context(
+                open_pool(create_pool(conn_info.to_conn_str(), name="primary" if shard == 0 else f"shard-{shard}"))
+            )
+            for shard, conn_info in enumerate(get_shard_conn_infos())
+        ]
+        async with pools[0].connection() as conn:
+            shard_map = await load_shard_map(conn, len(pools))
+
+        queue = JobQueue(concurrency=args.concurrency)
+        await queue.start(ShardRouter(pools, shard_map))
+        LOG.info("Started %s job workers", args.concurrency)
+        await stopping.wait()
+        await queue.stop()
+        LOG.info("Stopped job workers after finishing %s jobs", queue.finished)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=max(app_config.JOB_WORKER_CONCURRENCY, 1),
+        help="Jobs run at once (default: JOB_WORKER_CONCURRENCY)",
+    )
+    asyncio.run(main(parser.parse_args()))
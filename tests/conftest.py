@@ -1,13 +1,28 @@
+from pathlib import Path
+
 import psycopg
 import pytest
 from psycopg import AsyncCursor
 
 from src.character.character_repo import CharacterRepo
 from src.character.character_service import CharacterService
+from src.common import app_config
 from src.common.db import get_conn_info, insert_test_data, migrate_db, teardown_db
+from src.common.pool import create_pool, open_pool
+from src.common.sharding import ShardMap, ShardRouter
 from src.common.utils import dict_row_camel
 
 
+@pytest.fixture(autouse=True)
+def hit_point_log_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """
+    Keeps the hit point log relayed by any app a test starts out of the working directory
+    """
+    path = tmp_path / "hit_point_log"
+    monkeypatch.setattr(app_config, "HIT_POINT_LOG_DIR", path)
+    return path
+
+
 @pytest.fixture
 async def db():
     await teardown_db()
@@ -21,11 +36,20 @@ async def db():
     await teardown_db()
 
 
+@pytest.fixture
+async def shards(db: AsyncCursor):
+    """
+    Routes every character to a pool on the test database, sized from `app_config` as it is when the fixture is set up
+    """
+    async with open_pool(create_pool(get_conn_info().to_conn_str(), name="test")) as pool:
+        yield ShardRouter([pool], ShardMap.default(1))
+
+
 @pytest.fixture
 def character_repo(db: AsyncCursor):
     return CharacterRepo(db)
 
 
 @pytest.fixture
-def character_service(character_repo: CharacterRepo, db: AsyncCursor):
-    return CharacterService(character_repo=character_repo, db=db)
+def character_service(character_repo: CharacterRepo):
+    return CharacterService(character_storage=character_repo)
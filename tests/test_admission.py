@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from litestar.status_codes import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+from litestar.testing import TestClient
+
+from src.common.admission import AdaptiveLimiter, AdmissionController, AdmissionRejected, RouteClass
+from src.main import app
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+async def test_limiter_queues_then_rejects():
+    limiter = AdaptiveLimiter("test", initial_limit=1, min_limit=1, max_queue=1, queue_timeout=1)
+    await limiter.acquire()
+
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.status().queued == 1
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        await limiter.acquire()
+    assert exc_info.value.reason == "queue_full"
+
+    # Releasing hands the slot straight to the queued request
+    limiter.release()
+    await queued
+    assert limiter.in_flight == 1
+    limiter.release()
+    assert limiter.in_flight == 0
+    assert limiter.rejected == 1
+
+
+async def test_limiter_rejects_after_queue_timeout():
+    limiter = AdaptiveLimiter("test", initial_limit=1, min_limit=1, max_queue=1, queue_timeout=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        await limiter.acquire()
+    assert exc_info.value.reason == "queue_timeout"
+    assert limiter.status().queued == 0
+
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+async def test_limit_adapts_to_latency():
+    limiter = AdaptiveLimiter("test", initial_limit=20, min_limit=2, max_limit=100)
+    for _ in range(50):
+        limiter.observe(0.005)
+    steady_limit = limiter.limit
+    assert steady_limit > 20
+
+    # The database saturates and latency climbs well past the baseline
+    for _ in range(50):
+        limiter.observe(0.1)
+    assert limiter.limit < steady_limit / 2
+
+    # And recovers
+    for _ in range(200):
+        limiter.observe(0.005)
+    assert limiter.limit > steady_limit
+
+
+async def test_higher_limit_admits_waiting_requests():
+    limiter = AdaptiveLimiter("test", initial_limit=1, min_limit=1, max_limit=10, max_queue=5, queue_timeout=1)
+    await limiter.acquire()
+    queued = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    for _ in range(10):
+        limiter.observe(0.005)
+    await asyncio.gather(*queued)
+    assert limiter.in_flight == 3
+
+
+def test_route_classes():
+    controller = AdmissionController()
+    assert controller.limiter_for("GET") is controller.limiters[RouteClass.READ]
+    assert controller.limiter_for("PUT") is controller.limiters[RouteClass.MUTATION]
+
+
+def test_sheds_over_capacity_reads(test_client: TestClient):
+    controller: AdmissionController = test_client.app.state.admission_controller
+    reads = controller.limiters[RouteClass.READ]
+    reads.max_queue = 0
+    reads.in_flight = reads.limit
+    try:
+        res = test_client.get("character/1")
+        assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert res.headers["Retry-After"] == "1"
+        assert res.json()["detail"] == "Server is over capacity"
+
+        # Health checks and mutations aren't held up by reads
+        assert test_client.get("health").status_code == HTTP_200_OK
+        res = test_client.put("character/1/hit-points/heal", json={"amount": 1})
+        assert res.status_code == HTTP_200_OK
+
+        res = test_client.get("admin/admission")
+        assert {status["routeClass"]: status["rejected"] for status in res.json()} == {"read": 1, "mutation": 0}
+    finally:
+        reads.in_flight = 0
@@ -1,5 +1,5 @@
 import pytest
-from litestar.status_codes import HTTP_200_OK, HTTP_404_NOT_FOUND
+from litestar.status_codes import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 from litestar.testing import TestClient
 
 from src.character.models import DamageType
@@ -92,3 +92,32 @@ def test_assign_temporary_hit_points(test_client: TestClient):
         ],
         "defenses": [{"type": "fire", "defense": "immunity"}, {"type": "slashing", "defense": "resistance"}],
     }
+
+
+def test_search_characters(test_client: TestClient):
+    response = test_client.get("character/search", params={"immuneTo": "fire", "className": "Fighter", "limit": 1})
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {"characterIds": [1], "characters": None, "nextAfterId": 1}
+
+    response = test_client.get(
+        "character/search", params={"itemAffects": "constitution", "includeSummaries": True, "afterId": 0}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {
+        "characterIds": [1],
+        "characters": [
+            {
+                "id": 1,
+                "name": "Briv",
+                "level": 5,
+                "hitPoints": {"hitPointMax": 25, "currentHitPoints": 25, "temporaryHitPoints": None},
+            }
+        ],
+        "nextAfterId": None,
+    }
+
+    response = test_client.get("character/search", params={"resistantTo": ["fire", "slashing"]})
+    assert response.json()["characterIds"] == []
+
+    assert test_client.get("character/search", params={"minClassLevel": 5}).status_code == HTTP_400_BAD_REQUEST
+    assert test_client.get("character/search", params={"immuneTo": "lava"}).status_code == HTTP_400_BAD_REQUEST
@@ -0,0 +1,116 @@
+import argparse
+
+import msgspec
+import pytest
+from psycopg import AsyncCursor
+
+from src.character.character_documents import DocumentDrift, check_documents, main, rebuild_documents
+from src.character.character_repo import CharacterRepo
+from src.character.models import CharacterHitpoints
+from src.common import app_config
+from src.common.db import load_test_character
+
+
+@pytest.fixture
+def documents_enabled(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "CHARACTER_DOCUMENTS_ENABLED", True)
+
+
+async def _document(db: AsyncCursor, character_id: int):
+    res = await (
+        await db.execute(
+            "SELECT document FROM operational.character_document WHERE character_id = %(id)s", {"id": character_id}
+        )
+    ).fetchone()
+    return res["document"] if res else None
+
+
+async def test_documents_follow_writes(db: AsyncCursor, character_repo: CharacterRepo):
+    assert await _document(db, 1) == msgspec.to_builtins(load_test_character())
+
+    # Hit points are patched straight away
+    hitpoints = CharacterHitpoints(hit_point_max=25, current_hit_points=7, temporary_hit_points=3)
+    await character_repo.update_hitpoints(1, hitpoints)
+    assert (await _document(db, 1))["hitPoints"] == msgspec.to_builtins(hitpoints)
+
+    # Anything else when the transaction commits
+    await db.execute("UPDATE operational.character_item_modifier SET value = 1")
+    assert (await _document(db, 1))["items"][0]["modifier"]["value"] == 2
+    await db.connection.commit()
+    assert (await _document(db, 1))["items"][0]["modifier"]["value"] == 1
+
+    character_id = await character_repo.insert_character(load_test_character())
+    await db.connection.commit()
+    assert await _document(db, character_id) == msgspec.to_builtins(load_test_character())
+    await character_repo.delete_characters([character_id])
+    await db.connection.commit()
+    assert await _document(db, character_id) is None
+    assert await (await db.execute("SELECT * FROM operational.character_document_pending")).fetchall() == []
+
+
+async def test_documents_are_built_once_per_transaction(db: AsyncCursor, character_repo: CharacterRepo):
+    await db.connection.commit()
+    character_id = await character_repo.insert_character(load_test_character())
+    await db.execute("UPDATE operational.character SET level = 6 WHERE id = %(id)s", {"id": character_id})
+    # Runs the deferred refreshes without committing, so this transaction's table statistics can be read
+    await db.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    stats = await (
+        await db.execute(
+            """
+            SELECT n_tup_ins, n_tup_upd, n_tup_del
+            FROM pg_stat_xact_user_tables
+            WHERE schemaname = 'operational' AND relname = 'character_document'
+            """
+        )
+    ).fetchone()
+    assert stats == {"nTupIns": 1, "nTupUpd": 0, "nTupDel": 0}
+    assert (await _document(db, character_id))["level"] == 6
+
+    # Party changes aren't part of the document, so don't queue it
+    await db.connection.commit()
+    await character_repo.set_party([character_id], 1)
+    pending = await (await db.execute("SELECT * FROM operational.character_document_pending")).fetchall()
+    assert pending == []
+
+
+async def test_get_character_reads_documents(db: AsyncCursor, character_repo: CharacterRepo, documents_enabled: None):
+    assert await character_repo.get_character(1) == load_test_character()
+
+    # Served from the document, even when it has drifted
+    await db.execute("UPDATE operational.character_document SET document = jsonb_set(document, '{name}', '\"Vrib\"')")
+    assert (await character_repo.get_character(1)).name == "Vrib"
+
+    # Characters without a document fall back to the normalized tables
+    character_id = await character_repo.insert_character(load_test_character())
+    await db.execute("DELETE FROM operational.character_document WHERE character_id = %(id)s", {"id": character_id})
+    characters = await character_repo.get_characters([1, character_id, 99])
+    assert {character_id: character.name for character_id, character in characters.items()} == {
+        1: "Vrib",
+        character_id: "Briv",
+    }
+
+
+async def test_check_and_rebuild_documents(db: AsyncCursor, character_repo: CharacterRepo):
+    character_ids = [await character_repo.insert_character(load_test_character()) for _ in range(4)]
+    await db.connection.commit()
+    await db.execute("UPDATE operational.character_document SET document = '{}' WHERE character_id = 1")
+    await db.execute(
+        "DELETE FROM operational.character_document WHERE character_id = ANY(%(ids)s)", {"ids": character_ids[1:3]}
+    )
+    await db.connection.commit()
+
+    assert await check_documents(db.connection, batch_size=2) == DocumentDrift(missing=character_ids[1:3], stale=[1])
+    assert await rebuild_documents(db.connection, [1] + character_ids[1:3], batch_size=2) == 3
+    assert await check_documents(db.connection) == DocumentDrift(missing=[], stale=[])
+    assert await rebuild_documents(db.connection, batch_size=2) == 5
+
+
+async def test_main_repairs_drift(db: AsyncCursor):
+    await db.execute("DELETE FROM operational.character_document")
+    await db.connection.commit()
+
+    assert await main(argparse.Namespace(rebuild=False, repair=False)) == 1
+    assert await main(argparse.Namespace(rebuild=False, repair=True)) == 0
+    assert await main(argparse.Namespace(rebuild=False, repair=False)) == 0
+    assert await _document(db, 1) == msgspec.to_builtins(load_test_character())
@@ -0,0 +1,107 @@
+import asyncio
+
+import msgspec
+import psycopg
+import pytest
+from litestar.testing import TestClient
+
+from src.character import character_events
+from src.character.character_events import CharacterEventBroker, character_event_listener
+from src.character.models import CharacterHitpoints, CharacterHitpointsEvent, DamageType
+from src.common import app_config
+from src.common.app_error import AppError
+from src.common.db import DatabaseConnInfo, get_shard_conn_infos
+from src.main import app
+
+
+def _event(character_id: int, current_hit_points: int) -> str:
+    return msgspec.json.encode(
+        CharacterHitpointsEvent(
+            character_id=character_id,
+            hit_points=CharacterHitpoints(hit_point_max=25, current_hit_points=current_hit_points),
+        )
+    ).decode()
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+async def test_publish_only_reaches_subscribed_characters():
+    broker = CharacterEventBroker(max_queue_size=4)
+    briv = broker.subscribe([1])
+    party = broker.subscribe([1, 2])
+    other = broker.subscribe([3])
+
+    broker.publish(_event(1, 20))
+    broker.publish(_event(2, 10))
+    broker.close()
+
+    assert [e async for e in briv] == [_event(1, 20).encode()]
+    assert [e async for e in party] == [_event(1, 20).encode(), _event(2, 10).encode()]
+    assert [e async for e in other] == []
+
+
+async def test_slow_subscriber_is_dropped():
+    broker = CharacterEventBroker(max_queue_size=2)
+    slow = broker.subscribe([1])
+
+    for hit_points in (24, 23, 22):
+        broker.publish(_event(1, hit_points))
+
+    # The subscriber is closed and removed rather than blocking the publisher
+    assert slow.dropped
+    assert broker.subscriber_count == 0
+    assert [e async for e in slow] == []
+
+
+def test_websocket_receives_hit_point_changes(test_client: TestClient):
+    with test_client.websocket_connect("/api/v1/character/events/ws?characterId=1") as ws:
+        response = test_client.put("character/1/hit-points/damage", json={"amount": 5, "damageType": DamageType.COLD})
+        assert response.status_code == 200
+
+        assert ws.receive_json(timeout=5) == {
+            "characterId": 1,
+            "hitPoints": {"hitPointMax": 25, "currentHitPoints": 20, "temporaryHitPoints": None},
+        }
+
+
+async def test_listener_fails_startup_on_unreachable_shard(monkeypatch: pytest.MonkeyPatch):
+    unreachable = DatabaseConnInfo(host="localhost", port=1, username="postgres", password="postgres", database="x")
+    monkeypatch.setattr(character_events, "get_shard_conn_infos", lambda: [unreachable])
+    monkeypatch.setattr(app_config, "EVENT_LISTENER_READY_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(app_config, "EVENT_LISTENER_RECONNECT_SECONDS", 0.01)
+
+    with pytest.raises(AppError, match="Could not listen for hit point events on localhost:1"):
+        async with character_event_listener(app):
+            pass
+
+
+async def test_listener_reconnects_after_any_error(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "EVENT_LISTENER_RECONNECT_SECONDS", 0.01)
+    broker = CharacterEventBroker()
+    listens = 0
+    listen = broker.listen
+
+    async def failing_listen(conn: psycopg.AsyncConnection, stop: asyncio.Event) -> None:
+        nonlocal listens
+        listens += 1
+        if listens == 1:
+            raise OSError("Cannot watch the connection")
+        await listen(conn, stop)
+
+    monkeypatch.setattr(broker, "listen", failing_listen)
+    ready, stop = asyncio.Event(), asyncio.Event()
+    listener = asyncio.create_task(
+        character_events._listen_forever(broker, get_shard_conn_infos()[0].to_conn_str(), ready, stop)
+    )
+    try:
+        async with asyncio.timeout(5):
+            while listens < 2:
+                await asyncio.sleep(0.01)
+        assert not listener.done()
+    finally:
+        stop.set()
+        await listener
@@ -1,8 +1,21 @@
+from typing import Any
+
+import msgspec
 import pytest
+from psycopg import AsyncCursor
 
 from src.character.character_repo import CharacterRepo
 from src.character.exceptions import CharacterNotFoundException
-from src.character.models import CharacterHitpoints
+from src.character.models import (
+    CharacterClass,
+    CharacterHitpoints,
+    CharacterSearch,
+    CharacterSummary,
+    DamageType,
+    Defense,
+    DefenseMasks,
+    DefenseType,
+)
 
 
 async def test_update_hitpoints(character_repo: CharacterRepo):
@@ -21,6 +34,25 @@ async def test_update_hitpoints(character_repo: CharacterRepo):
     assert character.hit_points == CharacterHitpoints(hit_point_max=20, current_hit_points=15, temporary_hit_points=5)
 
 
+async def test_update_hitpoints_with_sparse_ids(character_repo: CharacterRepo):
+    # Characters copied between shards keep their ids, so they no longer match their hit points rows' ids
+    character = await character_repo.get_character(1)
+    for character_id in (3, 5, 7):
+        await character_repo.insert_character(character, character_id=character_id)
+
+    await character_repo.update_hitpoints(
+        character_id=5, hitpoints=CharacterHitpoints(hit_point_max=25, current_hit_points=10)
+    )
+
+    characters = await character_repo.get_characters([1, 3, 5, 7])
+    assert {character_id: c.hit_points.current_hit_points for character_id, c in characters.items()} == {
+        1: 25,
+        3: 25,
+        5: 10,
+        7: 25,
+    }
+
+
 async def test_update_hitpoints_character_doesnt_exist(character_repo: CharacterRepo):
     # Try to update hitpoints of a character id that doesn't exist
     with pytest.raises(CharacterNotFoundException) as exc:
@@ -29,3 +61,87 @@ async def test_update_hitpoints_character_doesnt_exist(character_repo: Character
         )
 
     assert str(exc.value) == "Cannot find character with id 2"
+
+
+async def test_get_characters(character_repo: CharacterRepo):
+    # Batch loads match single loads and skip missing ids
+    characters = await character_repo.get_characters([1, 2])
+    assert characters == {1: await character_repo.get_character(1)}
+
+
+async def test_insert_character_with_id(character_repo: CharacterRepo):
+    character = await character_repo.get_character(1)
+    assert await character_repo.insert_character(character, character_id=10) == 10
+    assert await character_repo.get_character(10) == character
+
+    await character_repo.delete_characters([10])
+    assert await character_repo.get_characters([10]) == {}
+
+
+async def test_defense_masks_are_stored(db: AsyncCursor, character_repo: CharacterRepo):
+    character = await character_repo.get_character(1)
+    assert character.defense_masks == DefenseMasks(resistance=DamageType.SLASHING.bit, immunity=DamageType.FIRE.bit)
+
+    character_id = await character_repo.insert_character(character)
+    for character_id in (1, character_id):
+        res = await (
+            await db.execute(
+                "SELECT resistance_mask, immunity_mask FROM operational.character WHERE id = %(id)s",
+                {"id": character_id},
+            )
+        ).fetchone()
+        assert res == {
+            "resistanceMask": character.defense_masks.resistance,
+            "immunityMask": character.defense_masks.immunity,
+        }
+
+    # The SQL function agrees with `DamageType.bit`, whatever the case
+    for damage_type in DamageType:
+        res = await (
+            await db.execute("SELECT operational.damage_type_bit(%(type)s) AS bit", {"type": damage_type.name})
+        ).fetchone()
+        assert res == {"bit": damage_type.bit}
+
+
+async def test_search_characters(character_repo: CharacterRepo):
+    briv = await character_repo.get_character(1)
+    wizard = msgspec.structs.replace(
+        briv,
+        name="Zan",
+        level=3,
+        classes=[CharacterClass(name="Wizard", hit_dice_value=6, class_level=3)],
+        items=[],
+        defenses=[Defense(damage_type=DamageType.FIRE, defense_type=DefenseType.RESISTANCE)],
+    )
+    multiclass = msgspec.structs.replace(
+        briv,
+        name="Tor",
+        level=8,
+        classes=[
+            CharacterClass(name="fighter", hit_dice_value=10, class_level=3),
+            CharacterClass(name="rogue", hit_dice_value=8, class_level=5),
+        ],
+    )
+    wizard_id = await character_repo.insert_character(wizard)
+    multiclass_id = await character_repo.insert_character(multiclass)
+
+    async def search(**filters: Any) -> list[int]:
+        return await character_repo.search_character_ids(CharacterSearch(**filters))
+
+    assert await search() == [1, wizard_id, multiclass_id]
+    assert await search(immune_to=[DamageType.FIRE]) == [1, multiclass_id]
+    assert await search(resistant_to=[DamageType.FIRE]) == [wizard_id]
+    assert await search(immune_to=[DamageType.FIRE], resistant_to=[DamageType.SLASHING]) == [1, multiclass_id]
+    assert await search(immune_to=[DamageType.FIRE, DamageType.COLD]) == []
+    assert await search(item_affects=["constitution"]) == [1, multiclass_id]
+    assert await search(class_name="WIZARD") == [wizard_id]
+    assert await search(class_name="fighter", min_class_level=5) == [1]
+    assert await search(class_name="fighter", min_level=5) == [1, multiclass_id]
+    assert await search(min_level=4, item_affects=["constitution"], class_name="rogue") == [multiclass_id]
+
+    # Pages continue after the last id of the previous page
+    assert await character_repo.search_character_ids(CharacterSearch(), limit=2) == [1, wizard_id]
+    assert await character_repo.search_character_ids(CharacterSearch(), after_id=wizard_id) == [multiclass_id]
+
+    summaries = await character_repo.search_characters(CharacterSearch(resistant_to=[DamageType.FIRE]))
+    assert summaries == [CharacterSummary(id=wizard_id, name="Zan", level=3, hit_points=briv.hit_points)]
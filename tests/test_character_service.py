@@ -1,6 +1,10 @@
+from datetime import timedelta
+
+import pytest
+
 from src.character.character_repo import CharacterRepo
 from src.character.character_service import CharacterService
-from src.character.models import DamageType
+from src.character.models import DamageType, Defense, DefenseMasks, DefenseType
 
 
 async def test_deal_damage(character_service: CharacterService, character_repo: CharacterRepo):
@@ -90,6 +94,20 @@ async def test_deal_damage_with_temporary_hit_points_greater(character_service:
     assert character.hit_points.temporary_hit_points is None
 
 
+@pytest.mark.parametrize("damage", [3, 5, 8])
+async def test_deal_damage_clears_used_up_temporary_hit_points_expiry(
+    character_service: CharacterService, character_repo: CharacterRepo, damage: int
+):
+    await character_service.assign_temporary_hit_points(1, 5, duration=timedelta(minutes=10))
+    assert 1 in await character_repo.get_temporary_hit_points_expiries([1])
+
+    await character_service.deal_damage(1, damage, DamageType.COLD)
+
+    # Temporary hit points that are left keep their expiry
+    expiries = await character_repo.get_temporary_hit_points_expiries([1])
+    assert (1 in expiries) == (damage < 5)
+
+
 async def test_heal(character_service: CharacterService):
     character = await character_service.deal_damage(1, 5, DamageType.COLD)
 
@@ -130,3 +148,24 @@ async def test_heal_no_effect_temporary_hit_points(character_service: CharacterS
 
     assert character.hit_points.current_hit_points == 24
     assert character.hit_points.temporary_hit_points == 5
+
+
+def test_defense_masks():
+    masks = DefenseMasks.from_defenses(
+        [
+            Defense(damage_type=DamageType.FIRE, defense_type=DefenseType.RESISTANCE),
+            Defense(damage_type=DamageType.FIRE, defense_type=DefenseType.IMMUNITY),
+            Defense(damage_type=DamageType.FORCE, defense_type=DefenseType.RESISTANCE),
+        ]
+    )
+    assert masks == DefenseMasks(resistance=DamageType.FIRE.bit | DamageType.FORCE.bit, immunity=DamageType.FIRE.bit)
+    assert masks.resolve(DamageType.FIRE) == DefenseType.IMMUNITY
+    assert masks.resolve(DamageType.FORCE) == DefenseType.RESISTANCE
+    assert masks.resolve(DamageType.COLD) is None
+
+
+def test_damage_type_lookup_is_case_insensitive():
+    assert DamageType("Fire") is DamageType.FIRE
+    assert DamageType("NECROTIC") is DamageType.NECROTIC
+    with pytest.raises(ValueError):
+        DamageType("sonic")
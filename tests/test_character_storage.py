@@ -0,0 +1,185 @@
+"""
+Conformance suite that every `CharacterStorage` backend must pass
+"""
+
+import asyncio
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from typing import Callable
+
+import msgspec
+import psycopg
+import pytest
+
+from src.character.character_repo import CharacterRepo
+from src.character.character_service import CharacterService
+from src.character.character_storage import CharacterStorage
+from src.character.exceptions import CharacterNotFoundException
+from src.character.in_memory_character_storage import InMemoryCharacterEngine
+from src.character.models import CharacterHitpoints, DamageType, DefenseMasks
+from src.common.db import get_conn_info, load_test_character
+from src.common.utils import dict_row_camel
+
+Session = Callable[[], AbstractAsyncContextManager[CharacterStorage]]
+
+
+@asynccontextmanager
+async def _postgres_session():
+    async with await psycopg.AsyncConnection.connect(get_conn_info().to_conn_str()) as conn:
+        async with conn.cursor(row_factory=dict_row_camel) as cur:
+            yield CharacterRepo(cur)
+
+
+@pytest.fixture(params=["postgres", "in_memory"])
+def session(request: pytest.FixtureRequest) -> Session:
+    """
+    Starts a unit of work on a backend holding only the test character, with id 1
+    """
+    if request.param == "postgres":
+        request.getfixturevalue("db")
+        return _postgres_session
+
+    return InMemoryCharacterEngine({1: load_test_character()}).session
+
+
+async def test_is_character_storage(session: Session):
+    async with session() as storage:
+        assert isinstance(storage, CharacterStorage)
+
+
+async def test_get_character(session: Session):
+    async with session() as storage:
+        assert await storage.get_character(1) == load_test_character()
+
+        with pytest.raises(CharacterNotFoundException) as exc_info:
+            await storage.get_character(2)
+        assert exc_info.value.character_id == 2
+
+
+async def test_get_hitpoints_and_defenses(session: Session):
+    async with session() as storage:
+        briv = load_test_character()
+        assert await storage.get_hitpoints_and_defenses(1) == (
+            briv.hit_points,
+            DefenseMasks.from_defenses(briv.defenses),
+        )
+
+        with pytest.raises(CharacterNotFoundException):
+            await storage.get_hitpoints_and_defenses(2)
+
+
+async def test_update_hitpoints(session: Session):
+    hitpoints = CharacterHitpoints(hit_point_max=30, current_hit_points=12, temporary_hit_points=4)
+    async with session() as storage:
+        character = await storage.update_hitpoints(1, hitpoints)
+        assert character == msgspec.structs.replace(load_test_character(), hit_points=hitpoints)
+
+        with pytest.raises(CharacterNotFoundException):
+            await storage.update_hitpoints(2, hitpoints)
+
+    async with session() as storage:
+        assert (await storage.get_character(1)).hit_points == hitpoints
+
+
+async def test_writes_are_dropped_on_error(session: Session):
+    hitpoints = CharacterHitpoints(hit_point_max=30, current_hit_points=12)
+    with pytest.raises(RuntimeError):
+        async with session() as storage:
+            await storage.update_hitpoints(1, hitpoints)
+            raise RuntimeError()
+
+    async with session() as storage:
+        assert await storage.get_character(1) == load_test_character()
+
+
+async def test_insert_and_list_characters(session: Session):
+    character = load_test_character()
+    renamed = msgspec.structs.replace(character, name="Mira", level=2)
+    async with session() as storage:
+        assert await storage.insert_character(renamed) == 2
+        assert await storage.insert_character(character, character_id=10) == 10
+        assert await storage.get_character(2) == renamed
+
+        # Uncommitted inserts are listed within their own unit of work
+        summaries = await storage.list_characters()
+        assert [(s.id, s.name, s.level) for s in summaries] == [(1, "Briv", 5), (2, "Mira", 2), (10, "Briv", 5)]
+        assert summaries[0].hit_points == character.hit_points
+
+    async with session() as storage:
+        assert [s.id for s in await storage.list_characters(after_id=1, limit=1)] == [2]
+        assert [s.id for s in await storage.list_characters(after_id=2)] == [10]
+        assert await storage.list_characters(after_id=10) == []
+
+
+async def test_lock_excludes_other_units_of_work(session: Session):
+    events: list[str] = []
+    first_locked = asyncio.Event()
+
+    async def first():
+        async with session() as storage:
+            await storage.lock("character_1")
+            # Taking a lock this unit of work already holds doesn't wait
+            await storage.lock("character_1")
+            first_locked.set()
+            await asyncio.sleep(0.05)
+            events.append("first done")
+
+    async def second():
+        await first_locked.wait()
+        async with session() as storage:
+            await storage.lock("character_2")
+            events.append("second locked other key")
+            await storage.lock("character_1")
+            events.append("second locked")
+
+    await asyncio.gather(first(), second())
+    assert events == ["second locked other key", "first done", "second locked"]
+
+
+async def test_character_service(session: Session):
+    async with session() as storage:
+        await storage.insert_character(load_test_character())
+
+    async with session() as storage:
+        service = CharacterService(character_storage=storage)
+        character = await service.deal_damage(character_id=2, damage=10, damage_type=DamageType.COLD)
+        assert character.hit_points.current_hit_points == 15
+        character = await service.heal(character_id=2, heal_amount=4)
+        assert character.hit_points.current_hit_points == 19
+        character = await service.assign_temporary_hit_points(character_id=2, amount=5)
+        assert character.hit_points.temporary_hit_points == 5
+
+    async with session() as storage:
+        assert (await storage.get_character(1)) == load_test_character()
+        assert (await storage.get_character(2)).hit_points == CharacterHitpoints(
+            hit_point_max=25, current_hit_points=19, temporary_hit_points=5
+        )
+
+
+async def test_in_memory_locks_are_dropped_once_released():
+    engine = InMemoryCharacterEngine()
+    async with engine.session() as storage:
+        await storage.lock("character_1")
+        assert engine.lock_for("character_1").locked()
+
+    assert "character_1" not in engine._locks
+
+
+async def test_in_memory_ids_skip_explicit_inserts():
+    engine = InMemoryCharacterEngine()
+    character = load_test_character()
+    explicit = msgspec.structs.replace(character, name="Explicit")
+    async with engine.session() as storage:
+        assert await storage.insert_character(explicit, character_id=1) == 1
+        assert await storage.insert_character(character) == 2
+    async with engine.session() as storage:
+        assert await storage.insert_character(explicit, character_id=4) == 4
+        assert await storage.insert_character(character) == 3
+    async with engine.session() as storage:
+        assert await storage.insert_character(character) == 5
+        assert [(s.id, s.name) for s in await storage.list_characters()] == [
+            (1, "Explicit"),
+            (2, "Briv"),
+            (3, "Briv"),
+            (4, "Explicit"),
+            (5, "Briv"),
+        ]
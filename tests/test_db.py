@@ -0,0 +1,45 @@
+import pytest
+from litestar.status_codes import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+
+from src.common import app_config
+from src.common.db import READ_AFTER_LSN_HEADER, replica_has_replayed
+from src.main import app
+
+
+@pytest.fixture
+def replica_test_client(monkeypatch: pytest.MonkeyPatch):
+    # Point the "replica" at the primary so routing can be exercised against a single database
+    monkeypatch.setattr(app_config, "DB_REPLICA_HOST", app_config.DB_HOST)
+    monkeypatch.setattr(app_config, "DB_REPLICA_PORT", app_config.DB_PORT)
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+async def test_replica_has_replayed_on_primary(db: AsyncCursor):
+    # A server that isn't in recovery has always replayed its own WAL
+    assert await replica_has_replayed(db.connection, "FFFFFFFF/FFFFFFFF")
+
+
+def test_write_returns_lsn_token(replica_test_client: TestClient):
+    response = replica_test_client.put("character/1/hit-points/heal", json={"amount": 1})
+    assert response.status_code == HTTP_200_OK
+    lsn = response.headers[READ_AFTER_LSN_HEADER]
+
+    response = replica_test_client.put("character/1/hit-points/damage", json={"amount": 5, "damageType": "cold"})
+    response = replica_test_client.get("character/1", headers={READ_AFTER_LSN_HEADER: lsn})
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["hitPoints"]["currentHitPoints"] == 20
+
+
+def test_invalid_lsn_token(replica_test_client: TestClient):
+    response = replica_test_client.get("character/1", headers={READ_AFTER_LSN_HEADER: "not-an-lsn"})
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+def test_no_lsn_token_without_replica():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        response = client.put("character/1/hit-points/heal", json={"amount": 1})
+        assert response.status_code == HTTP_200_OK
+        assert READ_AFTER_LSN_HEADER not in response.headers
@@ -0,0 +1,121 @@
+import msgspec
+import pytest
+from litestar.status_codes import HTTP_200_OK
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.effective_stats import (
+    EffectiveStats,
+    EffectiveStatsCache,
+    compute_effective_stats,
+    get_effective_stats,
+)
+from src.character.models import CharacterClass, CharacterHitpoints, CharacterStats, Item, ItemModifier
+from src.common.db import load_test_character
+from src.main import app
+
+
+def test_compute_effective_stats():
+    effective_stats = compute_effective_stats(load_test_character(), sheet_version=3)
+    # Briv's Ioun Stone of Fortitude gives +2 constitution
+    assert effective_stats.stats.constitution == 16
+    assert effective_stats.stats.strength == 15
+    assert effective_stats.ability_modifiers == CharacterStats(
+        strength=2, dexterity=1, constitution=3, intelligence=1, wisdom=0, charisma=-1
+    )
+    assert effective_stats.proficiency_bonus == 3
+    # A d10 at first level and the average of 6 for each of the other four, plus 3 constitution per level
+    assert effective_stats.derived_hit_point_max == 13 + 4 * 9
+    assert effective_stats.sheet_version == 3
+
+
+def test_compute_effective_stats_multiclass():
+    character = msgspec.structs.replace(
+        load_test_character(),
+        level=3,
+        classes=[
+            CharacterClass(name="wizard", hit_dice_value=6, class_level=2),
+            CharacterClass(name="fighter", hit_dice_value=10, class_level=1),
+        ],
+        stats=CharacterStats(strength=29, dexterity=10, constitution=3, intelligence=10, wisdom=10, charisma=10),
+        items=[
+            Item(
+                name="Belt of Giant Strength",
+                modifier=ItemModifier(affected_object="stats", affected_value="strength", value=4),
+            ),
+            Item(
+                name="Cloak of Billowing",
+                modifier=ItemModifier(affected_object="appearance", affected_value="cloak", value=1),
+            ),
+        ],
+    )
+    effective_stats = compute_effective_stats(character, sheet_version=1)
+    assert effective_stats.stats.strength == 30
+    assert effective_stats.ability_modifiers.constitution == -4
+    # Only the first class gets its full hit die, and every level gains at least one hit point
+    assert effective_stats.derived_hit_point_max == 2 + 1 + 2
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EffectiveStatsCache(max_size=2)
+    for character_id in (1, 2):
+        cache.put(character_id, compute_effective_stats(load_test_character(), sheet_version=1))
+    assert cache.get(1, sheet_version=1) is not None
+    cache.put(3, compute_effective_stats(load_test_character(), sheet_version=1))
+
+    assert len(cache) == 2
+    assert cache.get(2, sheet_version=1) is None
+    assert cache.get(1, sheet_version=1) is not None
+    # A stale version is a miss
+    assert cache.get(1, sheet_version=2) is None
+
+
+async def test_effective_stats_are_cached_until_sheet_changes(
+    db: AsyncCursor, character_repo: CharacterRepo, monkeypatch: pytest.MonkeyPatch
+):
+    loads: list[int] = []
+    get_character = character_repo.get_character
+
+    async def counting_get_character(character_id: int):
+        loads.append(character_id)
+        return await get_character(character_id)
+
+    monkeypatch.setattr(character_repo, "get_character", counting_get_character)
+    cache = EffectiveStatsCache()
+
+    first = await get_effective_stats(character_repo, cache, 1)
+    assert await get_effective_stats(character_repo, cache, 1) is first
+    assert loads == [1]
+
+    # Hit point changes don't invalidate effective stats
+    await character_repo.update_hitpoints(1, CharacterHitpoints(hit_point_max=25, current_hit_points=3))
+    loads.clear()
+    assert await get_effective_stats(character_repo, cache, 1) is first
+    assert loads == []
+
+    await db.execute(
+        "UPDATE operational.character_stat SET value = 18 WHERE character_id = 1 AND stat = 'constitution'"
+    )
+    updated = await get_effective_stats(character_repo, cache, 1)
+    assert updated.sheet_version > first.sheet_version
+    assert updated.stats.constitution == 20
+    assert loads == [1]
+
+    await db.execute("UPDATE operational.character_item_modifier SET value = 1")
+    assert (await get_effective_stats(character_repo, cache, 1)).stats.constitution == 19
+
+    await db.execute("UPDATE operational.character SET level = 6 WHERE id = 1")
+    assert (await get_effective_stats(character_repo, cache, 1)).proficiency_bonus == 3
+    assert loads == [1, 1, 1]
+
+
+def test_get_effective_stats_route():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        res = client.get("character/1/effective-stats")
+        assert res.status_code == HTTP_200_OK
+        effective_stats = msgspec.convert(res.json(), EffectiveStats)
+        assert effective_stats.stats.constitution == 16
+        assert effective_stats.derived_hit_point_max == 49
+
+        assert client.get("character/2/effective-stats").status_code == 404
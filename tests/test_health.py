@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from litestar.datastructures import State
+from litestar.status_codes import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+
+from src.common import app_config
+from src.common.health import HealthChecker
+from src.common.sharding import ShardRouter
+from src.main import app
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def test_liveness(test_client: TestClient):
+    for path in ["health", "health/live"]:
+        res = test_client.get(path)
+        assert res.status_code == HTTP_200_OK
+        assert res.json()["status"] == "pass"
+
+
+def test_readiness_is_answered_from_memory(test_client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    checker: HealthChecker = test_client.app.state.health_checker
+    checks = checker.checks
+
+    for _ in range(20):
+        res = test_client.get("health/ready")
+        assert res.status_code == HTTP_200_OK
+    assert checker.checks == checks
+
+    body = res.json()
+    assert body["status"] == "pass"
+    assert body["expectedMigrationVersion"] == checker.expected_migration_version
+    assert [(database["name"], database["reachable"]) for database in body["databases"]] == [("primary", True)]
+    assert body["databases"][0]["migrationVersion"] == checker.expected_migration_version
+    assert body["databases"][0]["pool"]["name"] == "primary"
+
+    # A check that hasn't run for too long can't vouch for the databases
+    monkeypatch.setattr(checker, "max_age", 0)
+    time.sleep(0.01)
+    res = test_client.get("health/ready")
+    assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+    assert res.json()["description"].startswith("Databases haven't been checked for")
+
+
+@pytest.fixture
+def single_connection_pools(monkeypatch: pytest.MonkeyPatch):
+    # Requested before `shards`, whose pool then holds a single connection
+    monkeypatch.setattr(app_config, "DB_POOL_MIN_SIZE", 1)
+    monkeypatch.setattr(app_config, "DB_POOL_MAX_SIZE", 1)
+
+
+async def test_readiness_reports_unhealthy_databases(
+    db: AsyncCursor, single_connection_pools: None, shards: ShardRouter
+):
+    state = State({"shard_pools": shards.pools, "replica_pool": None, "shards": None})
+    checker = HealthChecker(state, interval=60)
+    assert checker.readiness().description == "Databases haven't been checked yet"
+
+    await checker.refresh()
+    assert checker.readiness().description == "Shard map hasn't been loaded"
+    state.shards = shards
+    assert checker.readiness().ready
+
+    # Behind on migrations
+    await db.execute(
+        "DELETE FROM operational.schema_version WHERE version = %(version)s",
+        {"version": checker.expected_migration_version},
+    )
+    await db.connection.commit()
+    await checker.refresh()
+    assert checker.readiness().description == (
+        f"Database 'test' is at migration version {checker.expected_migration_version - 1}, expected "
+        f"{checker.expected_migration_version}"
+    )
+
+    # Unreachable, here because the pool is exhausted
+    checker.timeout = 0.1
+    async with shards.pools[0].connection():
+        await checker.refresh()
+    readiness = checker.readiness()
+    assert not readiness.ready
+    assert readiness.databases[0].error == "TimeoutError"
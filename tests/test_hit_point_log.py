@@ -0,0 +1,139 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from psycopg import AsyncConnection, AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.character_service import CharacterService
+from src.character.hit_point_log import HitPointLogRelay, decode_change, relay_changes, tail
+from src.character.models import DamageType
+from src.common.db import get_conn_info, load_test_character
+from src.common.segmented_log import ConsumerOffsets, SegmentedLogException, SegmentedLogReader, SegmentedLogWriter
+
+
+def test_segmented_log(tmp_path: Path):
+    records = [f"record {i}".encode() * (i % 3 + 1) for i in range(100)]
+    with SegmentedLogWriter(tmp_path, segment_bytes=200) as log:
+        assert log.append(records[:60]) == 60
+    assert len(list(tmp_path.glob("*.log"))) > 1
+
+    with SegmentedLogReader(tmp_path) as reader:
+        read = reader.read(0, 1000)
+        assert read == list(enumerate(records[:60]))
+        assert reader.read(60, 10) == []
+
+        # Readers pick up records, and segments, as they're appended
+        with SegmentedLogWriter(tmp_path, segment_bytes=200) as log:
+            assert log.next_offset == 60
+            log.append(records[60:])
+            log.sync()
+            assert [offset for offset, _ in reader.read(60, 25)] == list(range(60, 85))
+            assert reader.read(85, 1000) == list(enumerate(records))[85:]
+
+        # Reading from anywhere
+        for offset in [0, 7, 33, 99]:
+            assert reader.read(offset, 2) == list(enumerate(records))[offset : offset + 2]
+
+
+def test_segmented_log_recovers_from_torn_writes(tmp_path: Path):
+    with SegmentedLogWriter(tmp_path, segment_bytes=1 << 20) as log:
+        log.append([b"a", b"bb"])
+    segment = next(tmp_path.glob("*.log"))
+    # Only part of a third record made it to disk
+    with open(segment, "ab") as fp:
+        fp.write(b"\x00\x00\x00\x05cc")
+
+    with SegmentedLogReader(tmp_path) as reader:
+        assert reader.read(0, 10) == [(0, b"a"), (1, b"bb")]
+        with SegmentedLogWriter(tmp_path, segment_bytes=1 << 20) as log:
+            assert log.append([b"ccc"]) == 3
+        assert reader.read(2, 10) == [(2, b"ccc")]
+
+
+def test_segmented_log_trimmed(tmp_path: Path):
+    with SegmentedLogWriter(tmp_path, segment_bytes=1) as log:
+        log.append([b"a", b"b", b"c"])
+    (tmp_path / f"{0:020d}.log").unlink()
+
+    with SegmentedLogReader(tmp_path) as reader:
+        with pytest.raises(SegmentedLogException):
+            reader.read(0, 10)
+        assert reader.read(1, 10) == [(1, b"b"), (2, b"c")]
+
+
+def test_consumer_offsets(tmp_path: Path):
+    offsets = ConsumerOffsets(tmp_path / "consumers")
+    assert offsets.get("analytics") == 0
+    offsets.commit("analytics", 42)
+    assert ConsumerOffsets(tmp_path / "consumers").get("analytics") == 42
+
+
+async def _outbox(db: AsyncCursor) -> list[tuple[int, int]]:
+    res = await (
+        await db.execute("SELECT character_id, current_hit_points FROM operational.hit_point_outbox ORDER BY id")
+    ).fetchall()
+    await db.connection.commit()
+    return [(row["characterId"], row["currentHitPoints"]) for row in res]
+
+
+async def test_committed_hit_point_changes_are_relayed(
+    db: AsyncCursor, character_repo: CharacterRepo, character_service: CharacterService, tmp_path: Path
+):
+    character_id = await character_repo.insert_character(load_test_character())
+    await db.connection.commit()
+    await character_service.deal_damage(character_id=1, damage=10, damage_type=DamageType.PIERCING)
+    await character_service.heal(character_id=1, heal_amount=3)
+    await db.connection.commit()
+
+    # Changes that roll back, or that don't change hit points, aren't captured
+    await character_service.deal_damage(character_id=character_id, damage=10, damage_type=DamageType.PIERCING)
+    await db.connection.rollback()
+    await character_repo.set_temporary_hit_points_expiry(1, None)
+    await db.connection.commit()
+
+    assert await _outbox(db) == [(1, 25), (character_id, 25), (1, 15), (1, 18)]
+
+    async with await AsyncConnection.connect(get_conn_info().to_conn_str(), autocommit=True) as conn:
+        with SegmentedLogWriter(tmp_path, segment_bytes=1 << 20) as log:
+            assert await relay_changes(conn, 0, log, batch_size=3) == 3
+            assert await relay_changes(conn, 0, log, batch_size=3) == 1
+            assert await relay_changes(conn, 0, log, batch_size=3) == 0
+    assert await _outbox(db) == []
+
+    with SegmentedLogReader(tmp_path) as reader:
+        changes = [decode_change(record) for _, record in reader.read(0, 10)]
+    assert [(change.character_id, change.current_hit_points) for change in changes] == [
+        (1, 25),
+        (character_id, 25),
+        (1, 15),
+        (1, 18),
+    ]
+    assert [change.outbox_id for change in changes] == sorted(change.outbox_id for change in changes)
+    assert {(change.shard, change.hit_point_max, change.temporary_hit_points) for change in changes} == {(0, 25, None)}
+
+
+async def test_one_relay_at_a_time(
+    db: AsyncCursor, character_service: CharacterService, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+):
+    relays = [HitPointLogRelay(path=tmp_path, interval=0.01) for _ in range(2)]
+    for relay in relays:
+        await relay.start()
+    try:
+        await character_service.deal_damage(character_id=1, damage=5, damage_type=DamageType.PIERCING)
+        await db.connection.commit()
+        async with asyncio.timeout(5):
+            while sum(relay.relayed for relay in relays) < 2:
+                await asyncio.sleep(0.01)
+        assert sorted(relay.relaying for relay in relays) == [False, True]
+    finally:
+        for relay in relays:
+            await relay.stop()
+
+    assert tail(tmp_path, "analytics", follow=False) == 2
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line["current_hit_points"] for line in lines] == [25, 20]
+    # Consumers carry on from where they left off
+    assert tail(tmp_path, "analytics", follow=False) == 0
+    assert tail(tmp_path, "audit", follow=False) == 2
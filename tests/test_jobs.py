@@ -0,0 +1,234 @@
+import asyncio
+import time
+from typing import Optional
+
+import msgspec
+import pytest
+from litestar.status_codes import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND
+from litestar.testing import TestClient
+from psycopg import AsyncConnection, AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import CharacterHitpoints
+from src.common import app_config
+from src.common.db import get_conn_info, load_test_character
+from src.common.jobs import JobContext, JobQueue, JobStatus, job_handler
+from src.common.sharding import ShardRouter
+from src.main import app
+
+
+class CountParams(msgspec.Struct, frozen=True, kw_only=True, rename="camel"):
+    to: int
+    fail_at: Optional[int] = None
+    cancel_at: Optional[int] = None
+
+
+@job_handler("test_count", CountParams)
+async def count(context: JobContext, params: CountParams) -> list[int]:
+    counted: list[int] = context.result or []
+    for i in range(context.done, params.to):
+        if i == params.fail_at:
+            raise ValueError(f"Failed at {i}")
+        if i == params.cancel_at:
+            await context.queue.cancel(context.job.id)
+        counted.append(i)
+        await context.report_progress(i + 1, params.to, counted)
+    return counted
+
+
+@pytest.fixture
+async def queue(shards: ShardRouter):
+    queue = JobQueue(concurrency=0, stale_after=0.5, max_attempts=2)
+    await queue.start(shards)
+    yield queue
+    await queue.stop()
+
+
+async def test_jobs_run_in_order(queue: JobQueue):
+    first = await queue.enqueue("test_count", CountParams(to=3))
+    second = await queue.enqueue("test_count", CountParams(to=2, fail_at=1))
+    assert first.status == JobStatus.QUEUED and first.progress_total is None
+
+    assert await queue.run_next()
+    job = await queue.get(first.id)
+    assert job and job.status == JobStatus.SUCCEEDED
+    assert (job.progress_done, job.progress_total, job.result, job.attempts) == (3, 3, [0, 1, 2], 1)
+
+    assert await queue.run_next()
+    job = await queue.get(second.id)
+    assert job and job.status == JobStatus.FAILED
+    assert (job.error, job.progress_done, job.result) == ("Failed at 1", 1, [0])
+
+    assert not await queue.run_next()
+    assert await queue.get(second.id + 1) is None
+
+
+async def test_claims_skip_locked_jobs(queue: JobQueue):
+    first = await queue.enqueue("test_count", CountParams(to=1))
+    second = await queue.enqueue("test_count", CountParams(to=1))
+
+    # Another worker is claiming the first job
+    async with await AsyncConnection.connect(get_conn_info().to_conn_str()) as conn:
+        await conn.execute("SELECT id FROM operational.job WHERE id = %(id)s FOR UPDATE", {"id": first.id})
+        assert await asyncio.wait_for(queue.run_next(), 5)
+        assert [(await queue.get(job.id)).status for job in (first, second)] == [  # type: ignore[union-attr]
+            JobStatus.QUEUED,
+            JobStatus.SUCCEEDED,
+        ]
+
+
+async def test_cancel(queue: JobQueue):
+    queued = await queue.enqueue("test_count", CountParams(to=1))
+    job = await queue.cancel(queued.id)
+    assert job and job.status == JobStatus.CANCELLED and job.finished_at
+    assert not await queue.run_next()
+
+    # A running job stops at its next progress report, keeping what it had done
+    running = await queue.enqueue("test_count", CountParams(to=5, cancel_at=2))
+    assert await queue.run_next()
+    job = await queue.get(running.id)
+    assert job and job.status == JobStatus.CANCELLED
+    assert (job.progress_done, job.result) == (3, [0, 1, 2])
+
+    # Finished jobs can't be cancelled
+    job = await queue.cancel(running.id)
+    assert job and job.status == JobStatus.CANCELLED
+    assert await queue.cancel(running.id + 1) is None
+
+
+async def test_stale_jobs_are_taken_over(db: AsyncCursor, queue: JobQueue):
+    job = await queue.enqueue("test_count", CountParams(to=4))
+    # A worker claimed the job and got halfway before dying
+    await db.execute(
+        """
+        UPDATE operational.job
+        SET status = 'running', attempts = 1, progress_done = 2, result = '[0, 1]', heartbeat_at = now()
+        WHERE id = %(id)s
+        """,
+        {"id": job.id},
+    )
+    await db.connection.commit()
+    assert not await queue.run_next()
+
+    time.sleep(0.5)
+    assert await queue.run_next()
+    taken_over = await queue.get(job.id)
+    assert taken_over and taken_over.status == JobStatus.SUCCEEDED
+    assert (taken_over.result, taken_over.attempts) == ([0, 1, 2, 3], 2)
+
+
+async def test_jobs_give_up_after_max_attempts(db: AsyncCursor, queue: JobQueue):
+    job = await queue.enqueue("test_count", CountParams(to=1))
+    await db.execute(
+        "UPDATE operational.job SET status = 'running', attempts = 2, heartbeat_at = now() - interval '1 minute'"
+    )
+    await db.connection.commit()
+
+    assert await queue.run_next()
+    job = await queue.get(job.id)
+    assert job and job.status == JobStatus.FAILED
+    assert job.error == "Gave up after 2 attempts"
+
+
+async def test_stopping_workers_queues_their_jobs_again(shards: ShardRouter):
+    started = asyncio.Event()
+
+    @job_handler("test_wait", CountParams)
+    async def wait(context: JobContext, params: CountParams) -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    queue = JobQueue(concurrency=1, poll_interval=0.01)
+    await queue.start(shards)
+    job = await queue.enqueue("test_wait", CountParams(to=1))
+    await asyncio.wait_for(started.wait(), 5)
+    await queue.stop()
+
+    job = await queue.get(job.id)
+    assert job and (job.status, job.attempts) == (JobStatus.QUEUED, 0)
+
+
+async def test_long_rest(character_repo: CharacterRepo, db: AsyncCursor, queue: JobQueue):
+    character_ids = [1] + [await character_repo.insert_character(load_test_character()) for _ in range(2)]
+    for character_id in character_ids[:2]:
+        await character_repo.update_hitpoints(
+            character_id, CharacterHitpoints(hit_point_max=25, current_hit_points=3, temporary_hit_points=4)
+        )
+    await db.connection.commit()
+
+    job = await queue.enqueue("long_rest", {"characterIds": character_ids + [999]})
+    assert await queue.run_next()
+    job = await queue.get(job.id)
+    assert job and job.status == JobStatus.SUCCEEDED
+    assert job.result == {"characterIds": character_ids}
+    for character in (await character_repo.get_characters(character_ids)).values():
+        assert character.hit_points == CharacterHitpoints(hit_point_max=25, current_hit_points=25)
+
+
+async def test_import_characters_taken_over(
+    character_repo: CharacterRepo, db: AsyncCursor, queue: JobQueue, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(app_config, "JOB_BATCH_SIZE", 2)
+    names = ["Zariel", "Karlach", "Lae'zel"]
+    characters = [msgspec.structs.replace(load_test_character(), name=name) for name in names]
+    job = await queue.enqueue("import_characters", {"characters": msgspec.to_builtins(characters)})
+
+    # A worker allocated ids for the first batch and inserted one character before dying
+    allocated = [await queue.shards.allocate_character_id() for _ in range(2)]
+    await character_repo.insert_character(characters[0], character_id=allocated[0])
+    await db.execute(
+        """
+        UPDATE operational.job
+        SET status = 'running', attempts = 1, result = %(result)s, heartbeat_at = now() - interval '1 minute'
+        WHERE id = %(id)s
+        """,
+        {"id": job.id, "result": msgspec.json.encode({"characterIds": allocated}).decode()},
+    )
+    await db.connection.commit()
+
+    assert await queue.run_next()
+    job = await queue.get(job.id)
+    assert job and job.status == JobStatus.SUCCEEDED
+    character_ids = job.result["characterIds"]
+    assert character_ids[:2] == allocated and len(character_ids) == 3
+    # Nothing was imported twice
+    summaries = await character_repo.list_characters()
+    assert [summary.name for summary in summaries] == ["Briv"] + names
+    assert [summary.id for summary in summaries[1:]] == character_ids
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def _wait_for_job(test_client: TestClient, job_id: int) -> dict:
+    deadline = time.monotonic() + 10
+    while (job := test_client.get(f"jobs/{job_id}").json())["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, "Job never finished"
+        time.sleep(0.05)
+    return job
+
+
+def test_import_characters(test_client: TestClient):
+    character = msgspec.to_builtins(load_test_character())
+    res = test_client.post("character/import", json={"characters": [character, character | {"name": "Zariel"}]})
+    assert res.status_code == HTTP_202_ACCEPTED
+    assert res.json()["status"] == "queued"
+
+    job = _wait_for_job(test_client, res.json()["id"])
+    assert job["status"] == "succeeded"
+    assert (job["progressDone"], job["progressTotal"]) == (2, 2)
+    character_ids = job["result"]["characterIds"]
+    assert [test_client.get(f"character/{character_id}").json()["name"] for character_id in character_ids] == [
+        "Briv",
+        "Zariel",
+    ]
+
+    res = test_client.post("character/long-rest", json={"characterIds": character_ids})
+    assert res.status_code == HTTP_202_ACCEPTED
+    assert _wait_for_job(test_client, res.json()["id"])["result"] == {"characterIds": character_ids}
+
+    assert test_client.get("jobs/999").status_code == HTTP_404_NOT_FOUND
+    assert test_client.post("jobs/999/cancel").status_code == HTTP_404_NOT_FOUND
@@ -0,0 +1,82 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from src.common import app_config
+from src.common.log_config import LogSampler, StructuredFormatter, _DeferredQueueHandler, get_logger
+
+
+def _record(name: str = "test", msg: str = "Hello %s", args: tuple = ("Briv",), **extra) -> logging.LogRecord:
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_structured_formatter():
+    record = _record()
+    record.created = 1700000000.5
+    log = json.loads(StructuredFormatter().format(record))
+    assert log["message"] == "Hello Briv"
+    assert log["level"] == "INFO"
+    assert log["utc_time"] == "2023-11-14 10:13:20PM"
+    assert log["cst_time"] == "2023-11-14 04:13:20PM"
+    assert log["stack_trace"] is None
+    assert log["is_healthcheck"] is False
+
+
+def test_structured_formatter_exception():
+    try:
+        raise ValueError("Bad roll")
+    except ValueError as e:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, e, None, (type(e), e, e.__traceback__))
+
+    log = json.loads(StructuredFormatter().format(record))
+    assert log["message"] == "ValueError: Bad roll"
+    assert "Traceback" in log["stack_trace"]
+
+
+def test_log_sampler(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "LOG_HEALTHCHECK_SAMPLE_EVERY", 3)
+    monkeypatch.setattr(app_config, "LOG_NOT_FOUND_SAMPLE_EVERY", 2)
+    sampler = LogSampler()
+
+    healthcheck = _record(name="uvicorn.access", msg="%s - %s %s", args=("127.0.0.1", "GET", "/health"))
+    assert [sampler.filter(healthcheck) for _ in range(6)] == [True, False, False, True, False, False]
+    assert healthcheck.is_healthcheck
+
+    not_found = _record(status_code=404)
+    assert [sampler.filter(not_found) for _ in range(4)] == [True, False, True, False]
+
+    # Everything else is always kept
+    assert all(sampler.filter(_record(status_code=500)) for _ in range(4))
+
+
+@pytest.mark.parametrize("every", [0, 1, -1])
+def test_log_sampler_keeps_everything_when_not_sampling(monkeypatch: pytest.MonkeyPatch, every: int):
+    monkeypatch.setattr(app_config, "LOG_HEALTHCHECK_SAMPLE_EVERY", every)
+    monkeypatch.setattr(app_config, "LOG_NOT_FOUND_SAMPLE_EVERY", every)
+    sampler = LogSampler()
+
+    healthcheck = _record(name="uvicorn.access", msg="%s - %s %s", args=("127.0.0.1", "GET", "/health"))
+    assert all(sampler.filter(healthcheck) for _ in range(3))
+    assert all(sampler.filter(_record(status_code=404)) for _ in range(3))
+
+
+def test_deferred_queue_handler_interpolates_message():
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    hit_points = [25]
+    handler.handle(_record(msg="Hit points %s", args=(hit_points,)))
+
+    # The message is fixed when it's logged, even if its arguments change before the listener formats it
+    hit_points.append(20)
+    assert log_queue.get_nowait().getMessage() == "Hit points [25]"
+
+
+def test_get_logger_shares_one_handler():
+    logger = get_logger("test_log_config")
+    assert get_logger("test_log_config").handlers == logger.handlers
+    assert len(logger.handlers) == 1
+    assert get_logger("test_log_config_other").handlers == logger.handlers
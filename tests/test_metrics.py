@@ -0,0 +1,49 @@
+import pytest
+from litestar.status_codes import HTTP_200_OK
+from litestar.testing import TestClient
+from prometheus_client import REGISTRY
+
+from src.common.metrics import lock_name, record_cache_lookup
+from src.main import app
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def _sample(name: str, labels: dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_lock_name():
+    assert lock_name("CharacterService__heal_12") == "CharacterService__heal"
+    assert lock_name("rebalance") == "rebalance"
+
+
+def test_record_cache_lookup():
+    before = _sample("cache_lookups_total", {"cache": "test", "result": "hit"})
+    record_cache_lookup("test", hit=True)
+    assert _sample("cache_lookups_total", {"cache": "test", "result": "hit"}) == before + 1
+
+
+def test_metrics(test_client: TestClient):
+    request_labels = {"method": "PUT", "route": "/api/v1/character/{id:int}/hit-points/damage", "status_code": "200"}
+    before = _sample("http_request_duration_seconds_count", request_labels)
+    queries_before = _sample("db_query_duration_seconds_count", {"query": "update_hitpoints"})
+    locks_before = _sample("db_advisory_lock_wait_seconds_count", {"lock": "CharacterService__deal_damage"})
+
+    response = test_client.put("character/1/hit-points/damage", json={"amount": 5, "damageType": "cold"})
+    assert response.status_code == HTTP_200_OK
+
+    # Requests are labelled by route template, not by the character in the path
+    assert _sample("http_request_duration_seconds_count", request_labels) == before + 1
+    assert _sample("db_query_duration_seconds_count", {"query": "update_hitpoints"}) == queries_before + 1
+    assert _sample("db_advisory_lock_wait_seconds_count", {"lock": "CharacterService__deal_damage"}) == locks_before + 1
+    assert _sample("db_pool_checkout_wait_seconds_count", {"pool": "primary"}) > 0
+
+    response = test_client.get("metrics")
+    assert response.status_code == HTTP_200_OK
+    assert 'http_requests_in_flight{method="GET",route="/api/v1/metrics"} 1.0' in response.text
+    assert 'route="/api/v1/character/{id:int}/hit-points/damage"' in response.text
@@ -0,0 +1,89 @@
+import asyncio
+from pathlib import Path
+
+import psycopg
+import pytest
+from psycopg import AsyncConnection
+
+from src.common.db import get_conn_info, teardown_db
+from src.common.migrations import MigrationException, load_migrations, migrate
+
+CREATE_PARTY = "CREATE TABLE operational.party (id SERIAL PRIMARY KEY, name TEXT NOT NULL);"
+
+
+@pytest.fixture
+async def migrations(tmp_path: Path):
+    await teardown_db()
+    (tmp_path / "V1__create_party.sql").write_text(CREATE_PARTY)
+    (tmp_path / "V2__add_party_size.sql").write_text("ALTER TABLE operational.party ADD COLUMN size INT;")
+    yield tmp_path
+
+    load_migrations.cache_clear()
+    await teardown_db()
+
+
+def _schema_versions() -> list[tuple[int, str]]:
+    with psycopg.connect(get_conn_info().to_conn_str()) as conn:
+        return conn.execute("SELECT version, description FROM operational.schema_version ORDER BY version").fetchall()
+
+
+async def test_load_migrations(migrations: Path):
+    loaded = load_migrations(migrations)
+    assert [(m.version, m.description) for m in loaded] == [(1, "create party"), (2, "add party size")]
+    assert loaded[0].checksum != loaded[1].checksum
+
+
+async def test_migrate_applies_pending_migrations(migrations: Path):
+    conn_str = get_conn_info().to_conn_str()
+    assert await migrate(conn_str, migrations) == 2
+    assert _schema_versions() == [(1, "create party"), (2, "add party size")]
+
+    load_migrations.cache_clear()
+    (migrations / "V3__add_party_campaign.sql").write_text("ALTER TABLE operational.party ADD COLUMN campaign TEXT;")
+    assert await migrate(conn_str, migrations) == 1
+    assert [version for version, _ in _schema_versions()] == [1, 2, 3]
+
+
+async def test_migrate_is_one_query_when_current(migrations: Path, monkeypatch: pytest.MonkeyPatch):
+    conn_str = get_conn_info().to_conn_str()
+    await migrate(conn_str, migrations)
+
+    queries: list[str] = []
+    execute = AsyncConnection.execute
+
+    def counting_execute(self: AsyncConnection, query: str, *args: object, **kwargs: object):
+        queries.append(query)
+        return execute(self, query, *args, **kwargs)  # type: ignore[arg-type]
+
+    monkeypatch.setattr(AsyncConnection, "execute", counting_execute)
+    assert await migrate(conn_str, migrations) == 0
+    assert len(queries) == 1
+
+
+async def test_migrate_rejects_changed_migrations(migrations: Path):
+    conn_str = get_conn_info().to_conn_str()
+    await migrate(conn_str, migrations)
+
+    load_migrations.cache_clear()
+    (migrations / "V1__create_party.sql").write_text(CREATE_PARTY.replace("name TEXT", "title TEXT"))
+    with pytest.raises(MigrationException, match="V1"):
+        await migrate(conn_str, migrations)
+
+
+async def test_failed_migration_is_rolled_back(migrations: Path):
+    (migrations / "V3__broken.sql").write_text(
+        "CREATE TABLE operational.campaign (id SERIAL PRIMARY KEY); SELECT * FROM operational.missing;"
+    )
+    with pytest.raises(psycopg.errors.UndefinedTable):
+        await migrate(get_conn_info().to_conn_str(), migrations)
+
+    assert [version for version, _ in _schema_versions()] == [1, 2]
+    with psycopg.connect(get_conn_info().to_conn_str()) as conn:
+        assert conn.execute("SELECT to_regclass('operational.campaign')").fetchone() == (None,)
+
+
+async def test_concurrent_workers_migrate_once(migrations: Path):
+    conn_str = get_conn_info().to_conn_str()
+    applied = await asyncio.gather(*(migrate(conn_str, migrations) for _ in range(5)))
+    assert sorted(applied) == [0, 0, 0, 0, 2]
+    assert [version for version, _ in _schema_versions()] == [1, 2]
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from litestar.datastructures import State
+from litestar.status_codes import HTTP_200_OK, HTTP_201_CREATED, HTTP_404_NOT_FOUND
+from litestar.testing import TestClient
+from psycopg import AsyncConnection, AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.character_service import CharacterService
+from src.character.models import CharacterHitpoints, DamageType, PartyRollup
+from src.character.party_repo import PartyRepo
+from src.character.party_rollups import (
+    RECONCILE_LOCK_KEY,
+    PartyRollupReconciler,
+    check_rollups,
+    main,
+    rebuild_rollups,
+)
+from src.common.db import get_conn_info, load_test_character
+from src.common.sharding import ShardRouter
+from src.main import app
+
+
+@pytest.fixture
+def party_repo(shards: ShardRouter):
+    return PartyRepo(shards)
+
+
+def _rollup(party_id: int, members: list[tuple[int, int, int]]) -> PartyRollup:
+    """
+    The rollup of a party whose members have the given `(max, current, temporary)` hit points
+    """
+    return PartyRollup(
+        party_id=party_id,
+        member_count=len(members),
+        hit_point_max=sum(m[0] for m in members),
+        current_hit_points=sum(m[1] for m in members),
+        temporary_hit_points=sum(m[2] for m in members),
+        downed_count=sum(1 for m in members if m[1] == 0),
+        average_hit_point_percentage=(
+            round(sum(round(100 * m[1] / m[0], 4) for m in members) / len(members), 2) if members else None
+        ),
+    )
+
+
+async def test_rollups_follow_hit_point_changes(
+    db: AsyncCursor, character_repo: CharacterRepo, character_service: CharacterService, party_repo: PartyRepo
+):
+    party = await party_repo.create_party("The Company")
+    assert await party_repo.get_party(party.id) == party
+    assert await party_repo.get_party(party.id + 1) is None
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [])
+
+    character_ids = [1] + [await character_repo.insert_character(load_test_character()) for _ in range(2)]
+    await db.connection.commit()
+    assert await party_repo.add_members(party.id, character_ids + [999]) == character_ids
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 25, 0)] * 3)
+
+    await character_service.deal_damage(character_id=1, damage=30, damage_type=DamageType.PIERCING)
+    await character_service.assign_temporary_hit_points(character_id=character_ids[1], amount=5)
+    await character_repo.update_hitpoints(
+        character_ids[2], CharacterHitpoints(hit_point_max=30, current_hit_points=7, temporary_hit_points=None)
+    )
+    # Changes are only counted once they commit
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 25, 0)] * 3)
+    await db.connection.commit()
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 0, 0), (25, 25, 5), (30, 7, 0)])
+
+    # Batches
+    await character_repo.set_temporary_hit_points_expiry(character_ids[1], datetime.now(timezone.utc))
+    await character_repo.expire_temporary_hit_points(character_ids, datetime.now(timezone.utc) + timedelta(seconds=1))
+    await character_repo.long_rest(character_ids[:2])
+    await db.connection.commit()
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 25, 0), (25, 25, 0), (30, 7, 0)])
+
+    # Leaving, joining another party and being deleted
+    other = await party_repo.create_party("The Other Company")
+    assert await party_repo.remove_members(other.id, [1]) == []
+    assert await party_repo.remove_members(party.id, [1]) == [1]
+    await party_repo.add_members(other.id, [character_ids[1]])
+    await character_repo.delete_characters([character_ids[2]])
+    await db.connection.commit()
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [])
+    assert await party_repo.get_rollup(other.id) == _rollup(other.id, [(25, 25, 0)])
+    assert await check_rollups(db.connection) == []
+
+
+async def test_check_and_rebuild_rollups(db: AsyncCursor, character_repo: CharacterRepo, party_repo: PartyRepo):
+    parties = [await party_repo.create_party(f"Party {i}") for i in range(4)]
+    for party in parties:
+        character_id = await character_repo.insert_character(load_test_character())
+        await db.connection.commit()
+        await party_repo.add_members(party.id, [character_id])
+
+    # Written with triggers off, or edited by hand
+    await db.execute("SET session_replication_role = replica")
+    await db.execute("UPDATE operational.character_hitpoints SET current_hit_points = 1 WHERE character_id = 2")
+    await db.execute("RESET session_replication_role")
+    await db.execute("DELETE FROM operational.party_rollup WHERE party_id = %(id)s", {"id": parties[2].id})
+    await db.execute("INSERT INTO operational.party_rollup (party_id, member_count) VALUES (99, 1)")
+    await db.connection.commit()
+
+    drifted = [parties[0].id, parties[2].id, 99]
+    assert await check_rollups(db.connection, batch_size=2) == drifted
+    assert await main(argparse.Namespace(rebuild=False, repair=False)) == 1
+    assert await rebuild_rollups(db.connection, drifted, batch_size=2) == 3
+    assert await check_rollups(db.connection) == []
+    assert (await party_repo.get_rollup(parties[0].id)).current_hit_points == 1
+    assert await party_repo.get_rollup(99) == _rollup(99, [])
+    assert await rebuild_rollups(db.connection, batch_size=2) == 5
+    assert await main(argparse.Namespace(rebuild=False, repair=True)) == 0
+
+
+async def test_rebuilds_keep_concurrent_changes(db: AsyncCursor, character_repo: CharacterRepo, party_repo: PartyRepo):
+    party = await party_repo.create_party("The Company")
+    await party_repo.add_members(party.id, [1])
+    await db.execute("UPDATE operational.party_rollup SET member_count = 7")
+    await db.connection.commit()
+
+    # A change to a member that hasn't committed when the rebuild starts is applied on top of the rebuilt rollup
+    await character_repo.update_hitpoints(1, CharacterHitpoints(hit_point_max=25, current_hit_points=10))
+    async with await AsyncConnection.connect(get_conn_info().to_conn_str()) as conn:
+        rebuild = asyncio.create_task(rebuild_rollups(conn, [party.id]))
+        await asyncio.sleep(0.2)
+        assert not rebuild.done()
+        await db.connection.commit()
+        assert await asyncio.wait_for(rebuild, 5) == 1
+
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 10, 0)])
+    assert await check_rollups(db.connection) == []
+
+
+async def test_reconciler(db: AsyncCursor, shards: ShardRouter, party_repo: PartyRepo):
+    party = await party_repo.create_party("The Company")
+    await party_repo.add_members(party.id, [1])
+    await db.execute("UPDATE operational.party_rollup SET current_hit_points = 0")
+    await db.connection.commit()
+
+    reconciler = PartyRollupReconciler(State({"shards": shards}), interval=0.01)
+    # Another process is reconciling
+    async with await AsyncConnection.connect(get_conn_info().to_conn_str(), autocommit=True) as conn:
+        await conn.execute("SELECT pg_advisory_lock(%s)", (RECONCILE_LOCK_KEY,))
+        assert await reconciler.reconcile() == 0
+
+    await reconciler.start()
+    async with asyncio.timeout(5):
+        while not reconciler.repaired:
+            await asyncio.sleep(0.01)
+    await reconciler.stop()
+
+    assert reconciler.repaired == 1
+    assert await party_repo.get_rollup(party.id) == _rollup(party.id, [(25, 25, 0)])
+
+
+@pytest.fixture
+def test_client():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def test_party_api(test_client: TestClient):
+    res = test_client.post("party", json={"name": "The Company"})
+    assert res.status_code == HTTP_201_CREATED
+    party = res.json()
+    assert party["name"] == "The Company"
+    assert test_client.get(f"party/{party['id']}").json() == party
+
+    res = test_client.put(f"party/{party['id']}/members", json={"characterIds": [1, 999]})
+    assert res.status_code == HTTP_200_OK
+    assert res.json()["memberCount"] == 1
+
+    test_client.put("character/1/hit-points/damage", json={"amount": 30, "damageType": "cold"})
+    assert test_client.get(f"party/{party['id']}/rollup").json() == {
+        "partyId": party["id"],
+        "memberCount": 1,
+        "hitPointMax": 25,
+        "currentHitPoints": 0,
+        "temporaryHitPoints": 0,
+        "downedCount": 1,
+        "averageHitPointPercentage": 0.0,
+    }
+
+    res = test_client.delete(f"party/{party['id']}/members/1")
+    assert res.status_code == HTTP_200_OK
+    assert (res.json()["memberCount"], res.json()["averageHitPointPercentage"]) == (0, None)
+
+    assert test_client.get("party/999").status_code == HTTP_404_NOT_FOUND
+    assert test_client.get("party/999/rollup").status_code == HTTP_404_NOT_FOUND
+    assert test_client.put("party/999/members", json={"characterIds": [1]}).status_code == HTTP_404_NOT_FOUND
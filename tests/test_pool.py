@@ -0,0 +1,132 @@
+import pytest
+from litestar.status_codes import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.common import app_config
+from src.common.db import get_conn_info
+from src.common.pool import AcquireStats, LazyConnection, create_pool, open_pool, pool_size, warm_pool
+from src.common.utils import dict_row_camel
+from src.main import app
+
+
+def test_acquire_stats_percentiles():
+    stats = AcquireStats(window=4)
+    for seconds in [0.5, 0.1, 0.2, 0.3, 0.4]:
+        stats.record(seconds)
+
+    # Percentiles only cover the most recent window, while count and max cover every acquisition
+    assert stats.count == 5
+    assert stats.max_seconds == 0.5
+    assert stats.percentile(0.5) == 0.3
+    assert stats.percentile(0.99) == 0.4
+
+
+def test_acquire_stats_empty():
+    assert AcquireStats().percentile(0.5) == 0.0
+
+
+def test_pool_size_shares_connection_budget(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "DB_POOL_MIN_SIZE", 4)
+    monkeypatch.setattr(app_config, "DB_POOL_MAX_SIZE", 10)
+    assert pool_size() == (4, 10)
+
+    monkeypatch.setattr(app_config, "DB_CONNECTION_BUDGET", 24)
+    monkeypatch.setattr(app_config, "WEB_WORKERS", 8)
+    assert pool_size() == (3, 3)
+
+    # A budget bigger than every worker's max size doesn't raise it
+    monkeypatch.setattr(app_config, "WEB_WORKERS", 2)
+    assert pool_size() == (4, 10)
+
+    # Every worker gets at least one connection
+    monkeypatch.setattr(app_config, "WEB_WORKERS", 32)
+    assert pool_size() == (1, 1)
+
+
+def test_pool_stats(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "DB_POOL_MIN_SIZE", 2)
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        assert client.get("character/1").status_code == HTTP_200_OK
+
+        response = client.get("admin/pool-stats")
+        assert response.status_code == HTTP_200_OK
+        [primary] = response.json()
+        assert primary["name"] == "primary"
+        assert primary["poolMin"] == 2
+        assert primary["poolSize"] >= 2
+        assert primary["acquireCount"] >= 1
+
+
+async def _prepared_statements(pool: AsyncConnectionPool) -> list[str]:
+    async with pool.connection() as conn:
+        res = await (await conn.execute("SELECT statement FROM pg_prepared_statements")).fetchall()
+        return [row[0] for row in res if "pg_prepared_statements" not in row[0]]
+
+
+def test_warm_pool_prepares_hot_statements(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "DB_POOL_MIN_SIZE", 2)
+    with TestClient(app=app) as client:
+
+        # The pool belongs to the app's event loop, so query it from there
+        statements = client.blocking_portal.call(_prepared_statements, client.app.state.pool)
+        assert [statement for statement in statements if "UPDATE operational.character_hitpoints" in statement]
+
+
+async def test_read_only_pool_prepares_read_statements(monkeypatch: pytest.MonkeyPatch, db: AsyncCursor):
+    # A hot standby rejects writes like this session does
+    monkeypatch.setattr(app_config, "DB_POOL_WARMUP_TIMEOUT_SECONDS", 5)
+    conn_str = f"{get_conn_info().to_conn_str()} options='-c default_transaction_read_only=on'"
+    async with open_pool(create_pool(conn_str, name="read-only", read_only=True)) as pool:
+        await warm_pool(pool, read_only=True)
+        statements = await _prepared_statements(pool)
+        assert statements
+        assert not [statement for statement in statements if "UPDATE" in statement]
+
+
+async def test_lazy_connection(db: AsyncCursor):
+    async with AsyncConnectionPool(get_conn_info().to_conn_str(), min_size=1, max_size=1) as pool:
+        async with LazyConnection(pool.connection) as conn:
+            character_repo = CharacterRepo(conn.cursor(row_factory=dict_row_camel))
+            assert not conn.checked_out
+
+            # The first query checks the pool's only connection out, and committing gives it back
+            assert (await character_repo.get_character(1)).name == "Briv"
+            assert conn.checked_out
+            assert pool.get_stats()["pool_available"] == 0
+
+            await conn.commit()
+            assert not conn.checked_out
+            assert pool.get_stats()["pool_available"] == 1
+
+            # Querying again checks a connection out for a new transaction
+            assert (await character_repo.get_character(1)).name == "Briv"
+            assert conn.checked_out
+
+        assert pool.get_stats()["pool_available"] == 1
+
+
+async def test_lazy_connection_rolls_back_on_error(db: AsyncCursor):
+    async with AsyncConnectionPool(get_conn_info().to_conn_str(), min_size=1, max_size=1) as pool:
+        with pytest.raises(RuntimeError):
+            async with LazyConnection(pool.connection) as conn:
+                await conn.execute("UPDATE operational.character SET name = 'Not Briv' WHERE id = 1")
+                raise RuntimeError()
+
+    res = await (await db.execute("SELECT name FROM operational.character WHERE id = 1")).fetchone()
+    assert res == {"name": "Briv"}
+
+
+def test_invalid_request_does_not_acquire():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+
+        def acquire_count() -> int:
+            [primary] = client.get("admin/pool-stats").json()
+            return primary["acquireCount"]
+
+        before = acquire_count()
+        response = client.put("character/1/hit-points/damage", json={"amount": "lots", "damageType": "cold"})
+        assert response.status_code == HTTP_400_BAD_REQUEST
+        assert acquire_count() == before
@@ -0,0 +1,106 @@
+import asyncio
+import sys
+import time
+
+import pytest
+from litestar.status_codes import HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_403_FORBIDDEN
+from litestar.testing import TestClient
+
+from src.common import app_config
+from src.common.profiling import PROFILE_TOKEN_HEADER, RequestProfiler, collapse_stack
+from src.main import app
+
+
+@pytest.fixture
+def profiling_test_client(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(app_config, "PROFILING_TOKEN", "secret")
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def _roll_dice():
+    return collapse_stack(sys._getframe())
+
+
+def _busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_collapse_stack():
+    stack = _roll_dice().split(";")
+    assert stack[-1] == "tests.test_profiling:_roll_dice"
+    assert stack[-2] == "tests.test_profiling:test_collapse_stack"
+
+
+async def test_profile_samples_only_profiled_task():
+    profiler = RequestProfiler(interval=0.001)
+
+    async def profiled():
+        with profiler.profile():
+            _busy(0.05)
+
+    try:
+        await asyncio.create_task(profiled())
+        # Work outside of a profiled task isn't sampled
+        samples = profiler.samples
+        _busy(0.02)
+        assert profiler.samples == samples
+    finally:
+        profiler.stop()
+
+    assert profiler.profiled_requests == 1
+    assert profiler.samples > 0
+    assert "tests.test_profiling:_busy" in profiler.collapsed_stacks()
+
+
+async def test_profile_truncates_stacks():
+    profiler = RequestProfiler(interval=0.001, max_stacks=1)
+
+    async def profiled():
+        with profiler.profile():
+            _busy(0.02)
+            await asyncio.sleep(0)
+            _roll_dice_busy()
+
+    def _roll_dice_busy():
+        _busy(0.02)
+
+    try:
+        await asyncio.create_task(profiled())
+    finally:
+        profiler.stop()
+
+    assert "[truncated]" in profiler.collapsed_stacks()
+
+
+def test_profiling_disabled():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        response = client.put("admin/profiling", json={"sampleRate": 1})
+        assert response.status_code == HTTP_403_FORBIDDEN
+
+
+def test_profiling_admin(profiling_test_client: TestClient):
+    client = profiling_test_client
+    response = client.put("admin/profiling", json={"sampleRate": 1})
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["sampleRate"] == 1
+
+    client.get("character/1")
+    client.put("admin/profiling", json={"sampleRate": 0})
+    client.get("character/1", headers={PROFILE_TOKEN_HEADER: "wrong"})
+    client.get("character/1", headers={PROFILE_TOKEN_HEADER: "secret"})
+
+    # The GET and PUT sent while the sample rate was 1 and the GET with the right token were profiled
+    status = client.get("admin/profiling").json()
+    assert status["profiledRequests"] == 3
+
+    response = client.get("admin/profiling/stacks")
+    assert response.status_code == HTTP_200_OK
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert response.headers["Content-Disposition"] == 'attachment; filename="stacks.collapsed"'
+
+    assert client.delete("admin/profiling/stacks").status_code == HTTP_204_NO_CONTENT
+    assert client.get("admin/profiling").json()["profiledRequests"] == 0
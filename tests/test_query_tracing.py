@@ -0,0 +1,71 @@
+import msgspec
+import pytest
+from litestar.status_codes import HTTP_200_OK
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.character_service import CharacterService
+from src.character.models import DamageType, Item, ItemModifier
+from src.common import app_config
+from src.common.db import load_test_character
+from src.common.query_tracing import QueryTracer, TracingCursor, params_shape
+from src.main import app
+
+
+@pytest.fixture
+def tracer():
+    return QueryTracer()
+
+
+@pytest.fixture
+def traced_character_repo(db: AsyncCursor, tracer: QueryTracer):
+    return CharacterRepo(TracingCursor(db, tracer))
+
+
+def test_params_shape():
+    assert params_shape({"id": 1, "ids": [1, 2], "name": None}) == "{id: int, ids: list[2], name: none}"
+
+
+async def test_get_character_query_budget(traced_character_repo: CharacterRepo, tracer: QueryTracer):
+    await traced_character_repo.get_character(1)
+
+    # One query for the character and one per related table. Fail if loading a character starts issuing more.
+    assert len(tracer.queries) == 5
+    assert tracer.repeated_statements() == []
+    assert tracer.queries[0].params_shape == "{id: int}"
+    assert tracer.queries[0].row_count == 1
+
+
+async def test_deal_damage_query_budget(traced_character_repo: CharacterRepo, tracer: QueryTracer):
+    await CharacterService(traced_character_repo).deal_damage(1, 5, DamageType.COLD)
+
+    # The lock, the hit points and defense masks, the update, and the updated character. Defenses aren't loaded
+    # until the updated character is.
+    statements = [query.statement for query in tracer.queries]
+    assert len(statements) == 8
+    assert sum("character_defense" in statement for statement in statements) == 1
+
+
+async def test_insert_character_items_flagged(traced_character_repo: CharacterRepo, tracer: QueryTracer):
+    briv = load_test_character()
+    item = Item(name="Ring", modifier=ItemModifier(affected_object="stats", affected_value="strength", value=1))
+    await traced_character_repo.insert_character(msgspec.structs.replace(briv, items=[item] * 3))
+
+    # Items are inserted one at a time, two statements per item
+    repeated = tracer.repeated_statements()
+    assert [r.count for r in repeated] == [3, 3]
+    assert repeated[0].statement.startswith("INSERT INTO operational.character_item ")
+
+
+def test_server_timing(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "QUERY_TRACING_ENABLED", True)
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        response = client.get("character/1")
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["Server-Timing"].endswith('desc="5 queries"')
+
+        [report, *_] = client.get("admin/query-reports").json()
+        assert report["path"] == "/api/v1/character/1"
+        assert report["queryCount"] == 5
+        assert report["likelyNPlusOne"] == []
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+
+import psycopg
+import pytest
+from litestar.status_codes import HTTP_200_OK
+from litestar.testing import TestClient
+from psycopg_pool import AsyncConnectionPool
+
+from src.character.character_repo import CharacterRepo
+from src.character.party_repo import PartyRepo
+from src.character.party_rollups import check_rollups
+from src.character.rebalance_shards import rebalance_shards
+from src.character.sharded_character_repo import ShardedCharacterRepo
+from src.common import app_config
+from src.common.db import get_conn_info, get_shard_conn_infos, load_test_character, migrate_db, teardown_db
+from src.common.sharding import ShardMap, ShardRouter, load_shard_map
+from src.common.utils import dict_row_camel
+from src.main import app
+
+SHARD_DATABASE = "postgres_shard_1"
+
+
+@pytest.fixture
+def second_shard(monkeypatch: pytest.MonkeyPatch):
+    # Use a second database on the same server as shard 1
+    with psycopg.connect(get_conn_info().to_conn_str(), autocommit=True) as conn:
+        conn.execute(f"DROP DATABASE IF EXISTS {SHARD_DATABASE}")
+        conn.execute(f"CREATE DATABASE {SHARD_DATABASE}")
+
+    monkeypatch.setattr(app_config, "DB_EXTRA_SHARDS", [f"{app_config.DB_HOST}:{app_config.DB_PORT}/{SHARD_DATABASE}"])
+    yield
+
+    with psycopg.connect(get_conn_info().to_conn_str(), autocommit=True) as conn:
+        conn.execute(f"DROP DATABASE IF EXISTS {SHARD_DATABASE} WITH (FORCE)")
+
+
+@pytest.fixture
+def sharded_test_client(second_shard: None):
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        yield client
+
+
+def test_shard_map_default():
+    shard_map = ShardMap.default(shard_count=3, bucket_count=8)
+    assert shard_map.assignments == (0, 1, 2, 0, 1, 2, 0, 1)
+    assert shard_map.shard_for(1) == 1
+    assert shard_map.shard_for(9) == 1
+    assert shard_map.shard_for(11) == 0
+
+
+def test_shard_conn_infos(second_shard: None):
+    primary, shard = get_shard_conn_infos()
+    assert primary == get_conn_info()
+    assert (shard.host, shard.port, shard.database) == (app_config.DB_HOST, app_config.DB_PORT, SHARD_DATABASE)
+
+
+def test_sharded_requests_route_to_owning_shard(sharded_test_client: TestClient):
+    # With two shards the default map puts odd ids on shard 1, so Briv (id 1) lives in the second database
+    with psycopg.connect(get_shard_conn_infos()[1].to_conn_str()) as conn:
+        assert conn.execute("SELECT name FROM operational.character WHERE id = 1").fetchone() == ("Briv",)
+
+    response = sharded_test_client.put("character/1/hit-points/damage", json={"amount": 5, "damageType": "cold"})
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["hitPoints"]["currentHitPoints"] == 20
+
+    response = sharded_test_client.get("character", params={"limit": 10})
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == [
+        {
+            "id": 1,
+            "name": "Briv",
+            "level": 5,
+            "hitPoints": {"hitPointMax": 25, "currentHitPoints": 20, "temporaryHitPoints": None},
+        }
+    ]
+
+    response = sharded_test_client.get("character/search", params={"immuneTo": "fire"})
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["characterIds"] == [1]
+
+
+async def test_rebalance_moves_buckets(second_shard: None, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(app_config, "SHARD_BUCKET_COUNT", 8)
+    await teardown_db()
+    await migrate_db()
+
+    primary_info, shard_info = get_shard_conn_infos()
+    async with (
+        AsyncConnectionPool(primary_info.to_conn_str()) as primary,
+        AsyncConnectionPool(shard_info.to_conn_str()) as shard,
+    ):
+        # Start with every bucket on the primary, as if the second shard was just added
+        async with primary.connection() as conn:
+            await conn.execute("INSERT INTO operational.shard_map SELECT generate_series(0, 7), 0")
+            shards = ShardRouter([primary, shard], await load_shard_map(conn, 2))
+
+        repo = ShardedCharacterRepo(shards)
+        character_ids = [await repo.insert_character(load_test_character()) for _ in range(5)]
+        assert character_ids == [1, 2, 3, 4, 5]
+        parties = PartyRepo(shards)
+        party = await parties.create_party("The Company")
+        await parties.add_members(party.id, character_ids[:4])
+        expire_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        async with primary.connection() as conn:
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                await CharacterRepo(cur).set_temporary_hit_points_expiry(3, expire_at)
+
+        moves = await rebalance_shards(shards, ShardMap.default(2, bucket_count=8))
+        assert moves == {1: (0, 1), 3: (0, 1), 5: (0, 1), 7: (0, 1)}
+
+        async with primary.connection() as conn:
+            assert await load_shard_map(conn, 2) == ShardMap.default(2, bucket_count=8)
+            res = await (await conn.execute("SELECT id FROM operational.character ORDER BY id")).fetchall()
+            assert [r[0] for r in res] == [2, 4]
+
+        async with shard.connection() as conn:
+            res = await (await conn.execute("SELECT id FROM operational.character ORDER BY id")).fetchall()
+            assert [r[0] for r in res] == [1, 3, 5]
+            # Pending expiries move with their characters
+            async with conn.cursor(row_factory=dict_row_camel) as cur:
+                assert await CharacterRepo(cur).list_temporary_hit_points_expiries() == [(3, expire_at)]
+
+        # Every character is still reachable, with all of its data
+        exported = [(character_id, character) async for character_id, character in repo.export_characters(2)]
+        assert exported == [(character_id, load_test_character()) for character_id in character_ids]
+
+        # Moved party members keep their party, and their hit points move between the shards' rollups
+        rollup = await parties.get_rollup(party.id)
+        assert (rollup.member_count, rollup.hit_point_max) == (4, 100)
+        for pool in (primary, shard):
+            async with pool.connection() as conn:
+                assert await check_rollups(conn) == []
+
+    await teardown_db()
@@ -0,0 +1,85 @@
+import gzip
+from pathlib import Path
+
+import msgspec
+import pytest
+from psycopg import AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.models import CharacterHitpoints
+from src.common.db import get_shard_conn_infos, load_test_character
+from src.common.snapshot import SnapshotException, restore_snapshot, save_snapshot
+
+
+async def _rows(db: AsyncCursor, table: str) -> list[dict]:
+    res = await (await db.execute(f"SELECT * FROM operational.{table} ORDER BY 1")).fetchall()
+    await db.connection.commit()
+    return res
+
+
+async def test_snapshot_and_restore(db: AsyncCursor, character_repo: CharacterRepo, tmp_path: Path):
+    character_ids = [1] + [await character_repo.insert_character(load_test_character()) for _ in range(3)]
+    await db.connection.commit()
+    tables = ["character", "character_item_modifier", "character_document", "shard_map"]
+    before = {table: await _rows(db, table) for table in tables}
+
+    stats = await save_snapshot(get_shard_conn_infos(), tmp_path / "all.snapshot")
+    assert stats.tables > len(tables) and stats.bytes > 0
+
+    await character_repo.update_hitpoints(1, CharacterHitpoints(hit_point_max=25, current_hit_points=1))
+    await character_repo.delete_characters(character_ids[2:])
+    await db.connection.commit()
+
+    await restore_snapshot(get_shard_conn_infos(), tmp_path / "all.snapshot")
+    assert {table: await _rows(db, table) for table in tables} == before
+    assert (await character_repo.get_character(1)).hit_points.current_hit_points == 25
+
+    # New rows carry on from the restored ids, and triggers are back on
+    character_id = await character_repo.insert_character(load_test_character())
+    assert character_id == character_ids[-1] + 1
+    await db.connection.commit()
+    assert (await _rows(db, "character_document"))[-1]["characterId"] == character_id
+
+
+async def test_snapshot_of_some_characters(db: AsyncCursor, character_repo: CharacterRepo, tmp_path: Path):
+    character_ids = [await character_repo.insert_character(load_test_character()) for _ in range(3)]
+    await character_repo.set_party(character_ids, 1)
+    await db.connection.commit()
+
+    await save_snapshot(get_shard_conn_infos(), tmp_path / "party.snapshot", character_ids=character_ids[:2])
+    await restore_snapshot(get_shard_conn_infos(), tmp_path / "party.snapshot")
+
+    assert [row["id"] for row in await _rows(db, "character")] == character_ids[:2]
+    characters = await character_repo.get_characters(character_ids)
+    assert characters == {character_id: load_test_character() for character_id in character_ids[:2]}
+    assert len(await _rows(db, "shard_map")) > 0
+    # The party's rollup only counts the characters that were restored
+    assert [(row["partyId"], row["memberCount"]) for row in await _rows(db, "party_rollup")] == [(1, 2)]
+
+
+async def test_restore_needs_matching_migrations(db: AsyncCursor, tmp_path: Path):
+    await save_snapshot(get_shard_conn_infos(), tmp_path / "all.snapshot")
+    await db.execute(
+        "DELETE FROM operational.schema_version WHERE version = (SELECT max(version) FROM operational.schema_version)"
+    )
+    await db.connection.commit()
+
+    with pytest.raises(SnapshotException, match="Migrate both to the same version first"):
+        await restore_snapshot(get_shard_conn_infos(), tmp_path / "all.snapshot")
+    # Nothing was restored
+    assert [row["name"] for row in await _rows(db, "character")] == ["Briv"]
+
+
+async def test_restore_rejects_other_files(tmp_path: Path):
+    path = tmp_path / "other.snapshot"
+    with gzip.open(path, "wb") as out:
+        manifest = {
+            "format": "other",
+            "formatVersion": 1,
+            "createdAt": "2024-01-01T00:00:00Z",
+            "migrations": {},
+            "shards": 1,
+        }
+        out.write(msgspec.json.encode(manifest) + b"\n")
+    with pytest.raises(SnapshotException, match="Unsupported snapshot format"):
+        await restore_snapshot(get_shard_conn_infos(), path)
@@ -0,0 +1,46 @@
+from collections import Counter
+
+import msgspec
+from psycopg import AsyncCursor
+
+from benchmarks.synthetic_characters import generate_character, generate_characters, load_characters
+from src.character.character_repo import CharacterRepo
+from src.character.models import Character
+
+
+def _unordered(character: Character) -> tuple[object, ...]:
+    # The repo doesn't order a character's classes, items or defenses
+    return (
+        msgspec.structs.replace(character, classes=[], items=[], defenses=[]),
+        Counter(character.classes),
+        Counter(character.items),
+        Counter(character.defenses),
+    )
+
+
+def test_generate_character_is_deterministic():
+    assert list(generate_characters(seed=7, start=0, stop=50)) == list(generate_characters(seed=7, start=0, stop=50))
+    assert generate_character(seed=7, index=42) == list(generate_characters(seed=7, start=40, stop=43))[2]
+    assert generate_character(seed=7, index=42) != generate_character(seed=8, index=42)
+
+
+def test_generate_character_is_consistent():
+    for character in generate_characters(seed=0, start=0, stop=500):
+        assert 1 <= character.level <= 20
+        assert sum(c.class_level for c in character.classes) == character.level
+        assert len({c.name for c in character.classes}) == len(character.classes)
+        assert 0 <= character.hit_points.current_hit_points <= character.hit_points.hit_point_max
+        assert len({d.damage_type for d in character.defenses}) == len(character.defenses)
+
+
+async def test_load_characters(db: AsyncCursor, character_repo: CharacterRepo):
+    rows = await load_characters(db.connection, seed=3, start=0, stop=25, batch_size=10)
+    assert rows > 25 * 8
+
+    # Briv already has id 1, so the synthetic characters follow it
+    for index, character_id in enumerate(range(2, 27)):
+        loaded = await character_repo.get_character(character_id)
+        assert _unordered(loaded) == _unordered(generate_character(seed=3, index=index))
+
+    # Sequences were moved past the loaded ids
+    assert await character_repo.insert_character(generate_character(seed=3, index=25)) == 27
@@ -0,0 +1,127 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from litestar.status_codes import HTTP_200_OK
+from litestar.testing import TestClient
+from psycopg import AsyncCursor
+
+from src.character.character_repo import CharacterRepo
+from src.character.character_service import CharacterService
+from src.character.temporary_hit_points import TemporaryHitPointsExpiry
+from src.common.db import load_test_character
+from src.common.sharding import ShardRouter
+from src.common.timer_wheel import TimerWheel
+from src.main import app
+
+
+def test_timer_wheel_fires_each_timer_once_in_order():
+    wheel: TimerWheel[str] = TimerWheel(tick=1.0, now=0, slots=4, levels=3)
+    for key, deadline in {"a": 2.5, "b": 0.2, "c": 17, "d": 70, "e": 5}.items():
+        wheel.schedule(key, deadline)
+    assert wheel.cancel("e")
+    assert not wheel.cancel("e")
+    # Scheduling a key again replaces its timer
+    wheel.schedule("a", 9)
+
+    assert wheel.advance(1) == ["b"]
+    assert wheel.advance(8.9) == []
+    assert wheel.advance(9) == ["a"]
+    assert wheel.advance(69) == ["c"]
+    assert len(wheel) == 1 and "d" in wheel
+    assert wheel.advance(1000) == ["d"]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_holds_deadlines_beyond_its_range():
+    wheel: TimerWheel[int] = TimerWheel(tick=1.0, now=0, slots=4, levels=2)
+    wheel.schedule(1, 100)
+    assert wheel.advance(99) == []
+    assert wheel.advance(100) == [1]
+
+
+def test_timer_wheel_with_many_timers():
+    wheel: TimerWheel[int] = TimerWheel(tick=1.0, now=0)
+    for character_id in range(360_000):
+        wheel.schedule(character_id, character_id % 3600 + 0.5)
+    assert len(wheel) == 360_000
+
+    fired = wheel.advance(1800)
+    assert len(fired) == 180_000
+    assert set(fired) == {character_id for character_id in range(360_000) if character_id % 3600 < 1800}
+    assert len(wheel.advance(3600)) == 180_000
+
+
+async def _hit_points(db: AsyncCursor, character_id: int):
+    res = await (
+        await db.execute(
+            """
+            SELECT temporary_hit_points, temporary_hit_points_expire_at
+            FROM operational.character_hitpoints
+            WHERE character_id = %(id)s
+            """,
+            {"id": character_id},
+        )
+    ).fetchone()
+    await db.connection.commit()
+    return res
+
+
+async def test_expiry_is_stored_and_restored(db: AsyncCursor, character_repo: CharacterRepo, shards: ShardRouter):
+    service = CharacterService(character_storage=character_repo, temporary_hit_points_expiry=TemporaryHitPointsExpiry())
+    await service.assign_temporary_hit_points(character_id=1, amount=5, duration=timedelta(minutes=1))
+    await db.connection.commit()
+    assert 1 in service.temporary_hit_points_expiry.wheel  # type: ignore[union-attr]
+
+    hit_points = await _hit_points(db, 1)
+    assert hit_points["temporaryHitPoints"] == 5
+    assert hit_points["temporaryHitPointsExpireAt"] > datetime.now(timezone.utc)
+
+    # A restarted worker picks the expiry back up
+    expiry = TemporaryHitPointsExpiry()
+    assert await expiry.restore(shards) == 1
+    assert 1 in expiry.wheel
+
+    # Reassigning without a duration clears it
+    await service.assign_temporary_hit_points(character_id=1, amount=8)
+    await db.connection.commit()
+    assert await _hit_points(db, 1) == {"temporaryHitPoints": 8, "temporaryHitPointsExpireAt": None}
+
+
+async def test_expire_clears_due_characters_together(
+    db: AsyncCursor, character_repo: CharacterRepo, shards: ShardRouter
+):
+    character_ids = [1] + [await character_repo.insert_character(load_test_character()) for _ in range(3)]
+    service = CharacterService(character_storage=character_repo)
+    for character_id in character_ids:
+        await service.assign_temporary_hit_points(character_id=character_id, amount=5, duration=timedelta(seconds=1))
+    # The last character's temporary hit points were extended, so its earlier timer does nothing
+    await character_repo.set_temporary_hit_points_expiry(
+        character_ids[-1], datetime.now(timezone.utc) + timedelta(hours=1)
+    )
+    await db.connection.commit()
+
+    expiry = TemporaryHitPointsExpiry()
+    await expiry.start(shards)
+    # Expire by hand rather than waiting for the scheduler's ticks
+    await expiry.stop()
+    assert len(expiry.wheel) == 4
+    assert await expiry.expire(character_ids) == []
+
+    time.sleep(1)
+    assert sorted(await expiry.expire(character_ids)) == character_ids[:-1]
+
+    for character_id in character_ids[:-1]:
+        assert await _hit_points(db, character_id) == {"temporaryHitPoints": None, "temporaryHitPointsExpireAt": None}
+    assert (await _hit_points(db, character_ids[-1]))["temporaryHitPoints"] == 5
+
+
+def test_temporary_hit_points_expire():
+    with TestClient(app=app, base_url="http://testserver.local/api/v1/") as client:
+        res = client.put("character/1/hit-points/temporary", json={"amount": 5, "durationSeconds": 1})
+        assert res.status_code == HTTP_200_OK
+        assert res.json()["hitPoints"]["temporaryHitPoints"] == 5
+
+        deadline = time.monotonic() + 5
+        while client.get("character/1").json()["hitPoints"]["temporaryHitPoints"] is not None:
+            assert time.monotonic() < deadline, "Temporary hit points never expired"
+            time.sleep(0.1)